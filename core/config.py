@@ -1,10 +1,74 @@
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 from pydantic_settings import SettingsConfigDict
 
 
 class Settings(BaseSettings):
-    
+
     PROJETO_TAES_OPENAI_API_KEY: str = ""
+
+    # LLM backend: "openai" (OpenAI API) or "local" (core.local_llm_server stand-in)
+    LLM_BACKEND: str = "openai"
+    LLM_MODEL: str = "gpt-5-nano"
+    LLM_BASE_URL: Optional[str] = None  # Overrides the backend's default endpoint
+
+    # Local stand-in server (core.local_llm_server)
+    LOCAL_LLM_LATENCY_DISTRIBUTION: str = "lognormal"  # fixed | uniform | exponential | lognormal
+    LOCAL_LLM_LATENCY_MEAN_MS: float = 800.0
+    LOCAL_LLM_LATENCY_SPREAD: float = 0.5  # Uniform half-width ratio / lognormal sigma
+    LOCAL_LLM_ERROR_RATE: float = 0.0  # Fraction of requests answered with HTTP 500
+    LOCAL_LLM_RATE_LIMIT_RATE: float = 0.0  # Fraction of requests answered with HTTP 429
+    LOCAL_LLM_STREAM_CHUNK_MS: float = 15.0  # Delay between streamed chunks (after the first)
+    LOCAL_LLM_SEED: int = 0
+    LOCAL_LLM_RESPONSES_FILE: Optional[str] = None  # JSON {question: sql} with canned answers
+
+    # LLM gateway (core.llm_gateway): deadlines, retries, circuit breaker and hedged requests
+    LLM_DEADLINE_SECONDS: float = 120.0  # Whole call, retries included
+    LLM_ATTEMPT_TIMEOUT_SECONDS: float = 60.0  # Single attempt
+    LLM_MAX_RETRIES: int = 3  # Extra attempts after timeouts, connection errors and 5xx
+    LLM_RETRY_BASE_DELAY_SECONDS: float = 0.5
+    LLM_RETRY_MAX_DELAY_SECONDS: float = 8.0
+    LLM_RATE_LIMIT_MAX_RETRIES: int = 8  # Extra attempts after 429s, counted separately
+    LLM_RATE_LIMIT_MAX_DELAY_SECONDS: float = 60.0  # Backoff cap for 429s without Retry-After (a provider RPM window)
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5  # Consecutive failures that open the circuit
+    LLM_CIRCUIT_RESET_SECONDS: float = 30.0  # Open time before a probe call is let through
+    LLM_HEDGE_ENABLED: bool = True
+    LLM_HEDGE_QUANTILE: float = 0.95  # Latency quantile after which a second request is fired
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # Latencies observed per stage before hedging starts
+    LLM_HEDGE_MAX_THREADS: int = 32  # Threads for hedged blocking calls; hedging pauses while all are busy
+    LLM_LATENCY_WINDOW: int = 500  # Recent latencies per stage kept for the quantiles
+
+    # LLM response cache (SQLite, shared between workers)
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_PATH: str = ".cache/llm_cache.sqlite"
+    LLM_CACHE_TTL_SECONDS: Optional[float] = None
+    LLM_CACHE_MAX_ENTRIES: Optional[int] = 100_000
+    LLM_CACHE_TOUCH_INTERVAL_SECONDS: float = 60.0  # A hit rewrites last_access (LRU) only when it is older than this
+    LLM_CACHE_API_DEFAULT: bool = False  # use_cache for API requests that omit it (experiments replay by default)
+
+    # Parsed schema file cache (core.schema_cache)
+    SCHEMA_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # Total size of cached files
+    SCHEMA_CACHE_WATCH: bool = False  # Invalidate on filesystem events (needs `watchfiles`)
+
+    # Schema linking (core.schema_linking): prune prompts to the relevant tables
+    SCHEMA_LINKING_ENABLED: bool = True
+    SCHEMA_LINKING_MIN_TABLES: int = 20  # Smaller schemas are sent whole
+    SCHEMA_LINKING_TOP_TABLES: int = 8  # Best-ranked tables kept, before the foreign-key closure
+    SCHEMA_LINKING_MAX_COLUMNS: int = 24  # Wider tables keep only keys and best-ranked columns
+    SCHEMA_LINKING_INDEX_CACHE_SIZE: int = 128  # Schema indexes kept in memory
+
+    # Speculative generation (rewrite_mode="speculative")
+    SPECULATIVE_SIMILARITY_THRESHOLD: float = 0.9  # Rewrite at least this similar reuses the speculative SQL
+
+    # Rewrite-bypass gate (rewrite_mode="gate")
+    REWRITE_GATE_THRESHOLD: float = 0.8  # Question terms covered by schema/values above which rewriting is skipped
+
+    # Near-duplicate question cache (core.question_cache), used by the API endpoints
+    QUESTION_CACHE_ENABLED: bool = False  # Opt-in: a false match serves another question's SQL
+    QUESTION_CACHE_THRESHOLD: float = 0.9  # Character-trigram Jaccard similarity needed to reuse an answer
+    QUESTION_CACHE_MAX_ENTRIES: int = 10_000  # Questions kept across all schemas (LRU)
+
     model_config = SettingsConfigDict(env_file=".env")
 
 settings = Settings()
@@ -6,6 +6,11 @@ import re
 from pathlib import Path
 from loguru import logger
 
+from core.schema_cache import schema_file_cache
+
+# Namespace for this loader's entries in the schema file cache
+SCHEMA_FILE_CACHE_NAMESPACE = "schema_dict"
+
 
 def parse_sql_schema(sql_statements: str) -> dict:
     """
@@ -71,10 +76,30 @@ def parse_sql_schema(sql_statements: str) -> dict:
     return schema
 
 
+def _read_schema_file(file_path: Path) -> dict:
+    if file_path.suffix.lower() == '.json':
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    elif file_path.suffix.lower() in ['.yaml', '.yml']:
+        import yaml
+        with open(file_path, 'r') as f:
+            return yaml.safe_load(f)
+    elif file_path.suffix.lower() == '.sql':
+        with open(file_path, 'r') as f:
+            sql_content = f.read()
+        return parse_sql_schema(sql_content)
+    else:
+        raise ValueError(f"Unsupported file format: {file_path.suffix}")
+
+
 def load_schema_from_file(file_path: str) -> dict:
     """
     Load database schema from a JSON, YAML, or SQL file.
     
+    Parsed schemas are kept in the process-wide schema file cache until the
+    file's mtime or size changes; the returned dictionary is shared and must
+    not be mutated.
+    
     Args:
         file_path: Path to the schema file (JSON, YAML, or SQL)
     
@@ -89,19 +114,7 @@ def load_schema_from_file(file_path: str) -> dict:
         raise FileNotFoundError(f"Schema file not found: {file_path}")
     
     try:
-        if file_path.suffix.lower() == '.json':
-            with open(file_path, 'r') as f:
-                schema = json.load(f)
-        elif file_path.suffix.lower() in ['.yaml', '.yml']:
-            import yaml
-            with open(file_path, 'r') as f:
-                schema = yaml.safe_load(f)
-        elif file_path.suffix.lower() == '.sql':
-            with open(file_path, 'r') as f:
-                sql_content = f.read()
-            schema = parse_sql_schema(sql_content)
-        else:
-            raise ValueError(f"Unsupported file format: {file_path.suffix}")
+        schema = schema_file_cache.load(file_path, SCHEMA_FILE_CACHE_NAMESPACE, _read_schema_file)
         
         logger.info("Schema loaded successfully")
         return schema
@@ -0,0 +1,253 @@
+"""
+Chat-completion helpers shared by the rewriting and SQL generation modules.
+
+Every LLM call goes through create_completion / acreate_completion /
+astream_completion, which consult the persistent response cache before
+hitting the API. Requests that reach the API run through the LLM gateway
+(core.llm_gateway: deadlines, retries, circuit breaker, hedging); the SDK's
+own retries are disabled so the gateway is the single retry policy. The
+client and model come from the backend selected in Settings (LLM_BACKEND),
+so the pipeline can run against the OpenAI API or the local stand-in server
+(core.local_llm_server) without code changes.
+"""
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import AsyncIterator, Optional
+
+import anyio
+from openai import AsyncOpenAI, OpenAI
+
+from core.config import settings
+from core.llm_cache import get_llm_cache, make_cache_key
+from core.llm_gateway import CALL_FIRST_CHUNK, get_gateway
+from core.telemetry import record_llm_call
+
+# Backend name -> (default base URL, API key)
+LOCAL_BACKEND_URL = "http://127.0.0.1:8001/v1"
+_BACKENDS = {
+    "openai": lambda: (None, settings.PROJETO_TAES_OPENAI_API_KEY),
+    "local": lambda: (LOCAL_BACKEND_URL, "local"),
+}
+
+
+def _backend_config() -> tuple[Optional[str], str]:
+    backend = settings.LLM_BACKEND.lower()
+    if backend not in _BACKENDS:
+        raise ValueError(f"Unsupported LLM backend: {settings.LLM_BACKEND} (expected one of {sorted(_BACKENDS)})")
+    base_url, api_key = _BACKENDS[backend]()
+    return settings.LLM_BASE_URL or base_url, api_key
+
+
+@lru_cache(maxsize=1)
+def get_client() -> OpenAI:
+    """Return the process-wide synchronous client for the configured backend."""
+    base_url, api_key = _backend_config()
+    return OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+
+@lru_cache(maxsize=1)
+def get_async_client() -> AsyncOpenAI:
+    """Return the process-wide async client for the configured backend."""
+    base_url, api_key = _backend_config()
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+
+def get_model() -> str:
+    """Return the model name used for every completion."""
+    return settings.LLM_MODEL
+
+
+@dataclass
+class Completion:
+    """The parts of a chat completion the pipeline actually uses."""
+    content: str
+    finish_reason: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached: bool = False
+
+
+def _from_response(response) -> Completion:
+    choice = response.choices[0]
+    usage = getattr(response, "usage", None)
+    return Completion(
+        content=choice.message.content or "",
+        finish_reason=choice.finish_reason,
+        prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+        completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+    )
+
+
+def _to_cache_value(completion: Completion) -> dict:
+    value = asdict(completion)
+    value.pop("cached")
+    return value
+
+
+def _cache_key(model: str, messages: list, max_completion_tokens: int) -> str:
+    # The endpoint is part of the key: the same model name served by the OpenAI
+    # API and by the local stand-in must not share cached answers
+    base_url, _ = _backend_config()
+    return make_cache_key(model, messages, backend=settings.LLM_BACKEND, base_url=base_url,
+                          max_completion_tokens=max_completion_tokens)
+
+
+def create_completion(messages: list, max_completion_tokens: int, use_cache: bool = True,
+                      stage: str = "llm") -> Completion:
+    """
+    Run a chat completion, served from the response cache when possible.
+
+    Args:
+        messages: Chat message list
+        max_completion_tokens: Completion token limit
+        use_cache: False bypasses the cache for this call (fresh sample)
+        stage: Pipeline stage label for the call/token metrics
+
+    Returns:
+        Completion with the response text and metadata
+    """
+    model = get_model()
+    cache = get_llm_cache() if use_cache else None
+    key = _cache_key(model, messages, max_completion_tokens)
+
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            record_llm_call(stage, cached=True)
+            return Completion(**cached, cached=True)
+
+    response = get_gateway().call(
+        lambda timeout: get_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            max_completion_tokens=max_completion_tokens,
+            timeout=timeout,
+        ),
+        stage=stage,
+    )
+    completion = _from_response(response)
+    record_llm_call(stage, False, completion.prompt_tokens, completion.completion_tokens)
+
+    # Fresh samples are still stored, so a later replay can reuse them
+    cache = get_llm_cache()
+    if cache is not None and completion.content:
+        cache.set(key, _to_cache_value(completion))
+    return completion
+
+
+async def acreate_completion(messages: list, max_completion_tokens: int, use_cache: bool = True,
+                             stage: str = "llm") -> Completion:
+    """
+    Async variant of create_completion using the AsyncOpenAI client.
+
+    Cache reads and writes run in a worker thread so SQLite never blocks the
+    event loop.
+    """
+    model = get_model()
+    cache = get_llm_cache() if use_cache else None
+    key = _cache_key(model, messages, max_completion_tokens)
+
+    if cache is not None:
+        cached = await anyio.to_thread.run_sync(cache.get, key)
+        if cached is not None:
+            record_llm_call(stage, cached=True)
+            return Completion(**cached, cached=True)
+
+    response = await get_gateway().acall(
+        lambda timeout: get_async_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            max_completion_tokens=max_completion_tokens,
+            timeout=timeout,
+        ),
+        stage=stage,
+    )
+    completion = _from_response(response)
+    record_llm_call(stage, False, completion.prompt_tokens, completion.completion_tokens)
+
+    cache = get_llm_cache()
+    if cache is not None and completion.content:
+        await anyio.to_thread.run_sync(cache.set, key, _to_cache_value(completion))
+    return completion
+
+
+async def astream_completion(messages: list, max_completion_tokens: int, use_cache: bool = True,
+                             stage: str = "llm") -> AsyncIterator[str]:
+    """
+    Stream a chat completion as text deltas.
+
+    A cache hit is yielded as a single delta; a streamed answer is stored in
+    the cache once complete, exactly like acreate_completion. The gateway
+    covers the stream until its first chunk (retries and hedging); a failure
+    after text has been yielded is raised to the caller.
+
+    Args:
+        messages: Chat message list
+        max_completion_tokens: Completion token limit
+        use_cache: False bypasses the cache for this call (fresh sample)
+        stage: Pipeline stage label for the call/token metrics
+
+    Yields:
+        Pieces of the response text as they arrive
+    """
+    model = get_model()
+    cache = get_llm_cache() if use_cache else None
+    key = _cache_key(model, messages, max_completion_tokens)
+
+    if cache is not None:
+        cached = await anyio.to_thread.run_sync(cache.get, key)
+        if cached is not None:
+            record_llm_call(stage, cached=True)
+            yield cached["content"]
+            return
+
+    async def open_stream(timeout: float):
+        # One attempt = opening the stream and receiving its first chunk
+        stream = await get_async_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            max_completion_tokens=max_completion_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=timeout,
+        )
+        try:
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except BaseException:
+            await stream.close()
+            raise
+        return stream, first
+
+    async def close_stream(opened):
+        await opened[0].close()
+
+    stream, first = await get_gateway().acall(open_stream, stage=stage, call=CALL_FIRST_CHUNK, discard=close_stream)
+
+    async def chunks():
+        if first is not None:
+            yield first
+            async for chunk in stream:
+                yield chunk
+
+    completion = Completion(content="")
+    parts = []
+    async for chunk in chunks():
+        if getattr(chunk, "usage", None):
+            completion.prompt_tokens = chunk.usage.prompt_tokens or 0
+            completion.completion_tokens = chunk.usage.completion_tokens or 0
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            completion.finish_reason = choice.finish_reason
+        if choice.delta and choice.delta.content:
+            parts.append(choice.delta.content)
+            yield choice.delta.content
+    completion.content = "".join(parts)
+    record_llm_call(stage, False, completion.prompt_tokens, completion.completion_tokens)
+
+    cache = get_llm_cache()
+    if cache is not None and completion.content:
+        await anyio.to_thread.run_sync(cache.set, key, _to_cache_value(completion))
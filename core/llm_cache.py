@@ -0,0 +1,222 @@
+"""
+Persistent, content-addressed cache for LLM completions.
+
+Entries are keyed by a hash of the model, the full message list and the
+request parameters, and stored in SQLite (WAL mode) so several uvicorn
+workers and experiment processes can share the same file.
+
+Lookups are read-mostly: an entry's last_access is only rewritten when it is
+older than LLM_CACHE_TOUCH_INTERVAL_SECONDS, so LRU order has that
+granularity. The size bound is enforced from a running row count per
+process, re-synced with COUNT(*) only when it crosses the limit; with
+several processes the table can briefly exceed max_entries by the entries
+the others inserted since their last sync.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+from core.config import settings
+
+
+def make_cache_key(model: str, messages: list, **params) -> str:
+    """
+    Build the content address of a completion request.
+
+    Args:
+        model: Model name
+        messages: Full chat message list
+        **params: Remaining request parameters (e.g. max_completion_tokens)
+
+    Returns:
+        Hex SHA-256 digest of the canonical JSON encoding of the request
+    """
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    SQLite-backed completion cache with optional TTL and LRU eviction.
+
+    Each thread gets its own connection; SQLite's WAL mode lets readers and
+    a writer from different processes work on the same file concurrently.
+    """
+
+    def __init__(self, path: str, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None,
+                 touch_interval_seconds: float = 60.0):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.touch_interval_seconds = touch_interval_seconds
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._rows_lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_last_access ON completions(last_access)")
+        conn.commit()
+        (self._rows,) = conn.execute("SELECT COUNT(*) FROM completions").fetchone()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _add_rows(self, delta: int):
+        with self._rows_lock:
+            self._rows = max(self._rows + delta, 0)
+
+    def _count(self, hit: bool):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Look up a cached completion.
+
+        Args:
+            key: Cache key from make_cache_key
+
+        Returns:
+            The stored completion dictionary, or None on a miss or expired entry
+        """
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, created_at, last_access FROM completions WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+
+        if row is None:
+            self._count(hit=False)
+            return None
+
+        value, created_at, last_access = row
+        if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+            deleted = conn.execute("DELETE FROM completions WHERE key = ?", (key,)).rowcount
+            conn.commit()
+            self._add_rows(-deleted)
+            self._count(hit=False)
+            return None
+
+        # Only a stale last_access takes the write lock; a hot entry is a pure read
+        if now - last_access > self.touch_interval_seconds:
+            conn.execute("UPDATE completions SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+        self._count(hit=True)
+        return json.loads(value)
+
+    def set(self, key: str, value: dict):
+        """
+        Store a completion and evict least-recently-used entries over the limit.
+
+        Args:
+            key: Cache key from make_cache_key
+            value: JSON-serializable completion dictionary
+        """
+        conn = self._connection()
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        inserted = conn.execute(
+            "INSERT OR IGNORE INTO completions (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, payload, now, now),
+        ).rowcount
+        if not inserted:
+            conn.execute(
+                "UPDATE completions SET value = ?, created_at = ?, last_access = ? WHERE key = ?",
+                (payload, now, now, key),
+            )
+        conn.commit()
+        self._add_rows(inserted)
+        if self.max_entries is not None and self._rows > self.max_entries:
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        # The running count only sees this process's inserts: re-sync before deleting, and
+        # free 1% headroom so the next inserts do not each trigger an eviction
+        (rows,) = conn.execute("SELECT COUNT(*) FROM completions").fetchone()
+        excess = rows - self.max_entries
+        if excess > 0:
+            excess += max(1, self.max_entries // 100)
+            conn.execute(
+                "DELETE FROM completions WHERE key IN ("
+                " SELECT key FROM completions ORDER BY last_access ASC LIMIT ?)",
+                (excess,),
+            )
+            conn.commit()
+            rows = max(rows - excess, 0)
+        with self._rows_lock:
+            self._rows = rows
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        conn = self._connection()
+        conn.execute("DELETE FROM completions")
+        conn.commit()
+        with self._rows_lock:
+            self._rows = 0
+
+    def stats(self) -> dict:
+        """Return hit/miss counters for this process and the number of stored entries."""
+        (entries,) = self._connection().execute("SELECT COUNT(*) FROM completions").fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": entries,
+        }
+
+
+_llm_cache: Optional[LLMCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """
+    Return the process-wide cache configured in Settings.
+
+    Returns:
+        The shared LLMCache, or None if caching is disabled
+    """
+    global _llm_cache
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                logger.info(f"Opening LLM cache at {settings.LLM_CACHE_PATH}")
+                _llm_cache = LLMCache(
+                    settings.LLM_CACHE_PATH,
+                    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+                    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+                    touch_interval_seconds=settings.LLM_CACHE_TOUCH_INTERVAL_SECONDS,
+                )
+    return _llm_cache
@@ -0,0 +1,526 @@
+"""
+Resilience layer around every LLM API request.
+
+core.llm hands each request to the process-wide LLMGateway as a callable
+that performs one attempt with a given timeout. The gateway adds:
+
+- a deadline for the whole call (LLM_DEADLINE_SECONDS) and a timeout for
+  each attempt (LLM_ATTEMPT_TIMEOUT_SECONDS);
+- retries of timeouts, connection errors and 5xx responses with
+  exponential backoff and full jitter;
+- retries of 429s on their own budget (LLM_RATE_LIMIT_MAX_RETRIES): the
+  wait is the response's Retry-After when present, otherwise the same
+  backoff capped at LLM_RATE_LIMIT_MAX_DELAY_SECONDS, long enough to sit
+  out a provider's per-minute window within the deadline;
+- a circuit breaker: after LLM_CIRCUIT_FAILURE_THRESHOLD consecutive
+  failures calls fail fast with CircuitOpenError for LLM_CIRCUIT_RESET_SECONDS,
+  then a single probe decides whether it closes again (429s do not count,
+  the service is up but throttling);
+- hedged requests: when an attempt has not answered after the observed p95
+  latency of its stage, a second identical request is fired and the first
+  answer wins. Streams are hedged on their first chunk.
+
+Latencies are kept per (stage, call) in a sliding window. When the hedge
+wins, the primary request is left running so its latency is still recorded
+as the "unhedged" sample; comparing the two windows gives the tail-latency
+improvement exported on /metrics. Blocking calls are hedged on a thread pool
+owned by the gateway (LLM_HEDGE_MAX_THREADS); a losing request cannot be
+interrupted and keeps its thread until it answers or times out, so hedging
+pauses while the pool is full and orphans are counted on /metrics.
+"""
+import asyncio
+import email.utils
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from loguru import logger
+from openai import APIConnectionError, APIStatusError, RateLimitError
+
+from core.config import settings
+from core.telemetry import record_hedge, record_llm_latency, record_llm_retry, record_orphaned_request
+
+T = TypeVar("T")
+
+CALL_COMPLETE = "complete"
+CALL_FIRST_CHUNK = "first_chunk"
+
+
+class LLMUnavailableError(Exception):
+    """The LLM could not answer in time: deadline exceeded or circuit open."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """Calls are failing fast after repeated upstream failures."""
+
+
+class LLMDeadlineExceeded(LLMUnavailableError):
+    """The call's deadline elapsed before any attempt succeeded."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Timeouts, connection errors, 429 and 5xx: the same request may succeed later."""
+    if isinstance(exc, (TimeoutError, APIConnectionError, RateLimitError)):
+        return True
+    return isinstance(exc, APIStatusError) and exc.status_code >= 500
+
+
+def is_unavailable(exc: BaseException) -> bool:
+    """The failure is about the LLM service rather than the request itself."""
+    return isinstance(exc, LLMUnavailableError) or is_retryable(exc)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds to wait requested by a 429/503 response (Retry-After or retry-after-ms), if any."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return max(float(headers["retry-after-ms"]) / 1000, 0.0)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            # HTTP-date form
+            return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _quantile(values, q: float) -> float:
+    """Nearest-rank quantile."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered), math.ceil(q * len(ordered))) - 1)]
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker shared by the sync and async paths.
+
+    States: "closed" (calls pass), "open" (calls fail fast) and "half_open"
+    (one probe call in flight after the reset timeout).
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go out now (claims the probe when half-open)."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("LLM circuit closed")
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                if self.state == "closed":
+                    logger.warning(f"LLM circuit opened after {self.failures} consecutive failures")
+                self.state = "open"
+                self.opened += 1
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """End a probe that neither proved nor disproved the service (e.g. a 429)."""
+        with self._lock:
+            self._probing = False
+
+
+class LatencyTracker:
+    """Sliding windows of served and unhedged latencies, plus hedge counts, per (stage, call)."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._served: Dict[Tuple[str, str], Deque[float]] = {}
+        self._unhedged: Dict[Tuple[str, str], Deque[float]] = {}
+        self._hedges: Dict[Tuple[str, str], list] = {}  # key -> [fired, won]
+        self._lock = threading.Lock()
+
+    def _window(self, windows: dict, key: tuple) -> Deque[float]:
+        if key not in windows:
+            windows[key] = deque(maxlen=self.window)
+        return windows[key]
+
+    def observe(self, key: tuple, served: Optional[float] = None, unhedged: Optional[float] = None):
+        with self._lock:
+            if served is not None:
+                self._window(self._served, key).append(served)
+            if unhedged is not None:
+                self._window(self._unhedged, key).append(unhedged)
+
+    def hedge(self, key: tuple, won: bool):
+        with self._lock:
+            counts = self._hedges.setdefault(key, [0, 0])
+            counts[0] += 1
+            counts[1] += int(won)
+
+    def quantile(self, key: tuple, q: float, min_samples: int = 1) -> Optional[float]:
+        """Quantile of the single-request (unhedged) latency, once enough samples exist."""
+        with self._lock:
+            values = list(self._unhedged.get(key, ()))
+        if len(values) < max(min_samples, 1):
+            return None
+        return _quantile(values, q)
+
+    def hedge_win_ratios(self) -> Dict[tuple, float]:
+        with self._lock:
+            return {key: won / fired for key, (fired, won) in self._hedges.items() if fired}
+
+    def p99_improvements(self) -> Dict[tuple, float]:
+        """p99 of unhedged minus p99 of served latency (seconds saved at the tail)."""
+        with self._lock:
+            pairs = {key: (list(self._unhedged.get(key, ())), list(served)) for key, served in self._served.items()}
+        return {
+            key: _quantile(unhedged, 0.99) - _quantile(served, 0.99)
+            for key, (unhedged, served) in pairs.items()
+            if unhedged and served
+        }
+
+
+class LLMGateway:
+    """
+    Deadline, retry, circuit-breaker and hedging policy for LLM requests.
+
+    `request(timeout)` must perform exactly one attempt and give up after
+    `timeout` seconds; it may be invoked twice concurrently when hedging.
+    """
+
+    def __init__(
+        self,
+        deadline_seconds: float,
+        attempt_timeout_seconds: float,
+        max_retries: int,
+        base_delay: float,
+        max_delay: float,
+        breaker: CircuitBreaker,
+        tracker: LatencyTracker,
+        rate_limit_max_retries: Optional[int] = None,
+        rate_limit_max_delay: Optional[float] = None,
+        hedge_enabled: bool = True,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        hedge_max_threads: int = 32,
+    ):
+        self.deadline_seconds = deadline_seconds
+        self.attempt_timeout_seconds = attempt_timeout_seconds
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limit_max_retries = max_retries if rate_limit_max_retries is None else rate_limit_max_retries
+        self.rate_limit_max_delay = max_delay if rate_limit_max_delay is None else rate_limit_max_delay
+        self.breaker = breaker
+        self.tracker = tracker
+        self.hedge_enabled = hedge_enabled
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_max_threads = hedge_max_threads
+        self._pool = ThreadPoolExecutor(max_workers=hedge_max_threads, thread_name_prefix="llm-hedge")
+        self._pool_busy = 0
+        self._pool_lock = threading.Lock()
+
+    # -- policy shared by both paths ---------------------------------------
+
+    def _hedge_delay(self, key: tuple, timeout: float) -> Optional[float]:
+        if not self.hedge_enabled or self.breaker.state != "closed":
+            return None
+        delay = self.tracker.quantile(key, self.hedge_quantile, self.hedge_min_samples)
+        return delay if delay is not None and delay < timeout else None
+
+    def _before_attempt(self, deadline_at: float, stage: str, last_error: Optional[BaseException]) -> float:
+        """Check the circuit and the deadline; return the timeout for the next attempt."""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"LLM circuit is open; failing fast ({stage})") from last_error
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            self.breaker.release()
+            raise LLMDeadlineExceeded(f"LLM call exceeded its {self.deadline_seconds:g}s deadline ({stage})") from last_error
+        return min(self.attempt_timeout_seconds, remaining)
+
+    def _after_failure(self, exc: BaseException, retries: Dict[str, int], deadline_at: float, stage: str) -> float:
+        """
+        Update the breaker and return the backoff before the next attempt, or re-raise.
+
+        `retries` counts the retries made so far per kind ("error", "rate_limit")
+        and is updated here.
+        """
+        if not is_retryable(exc):
+            if isinstance(exc, APIStatusError):
+                # The service answered; the request itself is at fault
+                self.breaker.record_success()
+            else:
+                self.breaker.release()
+            raise exc
+        if isinstance(exc, RateLimitError):
+            self.breaker.release()
+            kind, max_retries, max_delay = "rate_limit", self.rate_limit_max_retries, self.rate_limit_max_delay
+        else:
+            self.breaker.record_failure()
+            kind, max_retries, max_delay = "error", self.max_retries, self.max_delay
+        attempt = retries[kind]
+        if attempt >= max_retries:
+            raise exc
+        retries[kind] += 1
+        delay = retry_after(exc) if kind == "rate_limit" else None
+        if delay is None:
+            delay = random.uniform(0, min(max_delay, self.base_delay * 2 ** attempt))
+        if time.monotonic() + delay >= deadline_at:
+            raise LLMDeadlineExceeded(f"LLM call exceeded its {self.deadline_seconds:g}s deadline ({stage})") from exc
+        record_llm_retry(stage)
+        logger.warning(f"LLM {stage} attempt failed ({type(exc).__name__}: {exc}); "
+                       f"{kind} retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+        return delay
+
+    def _record(self, key: tuple, elapsed: float, hedged: bool, hedge_won: bool):
+        stage, call = key
+        unhedged = None if hedge_won else elapsed
+        self.tracker.observe(key, served=elapsed, unhedged=unhedged)
+        record_llm_latency(stage, call, elapsed, unhedged)
+        if hedged:
+            self.tracker.hedge(key, hedge_won)
+            record_hedge(stage, hedge_won)
+
+    def _record_primary(self, key: tuple, elapsed: float):
+        """Latency of a primary request that lost to its hedge."""
+        stage, call = key
+        self.tracker.observe(key, unhedged=elapsed)
+        record_llm_latency(stage, call, None, elapsed)
+
+    # -- sync path ---------------------------------------------------------
+
+    def call(self, request: Callable[[float], T], stage: str = "llm", call: str = CALL_COMPLETE) -> T:
+        """Run a blocking request under the gateway policy."""
+        deadline_at = time.monotonic() + self.deadline_seconds
+        last_error = None
+        retries = {"error": 0, "rate_limit": 0}
+        while True:
+            timeout = self._before_attempt(deadline_at, stage, last_error)
+            try:
+                result = self._attempt((stage, call), request, timeout)
+            except Exception as e:
+                last_error = e
+                time.sleep(self._after_failure(e, retries, deadline_at, stage))
+                continue
+            except BaseException:
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def _reserve_threads(self, count: int) -> bool:
+        with self._pool_lock:
+            if self._pool_busy + count > self.hedge_max_threads:
+                return False
+            self._pool_busy += count
+            return True
+
+    def _release_thread(self, _future=None):
+        with self._pool_lock:
+            self._pool_busy -= 1
+
+    def _attempt(self, key: tuple, request: Callable[[float], T], timeout: float) -> T:
+        delay = self._hedge_delay(key, timeout)
+        # Threads for the primary and its hedge, so the hedge can start while the primary is blocked
+        if delay is not None and not self._reserve_threads(2):
+            logger.debug(f"LLM hedge pool full; {key[0]} attempt runs unhedged")
+            delay = None
+        started = time.monotonic()
+        if delay is None:
+            result = request(timeout)
+            self._record(key, time.monotonic() - started, hedged=False, hedge_won=False)
+            return result
+
+        primary = self._pool.submit(request, timeout)
+        primary.add_done_callback(self._release_thread)
+        hedge = None
+        try:
+            pending = {primary}
+            error = None
+            while pending:
+                remaining = started + timeout - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"LLM attempt exceeded {timeout:.1f}s")
+                wait_for = remaining if hedge is not None else min(remaining, max(started + delay - time.monotonic(), 0))
+                done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        hedge_won = future is hedge
+                        self._record(key, time.monotonic() - started, hedged=hedge is not None, hedge_won=hedge_won)
+                        if hedge_won:
+                            primary.add_done_callback(
+                                lambda f: f.exception() is None and self._record_primary(key, time.monotonic() - started)
+                            )
+                        return future.result()
+                    error = future.exception()
+                if not done and hedge is None:
+                    hedge = self._pool.submit(request, started + timeout - time.monotonic())
+                    hedge.add_done_callback(self._release_thread)
+                    pending.add(hedge)
+            raise error
+        finally:
+            if hedge is None:
+                self._release_thread()
+            # A request already in flight cannot be interrupted: it keeps its thread and its result is discarded
+            for future in (primary, hedge):
+                if future is not None and not future.done():
+                    record_orphaned_request(key[0])
+                    logger.debug(f"LLM {key[0]} request orphaned after losing its hedge race")
+
+    # -- async path --------------------------------------------------------
+
+    async def acall(
+        self,
+        request: Callable[[float], Awaitable[T]],
+        stage: str = "llm",
+        call: str = CALL_COMPLETE,
+        discard: Optional[Callable[[T], Awaitable]] = None,
+    ) -> T:
+        """
+        Run an async request under the gateway policy.
+
+        Args:
+            request: Performs one attempt given its timeout
+            stage: Pipeline stage label for metrics and hedging statistics
+            call: CALL_COMPLETE, or CALL_FIRST_CHUNK when request opens a stream
+            discard: Releases the result of a losing hedged request (e.g. closes a stream)
+        """
+        deadline_at = time.monotonic() + self.deadline_seconds
+        last_error = None
+        retries = {"error": 0, "rate_limit": 0}
+        while True:
+            timeout = self._before_attempt(deadline_at, stage, last_error)
+            try:
+                result = await self._aattempt((stage, call), request, timeout, discard)
+            except Exception as e:
+                last_error = e
+                await asyncio.sleep(self._after_failure(e, retries, deadline_at, stage))
+                continue
+            except BaseException:
+                # Cancelled mid-attempt (discarded speculation, client gone): give back a half-open probe
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def _aattempt(self, key: tuple, request, timeout: float, discard) -> T:
+        delay = self._hedge_delay(key, timeout)
+        started = time.monotonic()
+        primary = asyncio.ensure_future(request(timeout))
+        hedge = None
+        winner = None
+        pending = {primary}
+        error = None
+        try:
+            while pending:
+                remaining = started + timeout - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"LLM attempt exceeded {timeout:.1f}s")
+                wait_for = remaining
+                if hedge is None and delay is not None:
+                    wait_for = min(remaining, max(started + delay - time.monotonic(), 0))
+                done, pending = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception() is None:
+                        winner = task
+                        self._record(key, time.monotonic() - started, hedged=hedge is not None, hedge_won=task is hedge)
+                        return task.result()
+                    error = task.exception()
+                if not done and hedge is None and delay is not None:
+                    hedge = asyncio.ensure_future(request(started + timeout - time.monotonic()))
+                    pending.add(hedge)
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is None or task is winner:
+                    continue
+                if task is primary and winner is hedge:
+                    # Let the primary finish to measure the latency the hedge saved
+                    task.add_done_callback(lambda t: self._on_primary_done(t, key, started, discard))
+                elif task.done():
+                    self._release(task, discard)
+                else:
+                    task.cancel()
+                    task.add_done_callback(lambda t: self._release(t, discard))
+
+    def _on_primary_done(self, task: asyncio.Future, key: tuple, started: float, discard):
+        if not task.cancelled() and task.exception() is None:
+            self._record_primary(key, time.monotonic() - started)
+        self._release(task, discard)
+
+    @staticmethod
+    def _release(task: asyncio.Future, discard):
+        # Consumes the exception of a losing request and frees its result
+        if task.cancelled() or task.exception() is not None:
+            return
+        if discard is not None:
+            cleanup = asyncio.ensure_future(discard(task.result()))
+            cleanup.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def stats(self) -> dict:
+        """Circuit state and hedging statistics for logs and /metrics."""
+        return {
+            "circuit_state": self.breaker.state,
+            "circuit_opened": self.breaker.opened,
+            "hedge_win_ratio": self.tracker.hedge_win_ratios(),
+            "p99_improvement_seconds": self.tracker.p99_improvements(),
+        }
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """Return the process-wide gateway configured in Settings."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway(
+                    deadline_seconds=settings.LLM_DEADLINE_SECONDS,
+                    attempt_timeout_seconds=settings.LLM_ATTEMPT_TIMEOUT_SECONDS,
+                    max_retries=settings.LLM_MAX_RETRIES,
+                    base_delay=settings.LLM_RETRY_BASE_DELAY_SECONDS,
+                    max_delay=settings.LLM_RETRY_MAX_DELAY_SECONDS,
+                    rate_limit_max_retries=settings.LLM_RATE_LIMIT_MAX_RETRIES,
+                    rate_limit_max_delay=settings.LLM_RATE_LIMIT_MAX_DELAY_SECONDS,
+                    breaker=CircuitBreaker(settings.LLM_CIRCUIT_FAILURE_THRESHOLD, settings.LLM_CIRCUIT_RESET_SECONDS),
+                    tracker=LatencyTracker(settings.LLM_LATENCY_WINDOW),
+                    hedge_enabled=settings.LLM_HEDGE_ENABLED,
+                    hedge_quantile=settings.LLM_HEDGE_QUANTILE,
+                    hedge_min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+                    hedge_max_threads=settings.LLM_HEDGE_MAX_THREADS,
+                )
+    return _gateway
@@ -0,0 +1,234 @@
+"""
+Deterministic OpenAI-compatible stand-in for offline load testing.
+
+Implements POST /v1/chat/completions with canned or rule-based answers and
+configurable latency distributions and error rates (LOCAL_LLM_* settings),
+so throughput, tail latency and retry behavior of the whole stack can be
+measured without network access.
+
+Run it and point the pipeline at it with LLM_BACKEND=local:
+
+    python -m uvicorn core.local_llm_server:app --port 8001
+"""
+import json
+import math
+import random
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+import anyio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from loguru import logger
+
+from core.config import settings
+
+app = FastAPI(title="Projeto TAES - Local LLM stand-in", version="1.0.0")
+
+_rng = random.Random(settings.LOCAL_LLM_SEED)
+_canned: Optional[dict] = None
+
+COUNT_HINTS = ("how many", "number of", "count")
+
+
+def _normalize_question(question: str) -> str:
+    return " ".join(re.findall(r"\w+", question.lower()))
+
+
+def load_canned_responses() -> dict:
+    """Load the {question: sql} file configured in LOCAL_LLM_RESPONSES_FILE (normalized keys)."""
+    global _canned
+    if _canned is None:
+        _canned = {}
+        if settings.LOCAL_LLM_RESPONSES_FILE:
+            with open(Path(settings.LOCAL_LLM_RESPONSES_FILE), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            _canned = {_normalize_question(q): sql for q, sql in data.items()}
+            logger.info(f"Loaded {len(_canned)} canned responses")
+    return _canned
+
+
+def sample_latency() -> float:
+    """
+    Draw a response latency in seconds from the configured distribution.
+
+    Returns:
+        Latency in seconds (never negative)
+    """
+    mean = settings.LOCAL_LLM_LATENCY_MEAN_MS / 1000
+    spread = settings.LOCAL_LLM_LATENCY_SPREAD
+    distribution = settings.LOCAL_LLM_LATENCY_DISTRIBUTION.lower()
+
+    if distribution == "fixed":
+        latency = mean
+    elif distribution == "uniform":
+        latency = _rng.uniform(mean * (1 - spread), mean * (1 + spread))
+    elif distribution == "exponential":
+        latency = _rng.expovariate(1 / mean) if mean > 0 else 0.0
+    elif distribution == "lognormal":
+        # mu chosen so that the distribution mean equals `mean`
+        latency = _rng.lognormvariate(math.log(mean) - spread ** 2 / 2, spread) if mean > 0 else 0.0
+    else:
+        raise ValueError(f"Unsupported latency distribution: {settings.LOCAL_LLM_LATENCY_DISTRIBUTION}")
+    return max(latency, 0.0)
+
+
+def _parse_tables(db_schema: str) -> list[tuple[str, list[str]]]:
+    tables = []
+    for match in re.finditer(r"CREATE\s+TABLE\s+[`\"\[]?(\w+)[`\"\]]?\s*\((.*?)\)\s*(?:;|$|\n\n)", db_schema, re.IGNORECASE | re.DOTALL):
+        columns = []
+        for col_def in match.group(2).split(","):
+            parts = col_def.strip().split()
+            if parts and parts[0].upper() not in ("PRIMARY", "FOREIGN", "UNIQUE", "CONSTRAINT"):
+                columns.append(parts[0].strip("`\"[]"))
+        tables.append((match.group(1), columns))
+    return tables
+
+
+def rule_based_sql(question: str, db_schema: str) -> str:
+    """
+    Build a plausible SQL query from lexical overlap between question and schema.
+
+    Args:
+        question: Natural language question
+        db_schema: CREATE TABLE statements
+
+    Returns:
+        A deterministic SQL query
+    """
+    tables = _parse_tables(db_schema)
+    if not tables:
+        return "SELECT 1"
+
+    text = _normalize_question(question)
+    words = set(text.split())
+
+    def mentioned(identifier: str) -> bool:
+        name = identifier.lower().replace("_", " ")
+        return name in text or name.rstrip("s") in words
+
+    best_table, best_columns = max(
+        tables,
+        key=lambda t: (mentioned(t[0]) * 2 + sum(mentioned(c) for c in t[1])),
+    )
+    columns = [c for c in best_columns if mentioned(c)]
+
+    if any(re.search(rf"\b{hint}\b", text) for hint in COUNT_HINTS):
+        sql = f"SELECT count(*) FROM {best_table}"
+    else:
+        sql = f"SELECT {', '.join(columns) if columns else '*'} FROM {best_table}"
+
+    literal = re.search(r"'([^']*)'|\"([^\"]*)\"", question)
+    if literal and columns:
+        value = (literal.group(1) or literal.group(2)).replace("'", "''")
+        sql += f" WHERE {columns[-1]} = '{value}'"
+    return sql
+
+
+def answer(messages: list) -> str:
+    """
+    Produce the assistant reply for a chat request.
+
+    Rewriting prompts echo the original question; SQL generation prompts get a
+    canned answer when one matches, otherwise a rule-based query.
+    """
+    user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+
+    original = re.search(r"Original question:\s*(.*?)\n", user)
+    if user.startswith("Rewrite the question") and original:
+        return original.group(1).strip()
+
+    schema_match = re.search(r"### Database Schema:\n(.*?)\n### Question:\n(.*?)\n\n### SQL Query:", user, re.DOTALL)
+    if not schema_match:
+        return "SELECT 1"
+
+    db_schema, question = schema_match.group(1), schema_match.group(2).strip()
+    canned = load_canned_responses().get(_normalize_question(question))
+    return canned if canned is not None else rule_based_sql(question, db_schema)
+
+
+def _error(status: int, message: str, error_type: str) -> JSONResponse:
+    headers = {"retry-after": "1"} if status == 429 else None
+    return JSONResponse(
+        status_code=status,
+        content={"error": {"message": message, "type": error_type, "code": error_type}},
+        headers=headers,
+    )
+
+
+def _stream_chunks(completion_id: str, model: str, content: str, usage: Optional[dict]):
+    """Yield the completion as OpenAI `chat.completion.chunk` server-sent events."""
+    created = int(time.time())
+
+    def event(choices: list, **extra) -> str:
+        chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                 "model": model, "choices": choices, **extra}
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    async def generate():
+        for i, piece in enumerate(re.findall(r"\s*\S+", content) or [""]):
+            if i:
+                await anyio.sleep(settings.LOCAL_LLM_STREAM_CHUNK_MS / 1000)
+            delta = {"role": "assistant", "content": piece} if i == 0 else {"content": piece}
+            yield event([{"index": 0, "delta": delta, "finish_reason": None}])
+        yield event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if usage is not None:
+            yield event([], usage=usage)
+        yield "data: [DONE]\n\n"
+
+    return generate()
+
+
+@app.get("/health")
+def health_check():
+    return {"status": "healthy"}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+
+    draw = _rng.random()
+    if draw < settings.LOCAL_LLM_RATE_LIMIT_RATE:
+        return _error(429, "Rate limit reached (simulated)", "rate_limit_exceeded")
+
+    await anyio.sleep(sample_latency())
+
+    if draw < settings.LOCAL_LLM_RATE_LIMIT_RATE + settings.LOCAL_LLM_ERROR_RATE:
+        return _error(500, "Internal server error (simulated)", "server_error")
+
+    content = answer(messages)
+    prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4 + 1
+    completion_tokens = len(content) // 4 + 1
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+    completion_id = f"chatcmpl-local-{uuid.uuid4().hex[:12]}"
+    model = body.get("model", settings.LLM_MODEL)
+
+    # The sampled latency is the time to first token when streaming
+    if body.get("stream"):
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+        return StreamingResponse(
+            _stream_chunks(completion_id, model, content, usage if include_usage else None),
+            media_type="text/event-stream",
+        )
+
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": usage,
+    }
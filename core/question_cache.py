@@ -0,0 +1,271 @@
+"""
+Near-duplicate question cache for the SQL generation endpoints.
+
+Production traffic repeats the same questions with trivial variations
+(casing, punctuation, spacing) against the same schema. Questions are
+normalized (lowercase, no punctuation, word order kept) and compared by
+Jaccard similarity of their character trigrams; above
+QUESTION_CACHE_THRESHOLD the stored rewritten question and SQL are reused
+and both LLM calls are skipped. Normalized duplicates score 1.0; the default
+threshold of 0.9 tolerates only small wording changes in longer questions (a
+swapped entity name in a short question scores around 0.7). Trigrams barely
+see word order, so the words two questions share must also appear in the
+same order: "flights from Boston to Denver" and "flights from Denver to
+Boston" score 0.85 but never match.
+
+Entries are scoped by a hash of the model, schema and content, so an answer
+is only reused for the database it was generated against. Numbers, quoted
+literals, negations, superlatives/comparatives, order direction and aggregate
+words must match exactly: "older than 30" vs "older than 40" or "maximum" vs
+"minimum" are near-identical strings but different queries. The cache is off
+by default (QUESTION_CACHE_ENABLED). Memory is bounded by
+QUESTION_CACHE_MAX_ENTRIES across all schemas, evicting the least recently
+used entries first.
+"""
+import hashlib
+import itertools
+import re
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+
+from loguru import logger
+
+from core.config import settings
+
+NGRAM = 3
+
+# Words that change the query while barely changing the string ("maximum" vs
+# "minimum" scores 0.9); a question's set of them must match exactly
+_SIGNATURE_WORDS = frozenset({
+    # negation
+    "not", "no", "never", "without", "except", "nor", "none",
+    # superlatives and extremes
+    "max", "maximum", "min", "minimum", "most", "least", "top", "bottom", "first", "last",
+    "best", "worst", "highest", "lowest", "largest", "smallest", "biggest", "greatest", "fewest",
+    # comparatives and ranges
+    "more", "less", "fewer", "greater", "higher", "lower", "larger", "smaller", "bigger",
+    "older", "younger", "newer", "earlier", "later", "longer", "shorter", "cheaper",
+    "above", "below", "over", "under", "before", "after", "since", "until", "between", "exceeds",
+    # order direction
+    "asc", "ascending", "desc", "descending", "increasing", "decreasing", "reverse", "alphabetical",
+    # aggregates
+    "count", "number", "many", "much", "sum", "total", "average", "avg", "mean", "median",
+    "distinct", "unique", "each", "per", "all", "any",
+    # the same in Portuguese (the API also takes Portuguese questions)
+    "não", "nem", "sem", "exceto", "nenhum", "nenhuma", "máximo", "máxima", "mínimo", "mínima",
+    "maior", "menor", "maiores", "menores", "mais", "menos", "primeiro", "primeira", "último", "última",
+    "acima", "abaixo", "antes", "depois", "desde", "até", "entre", "crescente", "decrescente",
+    "quantos", "quantas", "quantidade", "número", "soma", "média", "distintos", "distintas", "cada", "todos", "todas",
+})
+_QUOTED = re.compile(r"'([^']*)'|\"([^\"]*)\"")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase and drop punctuation, keeping the word order (it carries the roles)."""
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+
+def _same_word_order(a: Tuple[str, ...], b: Tuple[str, ...]) -> bool:
+    """The words both questions use appear in the same order (and as often) in each."""
+    shared = set(a) & set(b)
+    return [w for w in a if w in shared] == [w for w in b if w in shared]
+
+
+def _shingles(normalized: str) -> FrozenSet[str]:
+    padded = f" {normalized} "
+    if len(padded) <= NGRAM:
+        return frozenset({padded})
+    return frozenset(padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1))
+
+
+def _signature(question: str) -> Tuple[str, ...]:
+    """Tokens that change the query's meaning and must match exactly."""
+    lowered = question.lower()
+    quoted = [a or b for a, b in _QUOTED.findall(lowered)]
+    words = re.sub(r"[^\w\s]", " ", lowered).split()
+    # Any other superlative ("-est": oldest, cheapest) is kept too; false positives only cost hits
+    keywords = [w for w in words if w in _SIGNATURE_WORDS or (len(w) > 4 and w.endswith("est"))]
+    keywords += re.findall(r"\w+n't\b", lowered)
+    return tuple(sorted(quoted + _NUMBER.findall(lowered) + keywords))
+
+
+def schema_scope(db_schema: str, db_content: str = "") -> str:
+    """Cache scope of a schema/content pair for the configured model."""
+    payload = f"{settings.LLM_BACKEND}\0{settings.LLM_MODEL}\0{db_schema}\0{db_content}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _Entry:
+    scope: str
+    question: str
+    normalized: str
+    shingles: FrozenSet[str]
+    words: Tuple[str, ...]
+    signature: Tuple[str, ...]
+    result: dict
+
+
+@dataclass
+class QuestionCacheMatch:
+    """A reused answer and how closely the new question matched it."""
+    entry_id: int
+    matched_question: str
+    score: float
+    result: dict
+
+    def header(self) -> str:
+        """Value of the X-Question-Cache debug header (ASCII-safe)."""
+        matched = self.matched_question.encode("unicode_escape").decode("ascii").replace('"', '\\"')
+        return f'hit; score={self.score:.3f}; entry={self.entry_id}; matched="{matched}"'
+
+    def stats(self) -> dict:
+        return {"hit": True, "score": self.score, "entry": self.entry_id, "matched_question": self.matched_question}
+
+
+class QuestionCache:
+    """
+    LRU cache of generated answers, looked up by question similarity.
+
+    An inverted index from (scope, trigram) to entry ids restricts each
+    lookup to the entries sharing at least one trigram with the question.
+    Cached results are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries: int, threshold: float):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._postings: Dict[Tuple[str, str], Set[int]] = {}
+        self._exact: Dict[Tuple[str, str], int] = {}  # (scope, normalized) -> entry id
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def lookup(self, scope: str, question: str) -> Optional[QuestionCacheMatch]:
+        """
+        Find the most similar cached question for a schema.
+
+        Args:
+            scope: Value of schema_scope() for the request's schema
+            question: Incoming natural language question
+
+        Returns:
+            The best match at or above the threshold, or None
+        """
+        normalized = normalize_question(question)
+        shingles = _shingles(normalized)
+        words = tuple(normalized.split())
+        signature = _signature(question)
+
+        with self._lock:
+            best_id, best_score = None, 0.0
+            exact_id = self._exact.get((scope, normalized))
+            if exact_id is not None and self._entries[exact_id].signature == signature:
+                best_id, best_score = exact_id, 1.0
+            else:
+                overlaps = Counter()
+                for shingle in shingles:
+                    overlaps.update(self._postings.get((scope, shingle), ()))
+                for entry_id, shared in overlaps.items():
+                    entry = self._entries[entry_id]
+                    score = shared / (len(shingles) + len(entry.shingles) - shared)
+                    if (score > best_score and score >= self.threshold and entry.signature == signature
+                            and _same_word_order(entry.words, words)):
+                        best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+            return QuestionCacheMatch(best_id, entry.question, best_score, entry.result)
+
+    def put(self, scope: str, question: str, result: dict):
+        """
+        Store the answer generated for a question, replacing an identical one.
+
+        Args:
+            scope: Value of schema_scope() for the request's schema
+            question: Question the answer was generated for
+            result: Pipeline result (rewritten question, SQL, stats)
+        """
+        normalized = normalize_question(question)
+        entry = _Entry(scope, question, normalized, _shingles(normalized), tuple(normalized.split()),
+                       _signature(question), result)
+        with self._lock:
+            previous = self._exact.get((scope, normalized))
+            if previous is not None:
+                self._remove(previous)
+            entry_id = next(self._ids)
+            self._entries[entry_id] = entry
+            self._exact[(scope, normalized)] = entry_id
+            for shingle in entry.shingles:
+                self._postings.setdefault((scope, shingle), set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        if self._exact.get((entry.scope, entry.normalized)) == entry_id:
+            del self._exact[(entry.scope, entry.normalized)]
+        for shingle in entry.shingles:
+            key = (entry.scope, shingle)
+            ids = self._postings[key]
+            ids.discard(entry_id)
+            if not ids:
+                del self._postings[key]
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            self._exact.clear()
+
+    def stats(self) -> dict:
+        """Return hit/miss/eviction counters and the number of stored entries."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "scopes": len({entry.scope for entry in self._entries.values()}),
+            }
+
+
+_question_cache: Optional[QuestionCache] = None
+_question_cache_lock = threading.Lock()
+
+
+def get_question_cache() -> Optional[QuestionCache]:
+    """
+    Return the process-wide cache configured in Settings.
+
+    Returns:
+        The shared QuestionCache, or None if it is disabled
+    """
+    global _question_cache
+    if not settings.QUESTION_CACHE_ENABLED:
+        return None
+    if _question_cache is None:
+        with _question_cache_lock:
+            if _question_cache is None:
+                logger.info(
+                    f"Question cache enabled (threshold {settings.QUESTION_CACHE_THRESHOLD}, "
+                    f"max {settings.QUESTION_CACHE_MAX_ENTRIES} entries)"
+                )
+                _question_cache = QuestionCache(
+                    settings.QUESTION_CACHE_MAX_ENTRIES, settings.QUESTION_CACHE_THRESHOLD
+                )
+    return _question_cache
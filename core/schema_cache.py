@@ -0,0 +1,184 @@
+"""
+Process-wide cache of parsed schema files.
+
+Entries are keyed by resolved path (plus a namespace, since the same file
+can be parsed by different loaders) and invalidated whenever the file's
+mtime or size changes. Memory is bounded by the total size of the cached
+files, evicting the least recently used entries first. Optionally, a
+filesystem watcher (requires the `watchfiles` package) drops entries as
+soon as their file changes on disk.
+"""
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from loguru import logger
+
+from core.config import settings
+
+
+class SchemaFileCache:
+    """
+    LRU cache of parsed file contents bounded by the on-disk size of the files.
+
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes: int, watch: bool = False):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: OrderedDict = OrderedDict()  # (path, namespace) -> (mtime_ns, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._watched_dirs: set = set()
+        self._watch_restart: Optional[threading.Event] = None
+        self._watch_wakeup = threading.Event()
+        if watch:
+            self._start_watcher()
+
+    def get(self, path: Path, namespace: str, stat: os.stat_result) -> Optional[Any]:
+        """
+        Return the cached value for a file if it is still fresh.
+
+        Args:
+            path: Resolved file path
+            namespace: Loader identifier
+            stat: Current os.stat() of the file
+
+        Returns:
+            The cached value, or None if absent or stale
+        """
+        key = (str(path), namespace)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                mtime_ns, size, value = entry
+                if mtime_ns == stat.st_mtime_ns and size == stat.st_size:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._drop(key)
+                self.invalidations += 1
+            self.misses += 1
+            return None
+
+    def put(self, path: Path, namespace: str, stat: os.stat_result, value: Any):
+        """
+        Store a parsed value for a file.
+
+        Args:
+            path: Resolved file path
+            namespace: Loader identifier
+            stat: os.stat() taken before the file was read
+            value: Parsed value
+        """
+        if stat.st_size > self.max_bytes:
+            return
+        key = (str(path), namespace)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (stat.st_mtime_ns, stat.st_size, value)
+            self._bytes += stat.st_size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+        self._watch_dir(path.parent)
+
+    def load(self, file_path, namespace: str, loader: Callable[[Path], Any]) -> Any:
+        """
+        Return the parsed contents of a file, parsing it only when needed.
+
+        Args:
+            file_path: Path to the file
+            namespace: Loader identifier
+            loader: Function that parses the file at the given path
+
+        Returns:
+            The (possibly cached) parsed value
+        """
+        path = Path(file_path).resolve()
+        stat = path.stat()
+        value = self.get(path, namespace, stat)
+        if value is None:
+            value = loader(path)
+            self.put(path, namespace, stat, value)
+        return value
+
+    def invalidate(self, file_path):
+        """Drop every entry for a file, whatever loader produced it."""
+        path = str(Path(file_path).resolve())
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Return counters and current memory usage."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _start_watcher(self):
+        try:
+            import watchfiles  # noqa: F401
+        except ImportError:
+            logger.warning("watchfiles is not installed; schema cache relies on mtime checks only")
+            return
+        self._watch_restart = threading.Event()
+        thread = threading.Thread(target=self._watch_loop, name="schema-cache-watch", daemon=True)
+        thread.start()
+
+    def _watch_dir(self, directory: Path):
+        if self._watch_restart is None or str(directory) in self._watched_dirs:
+            return
+        with self._lock:
+            self._watched_dirs.add(str(directory))
+        # Restart the watcher so it picks up the new directory
+        self._watch_restart.set()
+        self._watch_wakeup.set()
+
+    def _watch_loop(self):
+        import watchfiles
+
+        while True:
+            self._watch_wakeup.wait()
+            self._watch_wakeup.clear()
+            # New stop event before the snapshot, so a directory added meanwhile restarts us
+            self._watch_restart = threading.Event()
+            with self._lock:
+                dirs = sorted(self._watched_dirs)
+            logger.debug(f"Watching {len(dirs)} schema director(y/ies)")
+            for changes in watchfiles.watch(*dirs, stop_event=self._watch_restart):
+                for _, changed_path in changes:
+                    self.invalidate(changed_path)
+
+
+schema_file_cache = SchemaFileCache(
+    max_bytes=settings.SCHEMA_CACHE_MAX_BYTES,
+    watch=settings.SCHEMA_CACHE_WATCH,
+)
@@ -0,0 +1,424 @@
+"""
+Lexical schema linking: prune prompts to the tables relevant to a question.
+
+A per-schema inverted index maps terms from table names, column names and
+sample values to the tables/columns they come from. It is built once per
+(schema, content) pair and cached by their hash. For each question the
+tables are ranked by idf-weighted term overlap; the best ones are kept,
+together with their foreign-key closure (referenced tables, transitively,
+plus junction tables linking two kept tables), and only those tables are
+sent in the schema and content parts of the prompt.
+
+Small schemas (fewer than SCHEMA_LINKING_MIN_TABLES tables) are sent whole.
+"""
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from core.config import settings
+from core.telemetry import stage_timer
+
+_CREATE_TABLE_RE = re.compile(
+    r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?[`"\[]?(\w+)[`"\]]?\s*\(', re.IGNORECASE
+)
+_REFERENCES_RE = re.compile(r'REFERENCES\s+[`"\[]?(\w+)[`"\]]?\s*(?:\(\s*[`"\[]?(\w+)[`"\]]?\s*\))?', re.IGNORECASE)
+_FOREIGN_KEY_RE = re.compile(r'FOREIGN\s+KEY\s*\(\s*[`"\[]?(\w+)[`"\]]?\s*\)', re.IGNORECASE)
+_PRIMARY_KEY_RE = re.compile(r'PRIMARY\s+KEY\s*\(([^)]*)\)', re.IGNORECASE)
+_CONSTRAINT_PREFIXES = ("PRIMARY", "FOREIGN", "UNIQUE", "CONSTRAINT", "CHECK")
+
+_STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "and", "or", "by", "with", "from", "at", "as",
+    "is", "are", "was", "were", "be", "been", "do", "does", "did", "what", "which", "who", "whom",
+    "whose", "how", "many", "much", "list", "show", "give", "find", "return", "all", "each", "every",
+    "that", "this", "these", "those", "there", "their", "its", "it", "than", "more", "less", "most",
+    "least", "number", "count", "me", "please", "whats", "id", "ids", "name", "names",
+}
+
+# Term weights by where the term was found
+TABLE_NAME_WEIGHT = 3.0
+COLUMN_NAME_WEIGHT = 2.0
+VALUE_WEIGHT = 1.0
+
+
+def _terms(text: str) -> List[str]:
+    """Lowercase word terms, splitting snake_case/camelCase and stripping plural 's'."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    terms = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1 if text else 0
+
+
+def _split_top_level(body: str) -> List[str]:
+    """Split a CREATE TABLE body on commas that are not inside parentheses."""
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(body):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(body[start:i])
+            start = i + 1
+    parts.append(body[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+@dataclass
+class TableDef:
+    """One CREATE TABLE statement, split into columns and constraints."""
+    name: str
+    statement: str
+    columns: List[Tuple[str, str]] = field(default_factory=list)  # (column, definition)
+    constraints: List[str] = field(default_factory=list)
+    primary_keys: Set[str] = field(default_factory=set)
+    foreign_keys: List[Tuple[str, str]] = field(default_factory=list)  # (column, referenced table)
+
+    def render(self, keep_columns: Optional[Set[str]] = None, keep_tables: Optional[Set[str]] = None) -> str:
+        """Original statement, or a reduced one with only `keep_columns`."""
+        if keep_columns is None or len(keep_columns) == len(self.columns):
+            return self.statement
+        lines = [definition for column, definition in self.columns if column in keep_columns]
+        for constraint in self.constraints:
+            fk = _FOREIGN_KEY_RE.search(constraint)
+            ref = _REFERENCES_RE.search(constraint)
+            if fk and (fk.group(1).lower() not in keep_columns
+                       or (keep_tables is not None and ref and ref.group(1).lower() not in keep_tables)):
+                continue
+            lines.append(constraint)
+        return f"CREATE TABLE {self.name} (\n  " + ",\n  ".join(lines) + "\n)"
+
+
+def parse_create_tables(db_schema: str) -> "OrderedDict[str, TableDef]":
+    """
+    Parse CREATE TABLE statements (balanced parentheses, with or without ';').
+
+    Returns:
+        Ordered mapping lowercase table name -> TableDef
+    """
+    tables = OrderedDict()
+    for match in _CREATE_TABLE_RE.finditer(db_schema):
+        depth, end = 1, match.end()
+        while end < len(db_schema) and depth:
+            if db_schema[end] == "(":
+                depth += 1
+            elif db_schema[end] == ")":
+                depth -= 1
+            end += 1
+        body = db_schema[match.end():end - 1]
+        statement_end = end + 1 if db_schema[end:end + 1] == ";" else end
+        table = TableDef(name=match.group(1), statement=db_schema[match.start():statement_end].strip())
+
+        for definition in _split_top_level(body):
+            upper = definition.upper()
+            if upper.startswith(_CONSTRAINT_PREFIXES):
+                table.constraints.append(definition)
+                pk = _PRIMARY_KEY_RE.search(definition)
+                if pk and upper.startswith(("PRIMARY", "CONSTRAINT")):
+                    table.primary_keys.update(c.strip(' `"[]').lower() for c in pk.group(1).split(","))
+                fk, ref = _FOREIGN_KEY_RE.search(definition), _REFERENCES_RE.search(definition)
+                if fk and ref:
+                    table.foreign_keys.append((fk.group(1).lower(), ref.group(1).lower()))
+                continue
+            column = definition.split()[0].strip('`"[]').lower()
+            table.columns.append((column, definition))
+            if "PRIMARY KEY" in upper:
+                table.primary_keys.add(column)
+            ref = _REFERENCES_RE.search(definition)
+            if ref:
+                table.foreign_keys.append((column, ref.group(1).lower()))
+        tables[table.name.lower()] = table
+    return tables
+
+
+def parse_content_blocks(db_content: str) -> Tuple[str, "OrderedDict[str, str]"]:
+    """
+    Split sample content into per-table blocks.
+
+    Understands the "Table: <name>" blocks produced by data.spider_loader and
+    INSERT INTO statements. Text that belongs to no table is returned as the
+    preamble.
+
+    Returns:
+        (preamble, ordered mapping lowercase table name -> block text)
+    """
+    blocks: "OrderedDict[str, List[str]]" = OrderedDict()
+    preamble = []
+    if re.search(r"^Table:\s*\w+", db_content, re.MULTILINE):
+        current = None
+        for line in db_content.splitlines():
+            header = re.match(r"Table:\s*[`\"\[]?(\w+)", line)
+            if header:
+                current = header.group(1).lower()
+            (blocks.setdefault(current, []) if current else preamble).append(line)
+        return "\n".join(preamble), OrderedDict((t, "\n".join(lines)) for t, lines in blocks.items())
+
+    for statement in re.split(r"(?<=;)\s*", db_content):
+        insert = re.match(r"\s*INSERT\s+INTO\s+[`\"\[]?(\w+)", statement, re.IGNORECASE)
+        if insert:
+            blocks.setdefault(insert.group(1).lower(), []).append(statement.strip())
+        elif statement.strip():
+            preamble.append(statement.strip())
+    return "\n".join(preamble), OrderedDict((t, "\n".join(lines)) for t, lines in blocks.items())
+
+
+def _content_values(block: str) -> List[Tuple[Optional[str], str]]:
+    """(column or None, value text) pairs from a content block."""
+    values = []
+    columns_match = re.search(r"^Columns:\s*(.*)$", block, re.MULTILINE)
+    columns = [c.strip().lower() for c in columns_match.group(1).split(",")] if columns_match else []
+    for row in re.findall(r"^\s*Row \d+:\s*(.*)$", block, re.MULTILINE):
+        for i, value in enumerate(row.split(" | ")):
+            values.append((columns[i] if i < len(columns) else None, value))
+    if not columns_match:
+        values.extend((None, literal) for literal in re.findall(r"'((?:[^']|'')*)'", block))
+    return values
+
+
+class SchemaIndex:
+    """Inverted index of one schema (and its sample content) for schema linking."""
+
+    def __init__(self, db_schema: str, db_content: str = ""):
+        self.tables = parse_create_tables(db_schema)
+        self.content_preamble, self.content_blocks = parse_content_blocks(db_content) if db_content else ("", OrderedDict())
+        self.schema_tokens = _estimate_tokens(db_schema)
+        self.content_tokens = _estimate_tokens(db_content)
+
+        # term -> {(table, column or None): weight}
+        postings: Dict[str, Dict[Tuple[str, Optional[str]], float]] = defaultdict(dict)
+
+        def add(term: str, key: Tuple[str, Optional[str]], weight: float):
+            if postings[term].get(key, 0.0) < weight:
+                postings[term][key] = weight
+
+        for table_key, table in self.tables.items():
+            for term in _terms(table.name):
+                add(term, (table_key, None), TABLE_NAME_WEIGHT)
+            for column, _ in table.columns:
+                for term in _terms(column):
+                    add(term, (table_key, column), COLUMN_NAME_WEIGHT)
+        for table_key, block in self.content_blocks.items():
+            if table_key not in self.tables:
+                continue
+            for column, value in _content_values(block):
+                for term in set(_terms(value)):
+                    add(term, (table_key, column), VALUE_WEIGHT)
+        self.postings = dict(postings)
+
+        # Inverse document frequency over tables
+        table_count = max(len(self.tables), 1)
+        self.idf = {
+            term: math.log(1 + table_count / len({table for table, _ in keys}))
+            for term, keys in self.postings.items()
+        }
+        self.edges = self._foreign_key_edges()
+
+    def _foreign_key_edges(self) -> Dict[str, Set[str]]:
+        """
+        table -> referenced tables. Besides declared foreign keys, a column named
+        like the (unique) single-column primary key of another table counts as a
+        reference, which covers schemas that do not declare their keys.
+        """
+        edges: Dict[str, Set[str]] = defaultdict(set)
+        pk_owner: Dict[str, Optional[str]] = {}
+        for table_key, table in self.tables.items():
+            if len(table.primary_keys) == 1:
+                pk = next(iter(table.primary_keys))
+                pk_owner[pk] = None if pk in pk_owner else table_key  # None: ambiguous
+        for table_key, table in self.tables.items():
+            for column, referenced in table.foreign_keys:
+                if referenced in self.tables and referenced != table_key:
+                    edges[table_key].add(referenced)
+            for column, _ in table.columns:
+                owner = pk_owner.get(column)
+                if owner and owner != table_key and column not in table.primary_keys:
+                    edges[table_key].add(owner)
+        return edges
+
+    def rank(self, question: str) -> Tuple[Counter, Counter]:
+        """Score tables and (table, column) pairs by idf-weighted term matches."""
+        table_scores, column_scores = Counter(), Counter()
+        for term in set(_terms(question)) - _STOPWORDS:
+            keys = self.postings.get(term)
+            if not keys:
+                continue
+            idf = self.idf[term]
+            for (table, column), weight in keys.items():
+                table_scores[table] += weight * idf
+                if column is not None:
+                    column_scores[(table, column)] += weight * idf
+        return table_scores, column_scores
+
+    def coverage(self, question: str) -> float:
+        """
+        Fraction of the question's content terms found in the schema or sample
+        values (numbers are neutral). 0.0 when the question has no such terms.
+        """
+        terms = {term for term in set(_terms(question)) - _STOPWORDS if not term.isdigit()}
+        if not terms:
+            return 0.0
+        return sum(1 for term in terms if term in self.postings) / len(terms)
+
+    def closure(self, tables: Set[str]) -> Set[str]:
+        """Add referenced tables (transitively) and junction tables linking two kept tables."""
+        kept = set(tables)
+        stack = list(kept)
+        while stack:
+            for referenced in self.edges.get(stack.pop(), ()):
+                if referenced not in kept:
+                    kept.add(referenced)
+                    stack.append(referenced)
+        for table, referenced in self.edges.items():
+            if table not in kept and len(referenced & kept) >= 2:
+                kept.add(table)
+        return kept
+
+
+@dataclass
+class SchemaLinkingResult:
+    """Pruned prompt inputs plus the numbers reported per request."""
+    schema: str
+    content: str
+    kept_tables: List[str]
+    total_tables: int
+    pruned: bool
+    tokens_before: int
+    tokens_after: int
+
+    def stats(self) -> dict:
+        return {
+            "pruned": self.pruned,
+            "kept_tables": len(self.kept_tables),
+            "total_tables": self.total_tables,
+            "pruning_ratio": 1 - len(self.kept_tables) / self.total_tables if self.total_tables else 0.0,
+            "prompt_tokens_before": self.tokens_before,
+            "prompt_tokens_after": self.tokens_after,
+            "prompt_tokens_saved": self.tokens_before - self.tokens_after,
+        }
+
+
+_INDEX_CACHE: "OrderedDict[str, SchemaIndex]" = OrderedDict()
+_INDEX_LOCK = threading.Lock()
+
+
+def get_schema_index(db_schema: str, db_content: str = "") -> SchemaIndex:
+    """Return the index for a schema/content pair, building it once per hash."""
+    key = hashlib.sha256(f"{db_schema}\0{db_content}".encode("utf-8")).hexdigest()
+    with _INDEX_LOCK:
+        index = _INDEX_CACHE.get(key)
+        if index is not None:
+            _INDEX_CACHE.move_to_end(key)
+            return index
+
+    index = SchemaIndex(db_schema, db_content)
+    with _INDEX_LOCK:
+        _INDEX_CACHE[key] = index
+        while len(_INDEX_CACHE) > settings.SCHEMA_LINKING_INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+    return index
+
+
+def schema_coverage(question: str, db_schema: str, db_content: str = "") -> float:
+    """Coverage of the question by the full schema and content (see SchemaIndex.coverage)."""
+    return get_schema_index(db_schema, db_content).coverage(question)
+
+
+def _link_schema(
+    question: str,
+    db_schema: str,
+    db_content: str = "",
+    top_tables: Optional[int] = None,
+    max_columns: Optional[int] = None,
+) -> SchemaLinkingResult:
+    """Body of link_schema (timed as the schema_linking stage)."""
+    top_tables = top_tables or settings.SCHEMA_LINKING_TOP_TABLES
+    max_columns = max_columns or settings.SCHEMA_LINKING_MAX_COLUMNS
+    tokens_before = _estimate_tokens(db_schema) + _estimate_tokens(db_content)
+
+    def unpruned(total_tables: int) -> SchemaLinkingResult:
+        return SchemaLinkingResult(db_schema, db_content, [], total_tables, False, tokens_before, tokens_before)
+
+    if not settings.SCHEMA_LINKING_ENABLED:
+        return unpruned(0)
+    index = get_schema_index(db_schema, db_content)
+    total = len(index.tables)
+    if total < settings.SCHEMA_LINKING_MIN_TABLES:
+        return SchemaLinkingResult(db_schema, db_content, list(index.tables), total, False,
+                                   tokens_before, tokens_before)
+
+    table_scores, column_scores = index.rank(question)
+    if not table_scores:
+        return SchemaLinkingResult(db_schema, db_content, list(index.tables), total, False,
+                                   tokens_before, tokens_before)
+
+    best = {table for table, _ in table_scores.most_common(top_tables)}
+    kept = index.closure(best)
+    kept_in_order = [table for table in index.tables if table in kept]
+
+    statements = []
+    for table_key in kept_in_order:
+        table = index.tables[table_key]
+        keep_columns = None
+        if len(table.columns) > max_columns:
+            keys = table.primary_keys | {column for column, _ in table.foreign_keys}
+            ranked = sorted(
+                (column for column, _ in table.columns),
+                key=lambda column: -column_scores.get((table_key, column), 0.0),
+            )
+            keep_columns = set(keys)
+            for column in ranked:
+                if len(keep_columns) >= max_columns:
+                    break
+                keep_columns.add(column)
+        statements.append(table.render(keep_columns, kept))
+    schema = "\n\n".join(statements)
+
+    content = db_content
+    if index.content_blocks:
+        parts = [index.content_preamble] if index.content_preamble else []
+        parts.extend(block for table, block in index.content_blocks.items() if table in kept)
+        content = "\n\n".join(part.strip("\n") for part in parts)
+
+    result = SchemaLinkingResult(schema, content, [index.tables[t].name for t in kept_in_order], total, True,
+                                 tokens_before, _estimate_tokens(schema) + _estimate_tokens(content))
+    stats = result.stats()
+    logger.info(f"Schema linking: {stats['kept_tables']}/{total} tables kept, "
+                f"~{stats['prompt_tokens_saved']} prompt tokens saved")
+    return result
+
+
+def link_schema(
+    question: str,
+    db_schema: str,
+    db_content: str = "",
+    top_tables: Optional[int] = None,
+    max_columns: Optional[int] = None,
+) -> SchemaLinkingResult:
+    """
+    Keep only the parts of the schema and content relevant to a question.
+
+    Args:
+        question: Natural language question
+        db_schema: CREATE TABLE statements
+        db_content: Sample records (optional)
+        top_tables: Best-ranked tables kept before the foreign-key closure
+        max_columns: Wider tables keep only keys and best-ranked columns
+
+    Returns:
+        SchemaLinkingResult; unpruned when linking is disabled, the schema is
+        small, or nothing in the question matches the schema
+    """
+    with stage_timer("schema_linking"):
+        return _link_schema(question, db_schema, db_content, top_tables, max_columns)
@@ -0,0 +1,400 @@
+"""
+Per-stage latency, token and cache metrics in Prometheus text format.
+
+A small in-process registry (counters, histograms and callback gauges) so
+the API can expose /metrics without an extra dependency. Pipeline code
+records stages with `stage_timer` (or `timed_stream` for streamed stages),
+core.llm records calls and token usage,
+and MetricsMiddleware times every HTTP request. Values are per process: with
+several uvicorn workers, each one is scraped (or aggregated) separately.
+
+Stages: schema_load, schema_linking, rewrite, generation, postprocess.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Upper bounds in seconds; LLM calls can take tens of seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PREFIX = "taes_"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic counter with labels."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram with labels (p50/p95/p99 via histogram_quantile)."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> ([count per bucket], sum, count)
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class CallbackGauge(_Metric):
+    """Gauge whose values are read from a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], callback: Callable[[], Dict[tuple, float]]):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+
+    def samples(self) -> List[str]:
+        try:
+            values = self.callback()
+        except Exception:
+            return []
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in sorted(values.items())
+        ]
+
+
+class Registry:
+    """Ordered set of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+def _cache_hit_ratios() -> Dict[tuple, float]:
+    # Imported here: both caches import core.config, and core.llm imports this module
+    from core.llm_cache import get_llm_cache
+    from core.question_cache import get_question_cache
+    from core.schema_cache import schema_file_cache
+
+    ratios = {}
+    llm_cache = get_llm_cache()
+    if llm_cache is not None:
+        ratios[("llm",)] = llm_cache.stats()["hit_ratio"]
+    stats = schema_file_cache.stats()
+    total = stats["hits"] + stats["misses"]
+    ratios[("schema_file",)] = stats["hits"] / total if total else 0.0
+    question_cache = get_question_cache()
+    if question_cache is not None:
+        ratios[("question",)] = question_cache.stats()["hit_ratio"]
+    return ratios
+
+
+def _gateway_values(name: str) -> Callable[[], Dict[tuple, float]]:
+    def values() -> Dict[tuple, float]:
+        # Imported here: core.llm_gateway imports this module
+        from core.llm_gateway import get_gateway
+        return get_gateway().stats()[name]
+    return values
+
+
+def _circuit_state() -> Dict[tuple, float]:
+    from core.llm_gateway import get_gateway
+    state = get_gateway().breaker.state
+    return {(name,): float(name == state) for name in ("closed", "half_open", "open")}
+
+
+registry = Registry()
+
+request_duration = registry.register(Histogram(
+    "request_duration_seconds", "HTTP request latency, until the last body byte is sent",
+    ("method", "route", "status"),
+))
+stage_duration = registry.register(Histogram(
+    "stage_duration_seconds", "Latency of each pipeline stage", ("stage",),
+))
+stage_first_chunk = registry.register(Histogram(
+    "stage_first_chunk_seconds", "Time until a streamed pipeline stage produced its first chunk", ("stage",),
+))
+stage_errors = registry.register(Counter(
+    "stage_errors_total", "Exceptions raised inside a pipeline stage", ("stage",),
+))
+llm_calls = registry.register(Counter(
+    "llm_calls_total", "LLM completions by stage and response-cache outcome", ("stage", "cache"),
+))
+llm_tokens = registry.register(Counter(
+    "llm_tokens_total", "Prompt/completion tokens of non-cached LLM calls", ("stage", "kind"),
+))
+speculations = registry.register(Counter(
+    "speculation_total", "Speculative generations by outcome (hit: the rewrite round-trip was saved)",
+    ("outcome",),
+))
+gate_decisions = registry.register(Counter(
+    "rewrite_gate_total", "Rewrite-gate decisions (bypass: the rewrite call was skipped)", ("decision",),
+))
+question_cache_lookups = registry.register(Counter(
+    "question_cache_total", "Near-duplicate question cache lookups (hit: both LLM calls were skipped)",
+    ("outcome",),
+))
+llm_latency = registry.register(Histogram(
+    "llm_latency_seconds",
+    "LLM request latency (path=served: with hedging; path=unhedged: the first request alone)",
+    ("stage", "call", "path"),
+))
+llm_retries = registry.register(Counter(
+    "llm_retries_total", "LLM attempts retried after a timeout, connection error, 429 or 5xx", ("stage",),
+))
+llm_hedges = registry.register(Counter(
+    "llm_hedges_total", "Hedged LLM requests by which request answered first", ("stage", "winner"),
+))
+llm_orphaned_requests = registry.register(Counter(
+    "llm_orphaned_requests_total", "Losing hedged requests left running until they answer or time out", ("stage",),
+))
+llm_hedge_win_ratio = registry.register(CallbackGauge(
+    "llm_hedge_win_ratio", "Fraction of hedged requests answered first by the hedge", ("stage", "call"),
+    _gateway_values("hedge_win_ratio"),
+))
+llm_hedge_p99_improvement = registry.register(CallbackGauge(
+    "llm_hedge_p99_improvement_seconds", "Unhedged minus served p99 latency over the recent window",
+    ("stage", "call"), _gateway_values("p99_improvement_seconds"),
+))
+llm_circuit_state = registry.register(CallbackGauge(
+    "llm_circuit_state", "LLM circuit breaker state (1 for the current state)", ("state",), _circuit_state,
+))
+cache_hit_ratio = registry.register(CallbackGauge(
+    "cache_hit_ratio", "Hit ratio of the process caches since start", ("cache",), _cache_hit_ratios,
+))
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Observe the duration of a pipeline stage and count the exceptions it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        # Cancellation and generator close are not stage failures
+        stage_errors.inc(stage=stage)
+        raise
+    finally:
+        stage_duration.observe(time.perf_counter() - start, stage=stage)
+
+
+async def timed_stream(stage: str, chunks: AsyncIterator[T]) -> AsyncIterator[T]:
+    """
+    Re-yield a streamed stage, timing only the producer.
+
+    The clock runs while waiting for the next chunk and stops while the
+    consumer holds one, so a slow client does not inflate the stage latency.
+    Observes the time to the first chunk and, when the stream ends or is
+    closed, the total producer time.
+    """
+    elapsed = 0.0
+    first = True
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                elapsed += time.perf_counter() - start
+                break
+            except Exception:
+                elapsed += time.perf_counter() - start
+                stage_errors.inc(stage=stage)
+                raise
+            elapsed += time.perf_counter() - start
+            if first:
+                stage_first_chunk.observe(elapsed, stage=stage)
+                first = False
+            yield chunk
+    finally:
+        stage_duration.observe(elapsed, stage=stage)
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def record_llm_call(stage: str, cached: bool, prompt_tokens: int = 0, completion_tokens: int = 0):
+    """Count one completion and, when it reached the API, its token usage."""
+    llm_calls.inc(stage=stage, cache="hit" if cached else "miss")
+    if not cached:
+        llm_tokens.inc(prompt_tokens, stage=stage, kind="prompt")
+        llm_tokens.inc(completion_tokens, stage=stage, kind="completion")
+
+
+def record_llm_latency(stage: str, call: str, served: Optional[float], unhedged: Optional[float]):
+    """Observe one LLM request as served and, when known, as the first request alone would have taken."""
+    if served is not None:
+        llm_latency.observe(served, stage=stage, call=call, path="served")
+    if unhedged is not None:
+        llm_latency.observe(unhedged, stage=stage, call=call, path="unhedged")
+
+
+def record_llm_retry(stage: str):
+    llm_retries.inc(stage=stage)
+
+
+def record_hedge(stage: str, hedge_won: bool):
+    """Count one hedged request by the request that answered first."""
+    llm_hedges.inc(stage=stage, winner="hedge" if hedge_won else "primary")
+
+
+def record_orphaned_request(stage: str):
+    """Count one losing hedged request that could not be interrupted."""
+    llm_orphaned_requests.inc(stage=stage)
+
+
+def record_speculation(hit: bool):
+    """Count one speculative request; a hit skipped the second LLM call."""
+    speculations.inc(outcome="hit" if hit else "miss")
+
+
+def record_gate_decision(bypassed: bool):
+    """Count one gated request; a bypass skipped the rewrite call."""
+    gate_decisions.inc(decision="bypass" if bypassed else "rewrite")
+
+
+def record_question_cache(hit: bool):
+    """Count one near-duplicate question cache lookup."""
+    question_cache_lookups.inc(outcome="hit" if hit else "miss")
+
+
+def render_metrics() -> str:
+    """Every registered metric in Prometheus text exposition format (0.0.4)."""
+    return registry.render()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency per route template.
+
+    The clock stops at the final body chunk, so streaming responses are
+    measured in full rather than at their first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+        observed = False
+
+        def observe():
+            route = scope.get("route")
+            request_duration.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status["code"],
+            )
+
+        async def send_wrapper(message):
+            nonlocal observed
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not observed:
+                observed = True
+                observe()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not observed:
+                observed = True
+                observe()
@@ -0,0 +1,17 @@
+"""Pré-computa os artefatos por database do Spider (schema, conteúdo e estatísticas)
+
+Uso:
+    python -m data.build_artifacts --k 5
+"""
+import argparse
+
+from data.spider_loader import build_artifact_store
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pré-computa artefatos por database do Spider")
+    parser.add_argument("--k", type=int, default=5, help="Registros por tabela no conteúdo")
+    parser.add_argument("--output", default=None, help="Arquivo de saída")
+    parser.add_argument("--workers", type=int, default=None, help="Processos usados na extração")
+    args = parser.parse_args()
+    
+    build_artifact_store(k=args.k, output_path=args.output, workers=args.workers)
@@ -0,0 +1,213 @@
+"""Cache local dos splits do Spider em arquivos colunares (Arrow IPC)
+
+O primeiro carregamento de um split baixa o JSON do Hugging Face e o
+materializa num arquivo Arrow IPC sem compressão, registrado num manifesto
+com o checksum (sha256), o tamanho e o mtime do arquivo. Os carregamentos
+seguintes conferem só tamanho e mtime, mapeiam o arquivo em memória
+(memory-map) e leem só as colunas pedidas, sem rede e sem parse de JSON: o
+cold start passa a depender só do disco local. O sha256 (que lê o arquivo
+inteiro) só é recalculado quando o mtime mudou ou com verify=True.
+
+Colunas aninhadas que o Arrow não consegue tipar (ex.: a árvore "sql" do
+Spider, com listas de tipos mistos) são gravadas como texto JSON e
+decodificadas de volta ao carregar.
+
+Uso:
+    python -m data.dataset_cache dev train     # materializa os splits
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from loguru import logger
+
+DATASET_CACHE_DIR = os.path.join(".cache", "datasets")
+MANIFEST_NAME = "manifest.json"
+HF_SOURCE = "hf://datasets/aherntech/spider-realistic/{split}.json"
+DATASET_NAME = "spider-realistic"
+
+_MANIFEST_LOCK = threading.Lock()
+# Checksums já verificados neste processo (caminho -> (mtime_ns, tamanho))
+_VERIFIED = {}
+
+
+def _manifest_path(cache_dir: str) -> str:
+    return os.path.join(cache_dir, MANIFEST_NAME)
+
+
+def _read_manifest(cache_dir: str) -> dict:
+    path = _manifest_path(cache_dir)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(cache_dir: str, manifest: dict):
+    path = _manifest_path(cache_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _entry_key(split: str) -> str:
+    return f"{DATASET_NAME}/{split}"
+
+
+def _to_arrow(df: pd.DataFrame) -> tuple:
+    """DataFrame -> (tabela Arrow, colunas gravadas como JSON)."""
+    arrays, json_columns = {}, []
+    for column in df.columns:
+        values = df[column].tolist()
+        try:
+            arrays[column] = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            arrays[column] = pa.array([json.dumps(v, ensure_ascii=False) for v in values], type=pa.string())
+            json_columns.append(column)
+    return pa.table(arrays), json_columns
+
+
+def materialize_split(split: str = "dev", source: Optional[str] = None,
+                      cache_dir: str = DATASET_CACHE_DIR) -> dict:
+    """
+    Baixa um split e grava o arquivo colunar + entrada no manifesto.
+
+    Args:
+        split: Nome do split ("dev", "train", ...)
+        source: Origem do JSON (padrão: Hugging Face)
+        cache_dir: Diretório do cache
+
+    Returns:
+        Entrada do manifesto (arquivo, sha256, linhas, colunas, ...)
+    """
+    source = source or HF_SOURCE.format(split=split)
+    logger.info(f"Materializando {DATASET_NAME}/{split} de {source}...")
+    start = time.perf_counter()
+    df = pd.read_json(source)
+    table, json_columns = _to_arrow(df)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    file_name = f"{DATASET_NAME}-{split}.arrow"
+    path = os.path.join(cache_dir, file_name)
+    tmp_path = path + ".tmp"
+    # Sem compressão: o arquivo pode ser mapeado em memória sem cópia
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+    entry = {
+        "file": file_name,
+        "sha256": _sha256(path),
+        "size_bytes": os.path.getsize(path),
+        "mtime_ns": os.stat(path).st_mtime_ns,
+        "rows": table.num_rows,
+        "columns": table.column_names,
+        "json_columns": json_columns,
+        "source": source,
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    with _MANIFEST_LOCK:
+        manifest = _read_manifest(cache_dir)
+        manifest[_entry_key(split)] = entry
+        _write_manifest(cache_dir, manifest)
+
+    logger.info(f"{entry['rows']} exemplos gravados em {path} "
+                f"({entry['size_bytes'] / 1024:.0f} KiB, {time.perf_counter() - start:.1f}s)")
+    return entry
+
+
+def _valid_entry(entry: Optional[dict], cache_dir: str, verify: bool) -> bool:
+    """
+    O arquivo existe e confere com o manifesto.
+
+    Tamanho e mtime iguais aos do manifesto bastam; o sha256 só é recalculado
+    (uma vez por processo) com verify=True ou quando o mtime mudou. Neste
+    caso, se o conteúdo confere, o novo mtime é gravado na entrada.
+    """
+    if not entry:
+        return False
+    path = os.path.join(cache_dir, entry["file"])
+    if not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    if stat.st_size != entry["size_bytes"]:
+        return False
+    if not verify and entry.get("mtime_ns") == stat.st_mtime_ns:
+        return True
+    if _VERIFIED.get(path) != (stat.st_mtime_ns, stat.st_size):
+        if _sha256(path) != entry["sha256"]:
+            logger.warning(f"Checksum de {path} não confere com o manifesto")
+            return False
+        _VERIFIED[path] = (stat.st_mtime_ns, stat.st_size)
+    entry["mtime_ns"] = stat.st_mtime_ns
+    return True
+
+
+def load_split(split: str = "dev", columns: Optional[List[str]] = None, cache_dir: str = DATASET_CACHE_DIR,
+               verify: bool = False, refresh: bool = False) -> pd.DataFrame:
+    """
+    Carrega um split do cache local, materializando-o se preciso.
+
+    Args:
+        split: Nome do split
+        columns: Colunas lidas do arquivo (None = todas)
+        cache_dir: Diretório do cache
+        verify: Confere o sha256 do arquivo com o manifesto mesmo com o mtime
+            inalterado (lê o arquivo inteiro)
+        refresh: Baixa de novo mesmo com o cache válido
+
+    Returns:
+        DataFrame com as colunas pedidas (índice 0..n-1, como o JSON original)
+    """
+    entry = _read_manifest(cache_dir).get(_entry_key(split))
+    mtime = entry.get("mtime_ns") if entry else None
+    if refresh or not _valid_entry(entry, cache_dir, verify):
+        entry = materialize_split(split, cache_dir=cache_dir)
+    elif entry["mtime_ns"] != mtime:
+        # Conteúdo conferido pelo sha256: os próximos processos só comparam o mtime
+        with _MANIFEST_LOCK:
+            manifest = _read_manifest(cache_dir)
+            manifest[_entry_key(split)] = entry
+            _write_manifest(cache_dir, manifest)
+
+    path = os.path.join(cache_dir, entry["file"])
+    if columns is not None:
+        missing = [c for c in columns if c not in entry["columns"]]
+        if missing:
+            raise KeyError(f"Colunas ausentes em {DATASET_NAME}/{split}: {missing}")
+
+    table = feather.read_table(path, columns=columns, memory_map=True)
+    df = table.to_pandas()
+    for column in entry.get("json_columns", []):
+        if column in df.columns:
+            df[column] = [json.loads(v) for v in df[column]]
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Materializa splits do Spider-Realistic no cache local")
+    parser.add_argument("splits", nargs="*", default=["dev"], help="Splits (padrão: dev)")
+    parser.add_argument("--cache-dir", default=DATASET_CACHE_DIR)
+    parser.add_argument("--refresh", action="store_true", help="Baixa de novo mesmo com cache válido")
+    parser.add_argument("--verify", action="store_true", help="Confere o sha256 dos arquivos já materializados")
+    args = parser.parse_args()
+
+    for split in args.splits:
+        df = load_split(split, cache_dir=args.cache_dir, verify=args.verify, refresh=args.refresh)
+        print(f"{split}: {len(df)} exemplos, colunas {df.columns.tolist()}")
@@ -3,16 +3,28 @@ import pandas as pd
 import json
 import sqlite3
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from loguru import logger
-from typing import Dict, List
+from typing import Dict, List, Optional
+
+from data.dataset_cache import HF_SOURCE, load_split
 
 # Caminho para os arquivos do Spider
 SPIDER_DIR = "spider_data/spider_data"
 TABLES_JSON = os.path.join(SPIDER_DIR, "tables.json")
 DATABASE_DIR = os.path.join(SPIDER_DIR, "database")
+ARTIFACTS_DIR = os.path.join(SPIDER_DIR, "artifacts")
+
+# Colunas do dataset usadas por `prepare_examples`
+EXAMPLE_COLUMNS = ["question", "query", "db_id"]
 
 # Cache para schemas
 _TABLES_CACHE = None
+# Índice db_id -> entrada do tables.json
+_TABLES_INDEX = None
+# Artefatos pré-computados por caminho de arquivo
+_ARTIFACTS_CACHE = {}
 
 def load_tables_json():
     """Carrega tables.json com schemas de todas as databases"""
@@ -24,10 +36,30 @@ def load_tables_json():
         logger.info(f"{len(_TABLES_CACHE)} databases carregadas")
     return _TABLES_CACHE
 
-def load_spider_dataset(split="dev"):
-    """Carrega dataset Spider"""
+def load_tables_index() -> Dict[str, dict]:
+    """Índice db_id -> schema do tables.json (lookup O(1))"""
+    global _TABLES_INDEX
+    if _TABLES_INDEX is None:
+        _TABLES_INDEX = {db["db_id"]: db for db in load_tables_json()}
+    return _TABLES_INDEX
+
+def load_spider_dataset(split="dev", columns=None, use_cache=True):
+    """
+    Carrega dataset Spider
+    
+    Args:
+        split: Nome do split
+        columns: Colunas lidas (ex.: EXAMPLE_COLUMNS); None lê todas
+        use_cache: Usa o cache colunar local (ver `data.dataset_cache`);
+            False lê o JSON direto do Hugging Face
+    """
     logger.info(f"Carregando Spider ({split})...")
-    df = pd.read_json(f"hf://datasets/aherntech/spider-realistic/{split}.json")
+    if use_cache:
+        df = load_split(split, columns=columns)
+    else:
+        df = pd.read_json(HF_SOURCE.format(split=split))
+        if columns is not None:
+            df = df[columns]
     logger.info(f"{len(df)} exemplos carregados")
     return df
 
@@ -36,14 +68,8 @@ def extract_database_schema(db_id: str) -> str:
     Extrai schema do banco de dados do tables.json.
     Formato: CREATE TABLE statements
     """
-    tables_data = load_tables_json()
-    
     # Encontra o schema para o db_id
-    db_schema = None
-    for db in tables_data:
-        if db["db_id"] == db_id:
-            db_schema = db
-            break
+    db_schema = load_tables_index().get(db_id)
     
     if not db_schema:
         return f"-- Schema not found for database: {db_id}"
@@ -136,26 +162,270 @@ def extract_database_content(db_id: str, k: int = 5) -> str:
     
     return "\n".join(content_parts)
 
-def prepare_examples(df, limit=None):
+def extract_database_stats(db_id: str) -> dict:
+    """
+    Estatísticas de tabelas e colunas do banco SQLite.
+    
+    Returns:
+        Dict {tabela: {"row_count": n, "columns": {coluna: {"distinct": d, "nulls": z}}}}
+    """
+    db_path = os.path.join(DATABASE_DIR, db_id, f"{db_id}.sqlite")
+    
+    if not os.path.exists(db_path):
+        return {}
+    
+    stats = {}
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        
+        for (table_name,) in cursor.fetchall():
+            quoted_table = '"' + table_name.replace('"', '""') + '"'
+            try:
+                cursor.execute(f"SELECT * FROM {quoted_table} LIMIT 0")
+                col_names = [desc[0] for desc in cursor.description]
+                
+                # Uma única varredura por tabela para todas as colunas
+                selects = ["COUNT(*)"]
+                for col in col_names:
+                    quoted_col = '"' + col.replace('"', '""') + '"'
+                    selects.append(f"COUNT(DISTINCT {quoted_col})")
+                    selects.append(f"SUM({quoted_col} IS NULL)")
+                row = cursor.execute(f"SELECT {', '.join(selects)} FROM {quoted_table}").fetchone()
+                
+                stats[table_name] = {
+                    "row_count": row[0],
+                    "columns": {
+                        col: {"distinct": row[1 + 2 * i], "nulls": row[2 + 2 * i] or 0}
+                        for i, col in enumerate(col_names)
+                    }
+                }
+            except sqlite3.Error as e:
+                logger.warning(f"Erro ao calcular estatísticas de {db_id}.{table_name}: {e}")
+        
+        conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Erro ao conectar em {db_id}: {e}")
+    
+    return stats
+
+def _truncate_content(content: str, max_chars: Optional[int]) -> str:
+    """Limita o tamanho do texto de conteúdo (corta na última linha completa)"""
+    if max_chars is None or len(content) <= max_chars:
+        return content
+    cut = content.rfind("\n", 0, max_chars)
+    return content[:cut if cut > 0 else max_chars] + "\n-- ... (conteúdo truncado)"
+
+def _database_file_state(db_id: str) -> Optional[dict]:
+    """mtime e tamanho do arquivo .sqlite de uma database (None se não existir)"""
+    try:
+        stat = os.stat(os.path.join(DATABASE_DIR, db_id, f"{db_id}.sqlite"))
+    except OSError:
+        return None
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+def _extract_database_artifacts(db_id: str, k: int, with_stats: bool, max_content_chars: Optional[int]) -> dict:
+    """Extrai schema, conteúdo (e opcionalmente estatísticas) de uma database"""
+    artifacts = {
+        # Lido antes da extração: uma alteração durante ela também deixa a entrada desatualizada
+        "db_file": _database_file_state(db_id),
+        "schema": extract_database_schema(db_id),
+        "content": _truncate_content(extract_database_content(db_id, k=k), max_content_chars),
+    }
+    if with_stats:
+        artifacts["stats"] = extract_database_stats(db_id)
+    return artifacts
+
+def prepare_databases(
+    db_ids: List[str],
+    k: int = 5,
+    workers: Optional[int] = None,
+    with_stats: bool = False,
+    max_content_chars: Optional[int] = None,
+) -> Dict[str, dict]:
+    """
+    Extrai os artefatos de cada database exatamente uma vez.
+    
+    Args:
+        db_ids: Databases a preparar (duplicatas são ignoradas)
+        k: Registros por tabela no conteúdo
+        workers: Número de processos; None ou 1 executa no processo atual
+        with_stats: Também calcula as estatísticas de colunas
+        max_content_chars: Limite de caracteres do conteúdo de cada database.
+            Limita a memória ocupada pelos textos mantidos, mas corta o
+            conteúdo que vai para o prompt (muda as entradas do experimento)
+    
+    Returns:
+        Dict db_id -> {"db_file", "schema", "content"[, "stats"]}
+    """
+    db_ids = list(dict.fromkeys(db_ids))
+    total = len(db_ids)
+    if not total:
+        return {}
+    
+    logger.info(f"Preparando {total} databases (k={k}, workers={workers or 1})...")
+    start = time.perf_counter()
+    report_every = max(1, total // 10)
+    databases = {}
+    
+    def progress(done: int):
+        if done % report_every == 0 or done == total:
+            logger.info(f"  {done}/{total} databases ({time.perf_counter() - start:.1f}s)")
+    
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_extract_database_artifacts, db_id, k, with_stats, max_content_chars): db_id
+                for db_id in db_ids
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                databases[futures[future]] = future.result()
+                progress(done)
+    else:
+        for done, db_id in enumerate(db_ids, 1):
+            databases[db_id] = _extract_database_artifacts(db_id, k, with_stats, max_content_chars)
+            progress(done)
+    
+    held_chars = sum(len(db["content"]) for db in databases.values())
+    logger.info(f"Conteúdo mantido em memória: {held_chars:,} caracteres")
+    return databases
+
+def artifacts_path(k: int = 5) -> str:
+    """Caminho do arquivo de artefatos pré-computados para K registros por tabela"""
+    return os.path.join(ARTIFACTS_DIR, f"db_artifacts_k{k}.json")
+
+def build_artifact_store(k: int = 5, output_path: Optional[str] = None, workers: Optional[int] = None) -> str:
+    """
+    Pré-computa, para todas as databases do tables.json, o texto do schema,
+    o conteúdo com K registros por tabela e as estatísticas de colunas.
+    
+    Args:
+        k: Número de registros por tabela no conteúdo
+        output_path: Arquivo de saída (padrão: artifacts_path(k))
+        workers: Número de processos usados na extração
+    
+    Returns:
+        Caminho do arquivo gerado
+    """
+    output_path = output_path or artifacts_path(k)
+    db_ids = sorted(load_tables_index())
+    logger.info(f"Pré-computando artefatos de {len(db_ids)} databases (k={k})...")
+    
+    start = time.perf_counter()
+    prepared = prepare_databases(db_ids, k=k, workers=workers, with_stats=True)
+    databases = {db_id: prepared[db_id] for db_id in db_ids}
+    
+    _write_artifact_store(output_path, {
+        "k": k,
+        "tables_json_mtime": os.path.getmtime(TABLES_JSON),
+        "databases": databases,
+    })
+    
+    logger.info(f"Artefatos salvos em {output_path} ({time.perf_counter() - start:.1f}s)")
+    return output_path
+
+def _write_artifact_store(path: str, store: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(store, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def load_artifact_store(k: int = 5, path: Optional[str] = None) -> Optional[Dict[str, dict]]:
+    """
+    Carrega os artefatos pré-computados (db_id -> schema/content/stats).
+    
+    Cada entrada guarda o mtime e o tamanho do .sqlite de que foi extraída;
+    as entradas cujo arquivo mudou (ou de arquivos gerados antes disso) são
+    extraídas de novo e regravadas no arquivo.
+    
+    Returns:
+        Dict indexado por db_id, ou None se o arquivo não existir ou estiver
+        desatualizado em relação ao tables.json
+    """
+    path = path or artifacts_path(k)
+    store = _ARTIFACTS_CACHE.get(path)
+    if store is None:
+        if not os.path.exists(path):
+            return None
+        
+        with open(path, "r", encoding="utf-8") as f:
+            store = json.load(f)
+        
+        if store.get("k") != k:
+            logger.warning(f"Artefatos em {path} usam k={store.get('k')} (esperado {k}); ignorando")
+            return None
+        if os.path.exists(TABLES_JSON) and store.get("tables_json_mtime") != os.path.getmtime(TABLES_JSON):
+            logger.warning(f"Artefatos em {path} estão desatualizados; rode `python -m data.build_artifacts`")
+            return None
+        logger.info(f"Artefatos de {len(store['databases'])} databases carregados de {path}")
+        _ARTIFACTS_CACHE[path] = store
+    
+    databases = store["databases"]
+    stale = [db_id for db_id, entry in databases.items() if entry.get("db_file") != _database_file_state(db_id)]
+    if stale:
+        logger.info(f"{len(stale)} databases mudaram desde a extração dos artefatos; extraindo de novo")
+        databases.update(prepare_databases(stale, k=k, with_stats=True))
+        _write_artifact_store(path, store)
+    return databases
+
+def prepare_examples(df, limit=None, use_artifacts=True, workers=None, max_content_chars=None,
+                     content_mode="rows", content_budget=None):
     """
     Prepara exemplos com schema e conteúdo do banco.
     
-    Carrega schemas de tables.json e conteúdo de arquivos SQLite.
+    Usa os artefatos pré-computados (ver `build_artifact_store`) quando
+    disponíveis. As databases restantes são agrupadas por db_id e
+    preparadas uma única vez cada (schema do tables.json + K=5 registros do
+    SQLite), opcionalmente em paralelo num pool de processos; exemplos da
+    mesma database compartilham os mesmos textos.
+    
+    Args:
+        df: DataFrame do Spider
+        limit: Número máximo de exemplos
+        use_artifacts: Usa os artefatos pré-computados se existirem
+        workers: Processos para preparar as databases (None = sequencial)
+        max_content_chars: Limite de caracteres do conteúdo por database (ver
+            `prepare_databases`: corta o texto do prompt; no modo "values" não
+            se aplica ao conteúdo por questão). Os artefatos pré-computados
+            guardam o conteúdo inteiro e são cortados aqui
+        content_mode: "rows" (K=5 primeiros registros de cada tabela) ou
+            "values" (valores relevantes à questão, ver `data.value_index`)
+        content_budget: Bytes do conteúdo por questão no modo "values"
     """
     if limit:
         df = df.head(limit)
+    if content_mode == "values":
+        # Import tardio: data.value_index depende deste módulo
+        from data.value_index import DEFAULT_CONTENT_BUDGET, extract_relevant_content
+    
+    artifacts = load_artifact_store(k=5) if use_artifacts else None
+    db_ids = df["db_id"].unique()
+    
+    databases = {}
+    if artifacts is not None:
+        for db_id in db_ids:
+            if db_id in artifacts:
+                databases[db_id] = {
+                    "schema": artifacts[db_id]["schema"],
+                    "content": _truncate_content(artifacts[db_id]["content"], max_content_chars),
+                }
+    
+    missing = [db_id for db_id in db_ids if db_id not in databases]
+    databases.update(prepare_databases(missing, k=5, workers=workers, max_content_chars=max_content_chars))
     
     examples = []
-    for idx, row in df.iterrows():
+    for idx, row in zip(df.index, df.to_dict("records")):
         db_id = row.get("db_id", "")
-        
-        logger.info(f"Carregando schema e conteúdo para {db_id}...")
-        
-        # Extrai schema do tables.json
-        schema_str = extract_database_schema(db_id)
-        
-        # Extrai K=5 registros do SQLite
-        content_str = extract_database_content(db_id, k=5)
+        database = databases[db_id]
+        schema_str = database["schema"]
+        if content_mode == "values":
+            content_str = extract_relevant_content(
+                db_id, row.get("question", ""), content_budget or DEFAULT_CONTENT_BUDGET
+            )
+        else:
+            content_str = database["content"]
         
         examples.append({
             "id": idx,
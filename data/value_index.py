@@ -0,0 +1,340 @@
+"""Índice de valores das células (SQLite FTS5) para montar o conteúdo por questão
+
+Em vez de despejar os K primeiros registros de cada tabela, cada database
+ganha um índice FTS5 (tokenizer trigram) com os valores textuais distintos
+de todas as colunas. Na hora da requisição, só os valores que casam com os
+termos da questão entram no `db_content`, dentro de um orçamento de bytes.
+
+O índice é construído uma vez por database e reconstruído quando o arquivo
+SQLite muda (mtime/tamanho). Tempo de construção, tamanho em disco e
+latência das buscas ficam disponíveis em `value_index_stats()`.
+
+Uso:
+    python -m data.value_index                 # indexa todas as databases
+    python -m data.value_index --db-id concert_singer --question "singers from France"
+"""
+import argparse
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from data.spider_loader import DATABASE_DIR, SPIDER_DIR
+
+VALUE_INDEX_DIR = os.path.join(SPIDER_DIR, "value_index")
+# Incrementar quando o formato do índice mudar (força reconstrução)
+INDEX_VERSION = 1
+# Valores maiores que isso não são indexados (textos longos raramente são literais de WHERE)
+MAX_VALUE_CHARS = 200
+# Valores distintos indexados por coluna
+MAX_VALUES_PER_COLUMN = 50_000
+# Orçamento padrão do conteúdo montado por questão
+DEFAULT_CONTENT_BUDGET = 2_000
+# Candidatos lidos do FTS por busca e valores mostrados por coluna
+LOOKUP_LIMIT = 200
+MAX_VALUES_SHOWN_PER_COLUMN = 5
+# Fração mínima do valor coberta pelos termos da questão
+MIN_SCORE = 0.5
+
+_STOPWORDS = {
+    "the", "and", "for", "with", "from", "what", "which", "who", "whom", "whose", "how", "many",
+    "much", "are", "was", "were", "been", "does", "did", "list", "show", "give", "find", "return",
+    "all", "each", "every", "that", "this", "these", "those", "there", "their", "than", "more",
+    "less", "most", "least", "number", "count", "name", "names", "have", "has", "of", "in", "on",
+}
+
+
+def value_index_path(db_id: str) -> str:
+    """Caminho do índice de valores de uma database"""
+    return os.path.join(VALUE_INDEX_DIR, f"{db_id}.fts.sqlite")
+
+
+def _fts_tokenizer() -> str:
+    """trigram (SQLite >= 3.34) casa substrings; senão cai para unicode61 (palavras inteiras)"""
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE t USING fts5(v, tokenize='trigram')")
+        return "trigram"
+    except sqlite3.OperationalError:
+        return "unicode61"
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def build_value_index(db_path: str, index_path: str) -> dict:
+    """
+    Constrói o índice FTS5 de valores distintos de uma database.
+
+    Args:
+        db_path: Arquivo SQLite de origem
+        index_path: Arquivo do índice (substituído atomicamente)
+
+    Returns:
+        Metadados do índice (valores, tempo de construção, tamanho em disco)
+    """
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    tmp_path = index_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    tokenizer = _fts_tokenizer()
+    source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    index = sqlite3.connect(tmp_path)
+    values = 0
+    try:
+        index.execute(f"CREATE VIRTUAL TABLE cell_values USING fts5(value, tbl UNINDEXED, col UNINDEXED, "
+                      f"tokenize='{tokenizer}')")
+        index.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value)")
+
+        tables = [name for (name,) in source.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        for table in tables:
+            try:
+                columns = [desc[0] for desc in source.execute(f"SELECT * FROM {_quote(table)} LIMIT 0").description]
+            except sqlite3.Error as e:
+                logger.warning(f"Erro ao ler {table} de {db_path}: {e}")
+                continue
+            for column in columns:
+                rows = source.execute(
+                    f"SELECT DISTINCT {_quote(column)} FROM {_quote(table)} "
+                    f"WHERE typeof({_quote(column)}) = 'text' AND length({_quote(column)}) BETWEEN 1 AND ? "
+                    f"LIMIT ?",
+                    (MAX_VALUE_CHARS, MAX_VALUES_PER_COLUMN),
+                )
+                batch = [(value, table, column) for (value,) in rows]
+                index.executemany("INSERT INTO cell_values (value, tbl, col) VALUES (?, ?, ?)", batch)
+                values += len(batch)
+
+        index.execute("INSERT INTO cell_values (cell_values) VALUES ('optimize')")
+        stat = os.stat(db_path)
+        build_seconds = time.perf_counter() - start
+        meta = {
+            "version": INDEX_VERSION,
+            "tokenizer": tokenizer,
+            "source_mtime": stat.st_mtime,
+            "source_size": stat.st_size,
+            "values": values,
+            "build_seconds": build_seconds,
+        }
+        index.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", meta.items())
+        index.commit()
+    finally:
+        source.close()
+        index.close()
+
+    os.replace(tmp_path, index_path)
+    meta["size_bytes"] = os.path.getsize(index_path)
+    logger.info(f"Índice de valores de {os.path.basename(db_path)}: {values:,} valores, "
+                f"{meta['size_bytes'] / 1024:.0f} KiB em {build_seconds:.2f}s")
+    return meta
+
+
+def _question_terms(question: str) -> List[str]:
+    """Termos de busca da questão: trechos entre aspas e palavras (sem stopwords)."""
+    terms = [q.lower() for q in re.findall(r"[\"“']([^\"”']{3,})[\"”']", question)]
+    for word in re.findall(r"\w+", question.lower()):
+        if len(word) < 3 or word in _STOPWORDS:
+            continue
+        # Plural simples: "singers" também deve casar "Singer"
+        if len(word) > 4 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return list(dict.fromkeys(terms))
+
+
+class ValueIndex:
+    """Índice de valores de uma database (conexão somente leitura ao arquivo FTS)."""
+
+    def __init__(self, db_path: str, index_path: str):
+        self.db_path = db_path
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        meta = self._current_meta()
+        if meta is None:
+            meta = build_value_index(db_path, index_path)
+        else:
+            meta["size_bytes"] = os.path.getsize(index_path)
+        self.meta = meta
+        self._conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True, check_same_thread=False)
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+
+    def _current_meta(self) -> Optional[dict]:
+        """Metadados do índice em disco, ou None se não existir ou estiver desatualizado."""
+        if not os.path.exists(self.index_path):
+            return None
+        try:
+            conn = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True)
+            try:
+                meta = dict(conn.execute("SELECT key, value FROM meta"))
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+        stat = os.stat(self.db_path)
+        if (meta.get("version") != INDEX_VERSION or meta.get("source_mtime") != stat.st_mtime
+                or meta.get("source_size") != stat.st_size):
+            return None
+        return meta
+
+    def lookup(self, question: str, limit: int = LOOKUP_LIMIT) -> List[Tuple[str, str, str, float]]:
+        """
+        Valores que casam com os termos da questão.
+
+        Returns:
+            Lista (tabela, coluna, valor, score) em ordem decrescente de score;
+            o score é a fração do valor coberta pelos termos (+1 se o valor
+            inteiro aparece na questão)
+        """
+        start = time.perf_counter()
+        terms = _question_terms(question)
+        if self.meta.get("tokenizer") == "trigram":
+            terms = [t for t in terms if len(t) >= 3]
+        if not terms:
+            return []
+
+        match = " OR ".join('"' + t.replace('"', '""') + '"' for t in terms)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT tbl, col, value FROM cell_values WHERE cell_values MATCH ? ORDER BY rank LIMIT ?",
+                (match, limit),
+            ).fetchall()
+
+        question_lower = question.lower()
+        matches = []
+        for table, column, value in rows:
+            lowered = value.lower()
+            covered = sum(len(t) for t in terms if t in lowered)
+            score = min(covered / len(lowered), 1.0) + (1.0 if lowered in question_lower else 0.0)
+            if score >= MIN_SCORE:
+                matches.append((table, column, value, score))
+        matches.sort(key=lambda m: -m[3])
+
+        self.lookups += 1
+        self.lookup_seconds += time.perf_counter() - start
+        return matches
+
+    def build_content(self, question: str, budget_bytes: int = DEFAULT_CONTENT_BUDGET) -> str:
+        """
+        Conteúdo do banco relevante à questão, no formato "Table: ..." dos
+        registros, limitado a `budget_bytes` (UTF-8).
+
+        Cada tabela lista, por coluna, os valores que casaram:
+            Table: singer
+              Country: 'France', 'Netherlands'
+        """
+        grouped: "OrderedDict[str, OrderedDict[str, List[str]]]" = OrderedDict()
+        for table, column, value, _ in self.lookup(question):
+            values = grouped.setdefault(table, OrderedDict()).setdefault(column, [])
+            if len(values) < MAX_VALUES_SHOWN_PER_COLUMN:
+                values.append(value)
+
+        lines, used = [], 0
+        for table, columns in grouped.items():
+            block = [f"Table: {table}"]
+            block.extend(
+                f"  {column}: " + ", ".join("'" + v.replace("'", "''") + "'" for v in values)
+                for column, values in columns.items()
+            )
+            block.append("")
+            size = sum(len(line.encode("utf-8")) + 1 for line in block)
+            if used + size > budget_bytes:
+                break
+            lines.extend(block)
+            used += size
+        return "\n".join(lines)
+
+    def stats(self) -> dict:
+        return {
+            "values": self.meta.get("values", 0),
+            "build_seconds": self.meta.get("build_seconds", 0.0),
+            "size_bytes": self.meta.get("size_bytes", 0),
+            "lookups": self.lookups,
+            "avg_lookup_ms": self.lookup_seconds / self.lookups * 1000 if self.lookups else 0.0,
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+# Índices abertos por db_id (um por processo)
+_INDEXES: Dict[str, ValueIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_value_index(db_id: str, db_path: Optional[str] = None) -> ValueIndex:
+    """Índice de valores de uma database, construído na primeira chamada se preciso."""
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(db_id)
+        if index is None:
+            db_path = db_path or os.path.join(DATABASE_DIR, db_id, f"{db_id}.sqlite")
+            index = ValueIndex(db_path, value_index_path(db_id))
+            _INDEXES[db_id] = index
+        return index
+
+
+def extract_relevant_content(db_id: str, question: str, budget_bytes: int = DEFAULT_CONTENT_BUDGET) -> str:
+    """
+    Substituto de `extract_database_content` orientado pela questão.
+
+    Args:
+        db_id: ID do banco de dados
+        question: Questão em linguagem natural
+        budget_bytes: Tamanho máximo do conteúdo (UTF-8)
+
+    Returns:
+        Valores das células relevantes à questão (vazio se nada casar)
+    """
+    db_path = os.path.join(DATABASE_DIR, db_id, f"{db_id}.sqlite")
+    if not os.path.exists(db_path):
+        return f"-- Database file not found: {db_path}"
+    try:
+        return get_value_index(db_id, db_path).build_content(question, budget_bytes)
+    except sqlite3.Error as e:
+        return f"-- Error reading value index: {e}"
+
+
+def value_index_stats() -> Dict[str, dict]:
+    """Estatísticas dos índices abertos neste processo (por db_id)."""
+    with _INDEXES_LOCK:
+        return {db_id: index.stats() for db_id, index in _INDEXES.items()}
+
+
+def log_value_index_stats():
+    """Resumo agregado das construções e buscas (tempo, tamanho, latência)."""
+    stats = value_index_stats()
+    if not stats:
+        return
+    lookups = sum(s["lookups"] for s in stats.values())
+    lookup_ms = sum(s["avg_lookup_ms"] * s["lookups"] for s in stats.values())
+    logger.info(
+        f"Índice de valores: {len(stats)} databases, "
+        f"{sum(s['size_bytes'] for s in stats.values()) / 1024 / 1024:.1f} MiB em disco, "
+        f"construção {sum(s['build_seconds'] for s in stats.values()):.2f}s, "
+        f"{lookups} buscas ({lookup_ms / lookups if lookups else 0.0:.2f} ms em média)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice de valores (FTS5) das databases do Spider")
+    parser.add_argument("--db-id", action="append", default=None, help="Database (repetível; padrão: todas)")
+    parser.add_argument("--question", default=None, help="Mostra o conteúdo montado para esta questão")
+    parser.add_argument("--budget", type=int, default=DEFAULT_CONTENT_BUDGET, help="Orçamento em bytes")
+    args = parser.parse_args()
+
+    db_ids = args.db_id or sorted(
+        d for d in os.listdir(DATABASE_DIR) if os.path.isdir(os.path.join(DATABASE_DIR, d))
+    )
+    for db_id in db_ids:
+        index = get_value_index(db_id)
+        if args.question:
+            print(index.build_content(args.question, args.budget))
+    for db_id, stats in value_index_stats().items():
+        print(f"{db_id}: {stats['values']:,} valores, {stats['size_bytes'] / 1024:.0f} KiB, "
+              f"construção {stats['build_seconds']:.2f}s, busca {stats['avg_lookup_ms']:.2f} ms")
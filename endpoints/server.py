@@ -1,7 +1,9 @@
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
+from core.telemetry import MetricsMiddleware, render_metrics
 from endpoints.init import api_router
 
 app = FastAPI(
@@ -19,11 +21,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency per route (exposed on /metrics)
+app.add_middleware(MetricsMiddleware)
+
 # Health check endpoint
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
 
+# Prometheus scrape endpoint: request/stage latency, LLM tokens, cache hit ratios, errors
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 app.include_router(api_router, prefix="/api/v1")
 
 
@@ -1,11 +1,21 @@
-from fastapi import APIRouter
-from pydantic import BaseModel
-from typing import Optional
+import asyncio
+import json
+import time
+from fastapi import APIRouter, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 from loguru import logger
+import anyio
+from core.config import settings
+from core.question_cache import QuestionCacheMatch, get_question_cache, schema_scope
+from core.schema_linking import link_schema
+from core.telemetry import record_question_cache
 from experiments.question_rewriting import (
-    generate_sql_from_question,
-    generate_sql_with_rewriting,
-    load_schema_and_content_from_file,
+    generate_sql_with_rewriting_async,
+    load_schema_and_content_from_file_async,
+    rewrite_question_async,
+    stream_sql_from_question,
 )
 
 router = APIRouter()
@@ -16,16 +26,90 @@ class PromptPayload(BaseModel):
     prompt: str
     schema: str  # SQL CREATE TABLE statements - REQUIRED
     db_content: Optional[str] = None  # Sample database records for question rewriting
+    use_cache: Optional[bool] = None  # Reuse cached LLM responses (default: LLM_CACHE_API_DEFAULT)
+    rewrite_mode: Literal["always", "speculative", "gate"] = "always"  # See /generate-sql
 
 
 class PromptPayloadWithFile(BaseModel):
     """Request body for SQL generation with schema file containing both schema and records"""
     prompt: str
     schema_file_path: str  # File containing both schema and records - REQUIRED
+    use_cache: Optional[bool] = None  # Reuse cached LLM responses (default: LLM_CACHE_API_DEFAULT)
+    rewrite_mode: Literal["always", "speculative", "gate"] = "always"  # See /generate-sql
+
+
+class BatchPromptPayload(BaseModel):
+    """Request body for generating SQL for many questions against one schema"""
+    prompts: List[str] = Field(min_length=1)  # Natural language questions - REQUIRED
+    schema: str  # SQL CREATE TABLE statements shared by every prompt - REQUIRED
+    db_content: Optional[str] = None  # Sample database records for question rewriting
+    max_concurrency: int = Field(default=8, ge=1, le=64)  # Generations in flight for this request
+    use_cache: Optional[bool] = None  # Reuse cached LLM responses (default: LLM_CACHE_API_DEFAULT)
+    rewrite_mode: Literal["always", "speculative", "gate"] = "always"  # See /generate-sql
+
+
+QUESTION_CACHE_HEADER = "X-Question-Cache"
+
+
+def _use_cache(payload) -> bool:
+    """The request's use_cache, falling back to the server default."""
+    return settings.LLM_CACHE_API_DEFAULT if payload.use_cache is None else payload.use_cache
+
+
+def _response(result: dict) -> dict:
+    """Response body for one generation: SQL, schema-linking, speculation and gate stats."""
+    response = {"SQL": result["generated_sql"], "schema_linking": result["schema_linking"]}
+    for key in ("speculation", "gate"):
+        if key in result:
+            response[key] = result[key]
+    return response
+
+
+async def _generate(
+    question: str, db_schema: str, db_content: str, use_cache: bool, rewrite_mode: str
+) -> tuple[dict, Optional[QuestionCacheMatch]]:
+    """
+    Run the rewriting pipeline, reusing the answer of a near-duplicate question.
+    
+    A cached answer is only served when use_cache is True; fresh answers are
+    always stored, so a use_cache=False request also refreshes the entry.
+    
+    Returns:
+        (pipeline result, the question-cache match or None if it was generated)
+    """
+    cache = get_question_cache()
+    scope = schema_scope(db_schema, db_content) if cache is not None else None
+    if cache is not None and use_cache:
+        match = cache.lookup(scope, question)
+        record_question_cache(match is not None)
+        if match is not None:
+            logger.info(f"Question cache hit (score {match.score:.3f}): {match.matched_question}")
+            return {"original_question": question, **match.result}, match
+    
+    result = await generate_sql_with_rewriting_async(
+        question=question,
+        db_schema=db_schema,
+        db_content=db_content,
+        use_cache=use_cache,
+        rewrite_mode=rewrite_mode
+    )
+    if cache is not None and result["generated_sql"]:
+        cache.put(scope, question, {
+            "rewritten_question": result["rewritten_question"],
+            "generated_sql": result["generated_sql"],
+            "schema_linking": result["schema_linking"],
+        })
+    return result, None
+
+
+def _set_question_cache_header(response: Response, match: Optional[QuestionCacheMatch]):
+    """Debug header with the matched question and its similarity score."""
+    if get_question_cache() is not None:
+        response.headers[QUESTION_CACHE_HEADER] = match.header() if match is not None else "miss"
 
 
 @router.post("/generate-sql", tags=["Projeto TAES"])
-def generate_sql(payload: PromptPayload):
+async def generate_sql(payload: PromptPayload, response: Response):
     """
     Generate SQL from a user prompt and required schema.
     Uses question rewriting methodology from DART-SQL.
@@ -35,28 +119,119 @@ def generate_sql(payload: PromptPayload):
             - prompt: User's natural language question (required)
             - schema: SQL CREATE TABLE statement(s) (required)
             - db_content: Optional sample database records for question rewriting
+            - use_cache: Whether to reuse cached LLM responses (default
+              LLM_CACHE_API_DEFAULT, off)
+            - rewrite_mode: "always" (rewrite, then generate), "speculative"
+              (generate from the original question while rewriting; kept when
+              the rewrite leaves the question essentially unchanged) or "gate"
+              (skip rewriting when the question already uses the schema's
+              table/column names and values)
+    
+    A near-duplicate of a question already answered for the same schema
+    reuses that answer without calling the LLM (see core.question_cache);
+    the X-Question-Cache header reports "miss" or the matched question and
+    its similarity score.
     
     Returns:
-        Dictionary with generated SQL query
+        Dictionary with generated SQL query, schema-linking stats (tables
+        kept, prompt tokens saved) and, depending on the mode, "speculation"
+        {"hit", "similarity"} or "gate" {"coverage", "bypassed"}
     """
     logger.info(f"Generating SQL with prompt: {payload.prompt}")
     
     try:
         db_schema = payload.schema.strip()
         db_content = payload.db_content or ""
-        result = generate_sql_with_rewriting(
-            question=payload.prompt,
-            db_schema=db_schema,
-            db_content=db_content
+        result, match = await _generate(
+            payload.prompt, db_schema, db_content, _use_cache(payload), payload.rewrite_mode
         )
-        return {"SQL": result["generated_sql"]}
+        _set_question_cache_header(response, match)
+        return _response(result)
     except Exception as e:
         logger.error(f"Error generating SQL: {e}")
         return {"error": str(e)}
 
 
+def _sse(event: str, data: dict) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/generate-sql-stream", tags=["Projeto TAES"])
+async def generate_sql_stream(payload: PromptPayload):
+    """
+    Streaming variant of /generate-sql using server-sent events.
+    
+    Events, in order:
+        - rewrite: {"rewritten_question", "elapsed_ms"} as soon as rewriting finishes
+        - sql_delta: {"delta"} for each piece of the SQL completion
+        - done: {"SQL", "rewritten_question", "timings", "schema_linking"} with the
+          cleaned SQL, rewrite/first-token/generation/total timings in milliseconds
+          and schema-linking stats
+        - error: {"error"} if any stage fails
+    
+    The rewrite is always awaited before generation here, since it is
+    streamed to the client as its own event; rewrite_mode is ignored.
+    
+    Args:
+        payload: PromptPayload (same body as /generate-sql)
+    
+    Returns:
+        text/event-stream response
+    """
+    logger.info(f"Streaming SQL with prompt: {payload.prompt}")
+    
+    db_schema = payload.schema.strip()
+    db_content = payload.db_content or ""
+    
+    async def events():
+        started = time.perf_counter()
+        elapsed_ms = lambda: (time.perf_counter() - started) * 1000
+        try:
+            linking = await anyio.to_thread.run_sync(link_schema, payload.prompt, db_schema, db_content)
+            rewritten_question = await rewrite_question_async(
+                payload.prompt, linking.content, use_cache=_use_cache(payload)
+            )
+            rewrite_ms = elapsed_ms()
+            yield _sse("rewrite", {"rewritten_question": rewritten_question, "elapsed_ms": rewrite_ms})
+            
+            first_token_ms = None
+            sql = ""
+            async for kind, value in stream_sql_from_question(
+                rewritten_question, linking.schema, use_cache=_use_cache(payload)
+            ):
+                if kind == "delta":
+                    if first_token_ms is None:
+                        first_token_ms = elapsed_ms()
+                    yield _sse("sql_delta", {"delta": value})
+                else:
+                    sql = value
+            
+            total_ms = elapsed_ms()
+            yield _sse("done", {
+                "SQL": sql,
+                "rewritten_question": rewritten_question,
+                "timings": {
+                    "rewrite_ms": rewrite_ms,
+                    "first_token_ms": first_token_ms,
+                    "generation_ms": total_ms - rewrite_ms,
+                    "total_ms": total_ms,
+                },
+                "schema_linking": linking.stats(),
+            })
+        except Exception as e:
+            logger.error(f"Error streaming SQL: {e}")
+            yield _sse("error", {"error": str(e)})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/generate-sql-with-file", tags=["Projeto TAES"])
-def generate_sql_with_file(payload: PromptPayloadWithFile):
+async def generate_sql_with_file(payload: PromptPayloadWithFile, response: Response):
     """
     Generate SQL from a user prompt and required schema file.
     
@@ -73,22 +248,92 @@ def generate_sql_with_file(payload: PromptPayloadWithFile):
         payload: PromptPayloadWithFile containing:
             - prompt: User's natural language question (required)
             - schema_file_path: Path to JSON schema file containing both schema and records (required)
+            - use_cache: Whether to reuse cached LLM responses (default
+              LLM_CACHE_API_DEFAULT, off)
+            - rewrite_mode: "always" (rewrite, then generate), "speculative"
+              (generate from the original question while rewriting; kept when
+              the rewrite leaves the question essentially unchanged) or "gate"
+              (skip rewriting when the question already uses the schema's
+              table/column names and values)
     
     Returns:
-        Dictionary with generated SQL query
+        Dictionary with generated SQL query, schema-linking stats (tables
+        kept, prompt tokens saved) and, depending on the mode, "speculation"
+        {"hit", "similarity"} or "gate" {"coverage", "bypassed"}; the
+        X-Question-Cache header is set as in /generate-sql
     """
     logger.info(f"Generating SQL with file: {payload.schema_file_path}")
     
     try:
         # Load both schema and content from the file (required)
-        db_schema, db_content = load_schema_and_content_from_file(payload.schema_file_path)
+        db_schema, db_content = await load_schema_and_content_from_file_async(payload.schema_file_path)
         
-        result = generate_sql_with_rewriting(
-            question=payload.prompt,
-            db_schema=db_schema,
-            db_content=db_content
+        result, match = await _generate(
+            payload.prompt, db_schema, db_content, _use_cache(payload), payload.rewrite_mode
         )
-        return {"SQL": result["generated_sql"]}
+        _set_question_cache_header(response, match)
+        return _response(result)
     except Exception as e:
         logger.error(f"Error generating SQL: {e}")
         return {"error": str(e)}
+
+
+@router.post("/generate-sql-batch", tags=["Projeto TAES"])
+async def generate_sql_batch(payload: BatchPromptPayload):
+    """
+    Generate SQL for several prompts that share the same schema and records.
+    
+    The schema and content are sent and prepared once; the prompts run
+    concurrently (at most max_concurrency at a time) and results come back
+    in input order. A failing prompt yields a per-item error instead of
+    failing the whole batch.
+    
+    Args:
+        payload: BatchPromptPayload containing:
+            - prompts: List of natural language questions (required)
+            - schema: SQL CREATE TABLE statement(s) (required)
+            - db_content: Optional sample database records for question rewriting
+            - max_concurrency: Maximum prompts processed at once (default 8)
+            - use_cache: Whether to reuse cached LLM responses (default
+              LLM_CACHE_API_DEFAULT, off)
+            - rewrite_mode: "always", "speculative" or "gate" (see /generate-sql)
+    
+    Returns:
+        Dictionary with per-item results and total/per-item latency in
+        milliseconds; items answered from the near-duplicate question cache
+        carry "question_cache" {"hit", "score", "entry", "matched_question"}
+    """
+    logger.info(f"Generating SQL batch with {len(payload.prompts)} prompt(s)")
+    
+    db_schema = payload.schema.strip()
+    db_content = payload.db_content or ""
+    semaphore = asyncio.Semaphore(payload.max_concurrency)
+    
+    async def run_item(index: int, prompt: str) -> dict:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                result, match = await _generate(
+                    prompt, db_schema, db_content, _use_cache(payload), payload.rewrite_mode
+                )
+                item = {"index": index, "prompt": prompt, **_response(result)}
+                if match is not None:
+                    item["question_cache"] = match.stats()
+            except Exception as e:
+                logger.error(f"Error generating SQL for batch item {index}: {e}")
+                item = {"index": index, "prompt": prompt, "error": str(e)}
+            item["latency_ms"] = (time.perf_counter() - started) * 1000
+            return item
+    
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(run_item(i, prompt) for i, prompt in enumerate(payload.prompts))
+    )
+    total_latency_ms = (time.perf_counter() - started) * 1000
+    
+    return {
+        "results": results,
+        "total_latency_ms": total_latency_ms,
+        "sum_item_latency_ms": sum(item["latency_ms"] for item in results),
+        "errors": sum(1 for item in results if "error" in item),
+    }
@@ -0,0 +1,96 @@
+"""Microbenchmark do Exact-Set-Match: extração por regex vs parser com cache
+
+Mede o custo das métricas textuais (EM, String Exact Match e Token Overlap)
+sobre pares (predição, gold). A versão com regex refaz a extração para cada
+métrica; a versão com parser analisa cada string uma vez (cache frio) e
+reaproveita as análises na passada seguinte, como no segundo baseline.
+
+Uso:
+    python -m evaluation.benchmark_em                      # gold do dev vs ele mesmo
+    python -m evaluation.benchmark_em --results results/experiment_dart_sql_X.json
+"""
+import argparse
+import json
+import time
+
+from evaluation.metrics import extract_sql_clauses, exact_set_match, exact_match, token_overlap
+from evaluation.sql_parser import analyze_sql, normalize_sql
+
+
+def load_pairs(results_path: str = None) -> list:
+    """Pares (predição, gold) de um JSON de experimento, ou do dev do Spider."""
+    if results_path:
+        with open(results_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        records = data["baseline_1_zero_shot_results"] + data["baseline_2_rw_enhanced_results"]
+        return [(r.get("predicted_sql", ""), r.get("ground_truth_sql", "")) for r in records]
+
+    from data.spider_loader import load_spider_dataset
+    queries = load_spider_dataset("dev", columns=["query"])["query"].tolist()
+    return [(q, q) for q in queries]
+
+
+def _regex_metrics(pairs: list):
+    for pred, gold in pairs:
+        extract_sql_clauses(pred) == extract_sql_clauses(gold)
+        normalize_sql(pred) == normalize_sql(gold)
+        set(normalize_sql(pred).split()) & set(normalize_sql(gold).split())
+
+
+def _parser_metrics(pairs: list):
+    for pred, gold in pairs:
+        exact_set_match(pred, gold)
+        exact_match(pred, gold)
+        token_overlap(pred, gold)
+
+
+def _timed(fn, pairs: list, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(pairs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark(pairs: list, repeat: int = 5) -> dict:
+    regex_time = _timed(_regex_metrics, pairs, repeat)
+
+    def cold(p):
+        analyze_sql.cache_clear()
+        _parser_metrics(p)
+
+    cold_time = _timed(cold, pairs, repeat)
+    warm_time = _timed(_parser_metrics, pairs, repeat)
+
+    analyses = {sql: analyze_sql(sql) for pair in pairs for sql in pair}
+    failures = sum(1 for a in analyses.values() if a.components is None)
+    agreement = sum(
+        (extract_sql_clauses(p) == extract_sql_clauses(g)) == exact_set_match(p, g) for p, g in pairs
+    )
+    return {
+        "pairs": len(pairs),
+        "distinct_queries": len(analyses),
+        "parse_failures": failures,
+        "regex_seconds": regex_time,
+        "parser_cold_seconds": cold_time,
+        "parser_warm_seconds": warm_time,
+        "em_agreement": agreement / len(pairs) if pairs else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do EM: regex vs parser")
+    parser.add_argument("--results", default=None, help="JSON de um experimento (padrão: dev do Spider)")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetições (melhor tempo)")
+    args = parser.parse_args()
+
+    report = run_benchmark(load_pairs(args.results), repeat=args.repeat)
+    n = report["pairs"]
+    print(f"Pares: {n} ({report['distinct_queries']} queries distintas, "
+          f"{report['parse_failures']} sem parse)")
+    for label, key in (("Regex", "regex_seconds"), ("Parser (cache frio)", "parser_cold_seconds"),
+                       ("Parser (cache quente)", "parser_warm_seconds")):
+        seconds = report[key]
+        print(f"  {label:<22} {seconds * 1000:8.1f} ms  ({seconds / max(n, 1) * 1e6:6.1f} µs/par)")
+    print(f"Concordância do EM (regex vs parser): {report['em_agreement']:.2%}")
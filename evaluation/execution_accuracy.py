@@ -1,43 +1,554 @@
+import hashlib
+import multiprocessing
+import os
+import re
 import sqlite3
-from typing import Any, List, Tuple
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
 
 
-# Cache opcional para evitar reabrir tantos bancos
-_CONNECTION_CACHE = {}
+# Resultados possíveis da execução de uma query
+OK = "ok"
+ERROR = "error"
+TIMEOUT = "timeout"
+ROW_LIMIT = "row_limit"
+BYTE_LIMIT = "byte_limit"
+OUTCOMES = (OK, ERROR, TIMEOUT, ROW_LIMIT, BYTE_LIMIT)
+
+# Limites padrão por query
+DEFAULT_TIMEOUT_SECONDS = 30.0
+DEFAULT_MAX_ROWS = 100_000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Instruções da VM do SQLite entre verificações do relógio
+PROGRESS_HANDLER_STEPS = 10_000
+# Linhas buscadas por vez com fetchmany
+FETCH_BATCH_SIZE = 1_000
+# Linhas guardadas por lado no streaming para confirmar um empate de impressões
+# digitais sem reexecutar as queries; acima disso vale a impressão digital
+VERIFY_MAX_ROWS = 10_000
+# Folga antes de matar um worker isolado que não respondeu
+KILL_GRACE_SECONDS = 2.0
+
+# Modos de comparação do EX
+EXACT = "exact"  # materializa, ordena e compara as listas de linhas
+HASH = "hash"    # streaming com impressão digital do multiconjunto de linhas
+COMPARE_MODES = (EXACT, HASH)
+
+# A impressão digital sem ordem é a soma (mod 2^128) dos hashes das linhas
+_HASH_BITS = 128
+_HASH_MASK = (1 << _HASH_BITS) - 1
+
+
+# Pool de conexões: bancos abertos por thread e pragmas de leitura
+POOL_MAX_OPEN = 32
+POOL_MMAP_SIZE = 256 * 1024 * 1024
+POOL_CACHE_SIZE_KIB = 16 * 1024
+
+
+@dataclass
+class ExecutionResult:
+    """Resultado da execução de uma query: status, linhas ordenadas e erro."""
+    status: str
+    rows: Optional[List[Tuple[Any]]] = None
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    fingerprint: Optional[str] = None
+
+
+class ConnectionPool:
+    """
+    Pool LRU de conexões SQLite somente leitura, separado por thread.
+
+    Cada thread mantém no máximo `max_open` bancos abertos (conexões sqlite3
+    não são compartilhadas entre threads); ao passar do limite, a conexão
+    usada há mais tempo é fechada. Os contadores são do processo todo.
+    """
+
+    def __init__(self, max_open: int = POOL_MAX_OPEN, mmap_size: int = POOL_MMAP_SIZE,
+                 cache_size_kib: int = POOL_CACHE_SIZE_KIB):
+        self.max_open = max_open
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.opened = 0
+        self.evicted = 0
+        self.hits = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _connections(self) -> OrderedDict:
+        # Após um fork, as conexões herdadas do processo pai são abandonadas
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.pid = os.getpid()
+            self._local.connections = OrderedDict()
+        return self._local.connections
+
+    def _open(self, db_path: str) -> sqlite3.Connection:
+        # mode=ro: SQL gerado pelo modelo nunca altera o banco de avaliação
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row  # Melhor para acesso por nome
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")  # negativo = KiB
+        return conn
+
+    def get(self, db_path: str) -> sqlite3.Connection:
+        """Conexão da thread atual para o banco, abrindo (e despejando) se preciso."""
+        connections = self._connections()
+        conn = connections.get(db_path)
+        if conn is not None:
+            connections.move_to_end(db_path)
+            with self._lock:
+                self.hits += 1
+            return conn
+
+        conn = self._open(db_path)
+        connections[db_path] = conn
+        evicted = 0
+        while len(connections) > self.max_open:
+            _, oldest = connections.popitem(last=False)
+            oldest.close()
+            evicted += 1
+        with self._lock:
+            self.opened += 1
+            self.evicted += evicted
+        return conn
+
+    def close_all(self):
+        """Fecha as conexões da thread atual."""
+        connections = self._connections()
+        while connections:
+            _, conn = connections.popitem()
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "opened": self.opened,
+                "evicted": self.evicted,
+                "hits": self.hits,
+                "open_in_thread": len(self._connections()),
+                "max_open": self.max_open,
+            }
+
+
+connection_pool = ConnectionPool()
 
 
 def get_connection(db_path: str) -> sqlite3.Connection:
-    """Reaproveita conexões SQLite para performance."""
-    if db_path in _CONNECTION_CACHE:
-        return _CONNECTION_CACHE[db_path]
+    """Reaproveita conexões SQLite (somente leitura) para performance."""
+    return connection_pool.get(db_path)
 
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row  # Melhor para acesso por nome
-    _CONNECTION_CACHE[db_path] = conn
-    return conn
 
+def _row_size(row: tuple) -> int:
+    """Estimativa do tamanho em bytes de uma linha do resultado."""
+    return sum(len(v) if isinstance(v, (str, bytes)) else 8 for v in row)
 
-def execute_query(db_path: str, sql: str) -> List[Tuple[Any]]:
+
+def _limits(timeout: float = DEFAULT_TIMEOUT_SECONDS, max_rows: int = DEFAULT_MAX_ROWS,
+            max_bytes: int = DEFAULT_MAX_BYTES) -> tuple:
+    return timeout, max_rows, max_bytes
+
+
+def _row_digest(row: tuple) -> int:
+    """Hash estável de uma linha; 1 e 1.0 têm o mesmo hash, como na comparação exata."""
+    if any(type(v) is float and v.is_integer() for v in row):
+        row = tuple(int(v) if type(v) is float and v.is_integer() else v for v in row)
+    data = repr(row).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=_HASH_BITS // 8).digest(), "big")
+
+
+class ResultHasher:
     """
-    Executa uma query SQL e retorna o resultado como lista de tuplas.
-    Resultados são ordenados para comparação independente da ordem.
+    Impressão digital incremental de um resultado.
+
+    Sem ordem, soma os hashes das linhas (comutativo: não precisa ordenar e
+    respeita repetições); com `ordered`, encadeia os hashes na ordem lida.
+    O formato é 'n_linhas:hash'. Com stable=False usa o hash() do Python,
+    bem mais rápido, mas válido só dentro do processo (não persistir).
     """
-    conn = get_connection(db_path)
-    cursor = conn.cursor()
+
+    def __init__(self, ordered: bool = False, stable: bool = True):
+        self.ordered = ordered
+        self.stable = stable
+        self.count = 0
+        self._sum = 0
+        self._chain = hashlib.sha256() if ordered else None
+
+    def update(self, rows):
+        for row in rows:
+            digest = _row_digest(row) if self.stable else hash(row) & _HASH_MASK
+            if self.ordered:
+                self._chain.update(digest.to_bytes(_HASH_BITS // 8, "big"))
+            else:
+                self._sum = (self._sum + digest) & _HASH_MASK
+        self.count += len(rows)
+
+    def hexdigest(self) -> str:
+        value = self._chain.hexdigest() if self.ordered else f"{self._sum:032x}"
+        return f"{self.count}:{value}"
+
+
+def result_fingerprint(rows, ordered: bool = False) -> str:
+    """Impressão digital compacta de um resultado (ver ResultHasher)."""
+    hasher = ResultHasher(ordered)
+    hasher.update(rows)
+    return hasher.hexdigest()
+
+
+def has_order_by(sql: str) -> bool:
+    """Heurística do Spider: a ordem do resultado importa se a query tem ORDER BY."""
+    return re.search(r"\border\s+by\b", sql, re.IGNORECASE) is not None
+
+
+class _StreamedQuery:
+    """Query lida em lotes com fetchmany, acumulando só a impressão digital."""
+
+    def __init__(self, conn, sql: str, ordered: bool, max_rows: int, max_bytes: int, deadline: float,
+                 stable: bool = True, keep_rows: int = 0):
+        self.hasher = ResultHasher(ordered, stable)
+        # Linhas lidas, enquanto couberem em keep_rows (None depois disso)
+        self.rows = [] if keep_rows > 0 else None
+        self._keep_rows = keep_rows
+        self.status = OK
+        self.error = None
+        self.done = False
+        self._max_rows = max_rows
+        self._max_bytes = max_bytes
+        self._deadline = deadline
+        self._bytes = 0
+        self._cursor = None
+        try:
+            self._cursor = conn.cursor()
+            self._cursor.row_factory = None
+            self._cursor.execute(sql)
+        except Exception as e:
+            self._fail(e)
+
+    def _fail(self, e: Exception):
+        self.done = True
+        interrupted = isinstance(e, sqlite3.OperationalError) and "interrupted" in str(e)
+        self.status = TIMEOUT if interrupted and time.perf_counter() > self._deadline else ERROR
+        self.error = str(e)
+
+    def fetch(self) -> list:
+        """Próximo lote; lista vazia ao terminar ou ao falhar/estourar um limite."""
+        if self.done:
+            return []
+        try:
+            batch = self._cursor.fetchmany(FETCH_BATCH_SIZE)
+        except Exception as e:
+            self._fail(e)
+            return []
+        if not batch:
+            self.done = True
+            return []
+        self.hasher.update(batch)
+        if self.rows is not None:
+            if self.hasher.count <= self._keep_rows:
+                self.rows.extend(batch)
+            else:
+                self.rows = None
+        self._bytes += sum(_row_size(row) for row in batch)
+        if self.hasher.count > self._max_rows:
+            self.done, self.status, self.error = True, ROW_LIMIT, f"more than {self._max_rows} rows"
+            return []
+        if self._bytes > self._max_bytes:
+            self.done, self.status, self.error = True, BYTE_LIMIT, f"more than {self._max_bytes} bytes"
+            return []
+        return batch
+
+    def drain(self):
+        while not self.done:
+            self.fetch()
+
+    def close(self):
+        if self._cursor is not None:
+            self._cursor.close()
+
+
+def run_query(
+    db_path: str,
+    sql: str,
+    timeout: float = DEFAULT_TIMEOUT_SECONDS,
+    max_rows: int = DEFAULT_MAX_ROWS,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+) -> ExecutionResult:
+    """
+    Executa uma query com orçamento de tempo e limites de linhas/bytes.
+
+    O tempo é controlado por um progress handler do SQLite, que interrompe a
+    query quando o prazo expira (inclusive durante o fetch). As linhas são
+    lidas com fetchmany e a leitura para assim que um limite é excedido.
+    """
+    start = time.perf_counter()
+    deadline = start + timeout
+    conn = None
 
     try:
+        conn = get_connection(db_path)
+        conn.set_progress_handler(lambda: 1 if time.perf_counter() > deadline else 0, PROGRESS_HANDLER_STEPS)
+        cursor = conn.cursor()
+        cursor.row_factory = None  # tuplas direto, sem sqlite3.Row
         cursor.execute(sql)
-        rows = cursor.fetchall()
 
-        # CORREÇÃO AQUI: extrair valores, não as chaves
-        rows = [tuple(row[k] for k in row.keys()) for row in rows]
+        rows = []
+        total_bytes = 0
+        while True:
+            batch = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not batch:
+                break
+            rows.extend(batch)
+            total_bytes += sum(_row_size(row) for row in batch)
+            if len(rows) > max_rows:
+                return ExecutionResult(ROW_LIMIT, error=f"more than {max_rows} rows",
+                                       elapsed=time.perf_counter() - start)
+            if total_bytes > max_bytes:
+                return ExecutionResult(BYTE_LIMIT, error=f"more than {max_bytes} bytes",
+                                       elapsed=time.perf_counter() - start)
 
         rows.sort()
-        return rows
+        return ExecutionResult(OK, rows=rows, elapsed=time.perf_counter() - start)
 
-    except Exception:
+    except sqlite3.OperationalError as e:
+        elapsed = time.perf_counter() - start
+        if time.perf_counter() > deadline and "interrupted" in str(e):
+            return ExecutionResult(TIMEOUT, error=f"exceeded {timeout}s", elapsed=elapsed)
+        return ExecutionResult(ERROR, error=str(e), elapsed=elapsed)
+    except Exception as e:
         # Se a query der erro → EX=0
-        return None
+        return ExecutionResult(ERROR, error=str(e), elapsed=time.perf_counter() - start)
+    finally:
+        if conn is not None:
+            conn.set_progress_handler(None, 0)
+
+
+def fingerprint_query(
+    db_path: str,
+    sql: str,
+    ordered: bool = False,
+    stop_after: Optional[int] = None,
+    timeout: float = DEFAULT_TIMEOUT_SECONDS,
+    max_rows: int = DEFAULT_MAX_ROWS,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+) -> ExecutionResult:
+    """
+    Executa uma query em streaming e retorna só a impressão digital do resultado.
+
+    Nenhuma linha é guardada nem ordenada. Com `stop_after`, a leitura para
+    assim que o resultado passa de `stop_after` linhas: o status é OK e a
+    impressão digital fica None (sabidamente diferente da esperada).
+    """
+    start = time.perf_counter()
+    deadline = start + timeout
+    conn = query = None
+
+    try:
+        conn = get_connection(db_path)
+        conn.set_progress_handler(lambda: 1 if time.perf_counter() > deadline else 0, PROGRESS_HANDLER_STEPS)
+        query = _StreamedQuery(conn, sql, ordered, max_rows, max_bytes, deadline)
+        while query.fetch():
+            if stop_after is not None and query.hasher.count > stop_after:
+                return ExecutionResult(OK, elapsed=time.perf_counter() - start)
+        fingerprint = query.hasher.hexdigest() if query.status == OK else None
+        return ExecutionResult(query.status, error=query.error, elapsed=time.perf_counter() - start,
+                               fingerprint=fingerprint)
+    except Exception as e:
+        return ExecutionResult(ERROR, error=str(e), elapsed=time.perf_counter() - start)
+    finally:
+        if query is not None:
+            query.close()
+        if conn is not None:
+            conn.set_progress_handler(None, 0)
+
+
+def compare_queries_streaming(
+    db_path: str,
+    predicted_sql: str,
+    gold_sql: str,
+    ordered: bool = False,
+    verify: bool = True,
+    timeout: float = DEFAULT_TIMEOUT_SECONDS,
+    max_rows: int = DEFAULT_MAX_ROWS,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+) -> dict:
+    """
+    Compara predição e gold lendo os dois cursores em paralelo, lote a lote.
+
+    Para no primeiro sinal de diferença (um resultado acaba antes do outro
+    ou, com `ordered`, uma linha diferente). Sem ordem, compara as impressões
+    digitais de multiconjunto e, se coincidirem e `verify` for True, confirma
+    com as linhas já lidas quando os dois resultados têm até VERIFY_MAX_ROWS
+    linhas, sem executar as queries de novo; resultados maiores ficam com a
+    impressão digital. As duas queries dividem um orçamento de 2 × timeout;
+    o status de um lado abandonado cedo é o status até ali.
+
+    Returns:
+        {"score", "pred_status", "gold_status"}, como compute_execution_outcome
+    """
+    deadline = time.perf_counter() + 2 * timeout
+    try:
+        conn = get_connection(db_path)
+    except Exception:
+        return {"score": 0, "pred_status": ERROR, "gold_status": ERROR}
+
+    conn.set_progress_handler(lambda: 1 if time.perf_counter() > deadline else 0, PROGRESS_HANDLER_STEPS)
+    # Impressões digitais só comparadas aqui: o hash() do processo basta
+    keep_rows = VERIFY_MAX_ROWS if verify and not ordered else 0
+    pred = _StreamedQuery(conn, predicted_sql, ordered, max_rows, max_bytes, deadline, stable=False,
+                          keep_rows=keep_rows)
+    gold = _StreamedQuery(conn, gold_sql, ordered, max_rows, max_bytes, deadline, stable=False,
+                          keep_rows=keep_rows)
+    try:
+        match = True
+        while match and not (pred.done and gold.done):
+            pred_batch, gold_batch = pred.fetch(), gold.fetch()
+            if pred.status != OK or gold.status != OK:
+                match = False
+            elif len(pred_batch) != len(gold_batch):
+                match = False  # Um dos resultados acabou antes: contagens diferentes
+            elif ordered and pred_batch != gold_batch:
+                match = False
+
+        if pred.status != OK or gold.status != OK:
+            # Lê o outro lado até o fim para reportar o status correto
+            pred.drain()
+            gold.drain()
+        elif match and not ordered:
+            match = pred.hasher.hexdigest() == gold.hasher.hexdigest()
+            if match and pred.rows is not None and gold.rows is not None:
+                # Comparação exata de multiconjuntos, sem ordenar (1 == 1.0, como em compare_results)
+                match = Counter(pred.rows) == Counter(gold.rows)
+    finally:
+        pred.close()
+        gold.close()
+        conn.set_progress_handler(None, 0)
+
+    return {"score": 1 if match else 0, "pred_status": pred.status, "gold_status": gold.status}
+
+
+def _isolated_worker_main(conn):
+    """Loop do processo isolado: recebe (função, argumentos) e devolve o resultado."""
+    while True:
+        try:
+            fn, args = conn.recv()
+        except EOFError:
+            return
+        conn.send(fn(*args))
+
+
+class IsolatedExecutor:
+    """
+    Executa queries num processo separado que pode ser morto.
+
+    Protege a avaliação de queries que travam fora do alcance do progress
+    handler ou que estouram a memória: se o worker não responde dentro do
+    prazo (mais uma folga), ele é morto e recriado.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start()
+
+    def _start(self):
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_isolated_worker_main, args=(child_conn,), daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+
+    def _restart(self):
+        self._process.kill()
+        self._process.join()
+        self._conn.close()
+        self._start()
+
+    def call(self, fn, args: tuple, timeout: float):
+        """
+        Executa fn(*args) no worker (fn precisa ser uma função de módulo).
+
+        Raises:
+            TimeoutError: O worker não respondeu no prazo e foi morto
+            ChildProcessError: O worker morreu (ex.: falta de memória)
+        """
+        with self._lock:
+            try:
+                self._conn.send((fn, args))
+                if self._conn.poll(timeout + KILL_GRACE_SECONDS):
+                    return self._conn.recv()
+            except (EOFError, OSError) as e:
+                self._restart()
+                raise ChildProcessError(f"worker crashed: {e}") from e
+            self._restart()
+            raise TimeoutError(f"worker killed after {timeout}s")
+
+    def run(self, fn, args: tuple, timeout: float) -> ExecutionResult:
+        """Como call, para funções que retornam ExecutionResult."""
+        start = time.perf_counter()
+        try:
+            return self.call(fn, args, timeout)
+        except TimeoutError as e:
+            return ExecutionResult(TIMEOUT, error=str(e), elapsed=time.perf_counter() - start)
+        except ChildProcessError as e:
+            return ExecutionResult(ERROR, error=str(e), elapsed=time.perf_counter() - start)
+
+    def close(self):
+        self._process.kill()
+        self._process.join()
+
+
+_ISOLATED_EXECUTOR = None
+_ISOLATED_EXECUTOR_PID = None
+
+
+def get_isolated_executor() -> IsolatedExecutor:
+    """Worker isolado compartilhado pelo processo (criado sob demanda)."""
+    global _ISOLATED_EXECUTOR, _ISOLATED_EXECUTOR_PID
+    # Um processo filho (fork) não pode usar o pipe do worker do pai
+    if _ISOLATED_EXECUTOR is None or _ISOLATED_EXECUTOR_PID != os.getpid():
+        _ISOLATED_EXECUTOR = IsolatedExecutor()
+        _ISOLATED_EXECUTOR_PID = os.getpid()
+    return _ISOLATED_EXECUTOR
+
+
+def execute_query_with_outcome(db_path: str, sql: str, isolate: bool = False, **limits) -> ExecutionResult:
+    """
+    Executa uma query e retorna o resultado com status distinto para
+    sucesso, erro, timeout e limites de linhas/bytes.
+
+    Args:
+        db_path: Caminho do banco SQLite
+        sql: Query a executar
+        isolate: Executa num processo separado que pode ser morto
+        **limits: timeout, max_rows, max_bytes
+    """
+    timeout, max_rows, max_bytes = _limits(**limits)
+    if isolate:
+        return get_isolated_executor().run(run_query, (db_path, sql, timeout, max_rows, max_bytes), timeout)
+    return run_query(db_path, sql, timeout, max_rows, max_bytes)
+
+
+def fingerprint_query_with_outcome(db_path: str, sql: str, isolate: bool = False, ordered: bool = False,
+                                   stop_after: Optional[int] = None, **limits) -> ExecutionResult:
+    """fingerprint_query, opcionalmente no processo isolado."""
+    timeout, max_rows, max_bytes = _limits(**limits)
+    args = (db_path, sql, ordered, stop_after, timeout, max_rows, max_bytes)
+    if isolate:
+        return get_isolated_executor().run(fingerprint_query, args, timeout)
+    return fingerprint_query(*args)
+
+
+def execute_query(db_path: str, sql: str) -> List[Tuple[Any]]:
+    """
+    Executa uma query SQL e retorna o resultado como lista de tuplas.
+    Resultados são ordenados para comparação independente da ordem.
+    Retorna None se a query falhar ou exceder algum limite.
+    """
+    return execute_query_with_outcome(db_path, sql).rows
 
 
 def compare_results(pred_rows, gold_rows) -> bool:
@@ -51,11 +562,93 @@ def compare_results(pred_rows, gold_rows) -> bool:
     return pred_rows == gold_rows
 
 
+def _compare_streaming_with_outcome(db_path: str, predicted_sql: str, gold_sql: str, isolate: bool,
+                                    ordered: bool, **limits) -> dict:
+    timeout, max_rows, max_bytes = _limits(**limits)
+    args = (db_path, predicted_sql, gold_sql, ordered, True, timeout, max_rows, max_bytes)
+    if not isolate:
+        return compare_queries_streaming(*args)
+    try:
+        # Orçamento compartilhado pelas duas queries
+        return get_isolated_executor().call(compare_queries_streaming, args, 2 * timeout)
+    except TimeoutError:
+        return {"score": 0, "pred_status": TIMEOUT, "gold_status": TIMEOUT}
+    except ChildProcessError:
+        return {"score": 0, "pred_status": ERROR, "gold_status": ERROR}
+
+
+def compute_execution_outcome(db_path: str, predicted_sql: str, gold_sql: str, isolate: bool = False,
+                              gold_cache=None, compare: str = EXACT, ordered: bool = False,
+                              **limits) -> dict:
+    """
+    Executa predição e gold e retorna o score EX junto com o status de cada
+    execução (ok, error, timeout, row_limit, byte_limit).
+
+    Com `gold_cache` (ver evaluation.gold_cache), o resultado gold vem da
+    impressão digital cacheada e só a query predita é executada.
+
+    Com compare="hash", as linhas são lidas em streaming e comparadas por
+    impressão digital, sem materializar nem ordenar os resultados; `ordered`
+    torna a comparação sensível à ordem (queries com ORDER BY).
+    """
+    if compare not in COMPARE_MODES:
+        raise ValueError(f"Modo de comparação desconhecido: {compare}")
+    if ordered and compare != HASH:
+        raise ValueError("Comparação sensível à ordem requer compare='hash'")
+
+    key = None
+    if gold_cache is not None and not ordered:
+        try:
+            key = gold_cache.make_key(db_path, gold_sql)
+        except OSError:
+            key = None  # Banco inexistente: segue sem cache
+
+    if key is None:
+        if compare == HASH:
+            return _compare_streaming_with_outcome(db_path, predicted_sql, gold_sql, isolate, ordered, **limits)
+        pred_out = execute_query_with_outcome(db_path, predicted_sql, isolate=isolate, **limits)
+        gold_out = execute_query_with_outcome(db_path, gold_sql, isolate=isolate, **limits)
+        return {
+            "score": 1 if compare_results(pred_out.rows, gold_out.rows) else 0,
+            "pred_status": pred_out.status,
+            "gold_status": gold_out.status,
+        }
+
+    run = fingerprint_query_with_outcome if compare == HASH else execute_query_with_outcome
+    cached = gold_cache.get(key)
+    if cached is None:
+        gold_out = run(db_path, gold_sql, isolate=isolate, **limits)
+        gold_cache.set(key, gold_out)
+        gold_status = gold_out.status
+        gold_fingerprint = gold_cache.fingerprint_of(gold_out)
+    else:
+        gold_status, gold_fingerprint = cached
+
+    if compare == HASH:
+        # Para de ler a predição assim que ela passa do número de linhas do gold
+        gold_count = int(gold_fingerprint.split(":", 1)[0]) if gold_fingerprint else None
+        pred_out = fingerprint_query_with_outcome(db_path, predicted_sql, isolate=isolate,
+                                                  stop_after=gold_count, **limits)
+        pred_fingerprint = pred_out.fingerprint
+    else:
+        pred_out = execute_query_with_outcome(db_path, predicted_sql, isolate=isolate, **limits)
+        pred_fingerprint = result_fingerprint(pred_out.rows) if pred_out.status == OK else None
+
+    match = (
+        pred_out.status == OK
+        and gold_status == OK
+        and pred_fingerprint is not None
+        and pred_fingerprint == gold_fingerprint
+    )
+    return {
+        "score": 1 if match else 0,
+        "pred_status": pred_out.status,
+        "gold_status": gold_status,
+    }
+
+
 def compute_execution_accuracy(db_path: str, predicted_sql: str, gold_sql: str) -> int:
     """
     Retorna 1 se predicted_sql == gold_sql no sentido de execução.
     """
-    pred_out = execute_query(db_path, predicted_sql)
-    gold_out = execute_query(db_path, gold_sql)
-
-    return 1 if compare_results(pred_out, gold_out) else 0
+    return compute_execution_outcome(db_path, predicted_sql, gold_sql)["score"]
@@ -0,0 +1,129 @@
+"""Cache persistente dos resultados das queries gold
+
+A chave é (hash do conteúdo do arquivo do banco, SQL gold normalizado) e o
+valor é uma impressão digital compacta do resultado, de modo que o EX de um
+novo conjunto de predições só precisa executar as queries preditas.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+from .execution_accuracy import OK, ExecutionResult, result_fingerprint
+
+GOLD_CACHE_PATH = os.path.join(".cache", "gold_results.sqlite")
+
+# Versão do formato da impressão digital (muda a chave quando o formato muda)
+FINGERPRINT_VERSION = 2
+
+# Só resultados OK: um ERROR pode vir de uma falha passageira (banco travado,
+# erro de E/S) e ficaria gravado até o arquivo do banco mudar; golds com erro
+# são simplesmente executados de novo
+CACHEABLE_STATUSES = (OK,)
+
+_DB_HASH_CACHE = {}
+_DB_HASH_LOCK = threading.Lock()
+
+
+def database_hash(db_path: str) -> str:
+    """SHA-256 do conteúdo do arquivo do banco (memoizado por mtime/tamanho)."""
+    stat = os.stat(db_path)
+    key = (os.path.abspath(db_path), stat.st_mtime_ns, stat.st_size)
+    with _DB_HASH_LOCK:
+        if key in _DB_HASH_CACHE:
+            return _DB_HASH_CACHE[key]
+
+    digest = hashlib.sha256()
+    with open(db_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+
+    with _DB_HASH_LOCK:
+        _DB_HASH_CACHE[key] = digest.hexdigest()
+    return _DB_HASH_CACHE[key]
+
+
+def normalize_gold_sql(sql: str) -> str:
+    """Normalização conservadora: não altera literais (maiúsculas/espaços)."""
+    return sql.strip().rstrip(";").strip()
+
+
+class GoldResultCache:
+    """Cache em SQLite (WAL) de impressões digitais dos resultados gold."""
+
+    def __init__(self, path: str = GOLD_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._counts_lock = threading.Lock()  # O cache é usado por threads do pool
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS gold_results ("
+            " key TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " fingerprint TEXT)"
+        )
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Após um fork, a conexão herdada do processo pai não é reutilizada
+        if getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    @staticmethod
+    def make_key(db_path: str, gold_sql: str) -> str:
+        payload = f"v{FINGERPRINT_VERSION}\0{database_hash(db_path)}\0{normalize_gold_sql(gold_sql)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[tuple]:
+        """Retorna (status, fingerprint) ou None."""
+        row = self._connection().execute(
+            "SELECT status, fingerprint FROM gold_results WHERE key = ?", (key,)
+        ).fetchone()
+        # Entradas com outro status (gravadas por versões anteriores) são ignoradas
+        hit = row is not None and row[0] in CACHEABLE_STATUSES
+        self.add_counts(hits=int(hit), misses=int(not hit))
+        return row if hit else None
+
+    def add_counts(self, hits: int = 0, misses: int = 0):
+        """Soma acertos/falhas aos contadores (também os vindos de processos workers)."""
+        with self._counts_lock:
+            self.hits += hits
+            self.misses += misses
+
+    @staticmethod
+    def fingerprint_of(result: ExecutionResult) -> Optional[str]:
+        """Impressão digital de um resultado OK, executado com ou sem streaming."""
+        if result.status != OK:
+            return None
+        return result.fingerprint or result_fingerprint(result.rows)
+
+    def set(self, key: str, result: ExecutionResult):
+        """Guarda a impressão digital de um resultado gold OK."""
+        if result.status not in CACHEABLE_STATUSES:
+            return
+        fingerprint = self.fingerprint_of(result)
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO gold_results (key, status, fingerprint) VALUES (?, ?, ?)",
+            (key, result.status, fingerprint),
+        )
+        conn.commit()
+
+
+_GOLD_CACHE = None
+
+
+def get_gold_cache() -> GoldResultCache:
+    """Cache gold compartilhado pelo processo (criado sob demanda)."""
+    global _GOLD_CACHE
+    if _GOLD_CACHE is None:
+        _GOLD_CACHE = GoldResultCache()
+    return _GOLD_CACHE
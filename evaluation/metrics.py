@@ -1,20 +1,19 @@
 """Métricas de Avaliação: EX e EM conforme DART-SQL"""
 from loguru import logger
+import math
 import re
-from typing import Set, Tuple
-from .execution_accuracy import compute_execution_accuracy
-
-def normalize_sql(sql: str) -> str:
-    """Normaliza SQL para comparação"""
-    sql = " ".join(sql.split())
-    sql = sql.lower()
-    sql = sql.rstrip(";")
-    return sql.strip()
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Set, Tuple
+from .execution_accuracy import EXACT, OUTCOMES, compute_execution_accuracy, compute_execution_outcome, has_order_by
+from .gold_cache import get_gold_cache
+from .sql_parser import analyze_sql, components_match, normalize_sql
 
 def extract_sql_clauses(sql: str) -> Set[str]:
     """
-    Extrai cláusulas SQL para Exact-Set-Match (EM).
-    Remove valores literais, mantendo apenas estrutura.
+    Extrai cláusulas SQL com regex (versão antiga do EM, mantida para
+    comparação em evaluation.benchmark_em). Remove valores literais,
+    mantendo apenas estrutura.
     
     Exemplo:
     SELECT name FROM users WHERE age > 20
@@ -60,17 +59,14 @@ def extract_sql_clauses(sql: str) -> Set[str]:
 
 def exact_set_match(predicted: str, ground_truth: str) -> bool:
     """
-    Exact-Set-Match (EM): Verifica se as cláusulas são idênticas
-    após remover valores literais.
+    Exact-Set-Match (EM): Verifica se as árvores de componentes (ver
+    evaluation.sql_parser) são idênticas após remover valores literais.
     """
-    pred_clauses = extract_sql_clauses(predicted)
-    gt_clauses = extract_sql_clauses(ground_truth)
-    
-    return pred_clauses == gt_clauses
+    return components_match(analyze_sql(predicted), analyze_sql(ground_truth))
 
 def exact_match(predicted: str, ground_truth: str) -> bool:
     """Verifica se SQLs são exatamente idênticos (string match)"""
-    return normalize_sql(predicted) == normalize_sql(ground_truth)
+    return analyze_sql(predicted).normalized == analyze_sql(ground_truth).normalized
 
 def calculate_exact_set_match_accuracy(results: list) -> float:
     """
@@ -111,8 +107,8 @@ def calculate_exact_match_accuracy(results: list) -> float:
 
 def token_overlap(predicted: str, ground_truth: str) -> float:
     """Sobreposição de tokens"""
-    pred_tokens = set(normalize_sql(predicted).split())
-    gt_tokens = set(normalize_sql(ground_truth).split())
+    pred_tokens = analyze_sql(predicted).tokens
+    gt_tokens = analyze_sql(ground_truth).tokens
     
     if not gt_tokens:
         return 0.0
@@ -120,50 +116,199 @@ def token_overlap(predicted: str, ground_truth: str) -> float:
     intersection = pred_tokens & gt_tokens
     return len(intersection) / len(gt_tokens)
 
-def evaluate_results(results: list) -> dict:
+def _evaluate_partition(db_path: str, items: list, options: dict) -> dict:
+    """Calcula o EX de um grupo de exemplos do mesmo banco (conexão quente)."""
+    gold_cache = get_gold_cache() if options["use_gold_cache"] else None
+    hits, misses = (gold_cache.hits, gold_cache.misses) if gold_cache else (0, 0)
+    start = time.perf_counter()
+
+    outcomes = []
+    for index, pred, gold in items:
+        outcome = compute_execution_outcome(
+            db_path, pred, gold, isolate=options["isolate"], gold_cache=gold_cache,
+            compare=options["compare"], ordered=options["order_sensitive"] and has_order_by(gold),
+        )
+        outcomes.append((index, outcome))
+
+    return {
+        "db_path": db_path,
+        "outcomes": outcomes,
+        "elapsed": time.perf_counter() - start,
+        "gold_hits": gold_cache.hits - hits if gold_cache else 0,
+        "gold_misses": gold_cache.misses - misses if gold_cache else 0,
+    }
+
+def compute_execution_outcomes(results: list, workers: Optional[int] = None, isolate: bool = False,
+                               use_gold_cache: bool = True, compare: str = EXACT,
+                               order_sensitive: bool = False) -> Tuple[List[dict], Dict[str, dict]]:
     """
-    Avalia resultados com EM, Exact Match, Token Overlap e Execution Accuracy (EX).
+    Calcula o EX de cada resultado, agrupando os exemplos por banco.
+    
+    Com `workers` > 1, os grupos (bancos grandes divididos em pedaços, para
+    balancear a carga) rodam num pool de processos; cada worker mantém
+    conexões quentes com os bancos que avalia.
+    
+    Returns:
+        (outcomes na ordem de entrada, {db_path: {"examples", "seconds"}})
     """
-    exact_set_match_acc = calculate_exact_set_match_accuracy(results)
-    string_exact_match_acc = calculate_exact_match_accuracy(results)
+    partitions = {}
+    for index, r in enumerate(results):
+        db = r.get("db_path")
+        if not db:
+            raise ValueError("Faltando db_path em um dos resultados para calcular EX.")
+        partitions.setdefault(db, []).append((index, r.get("predicted_sql", ""), r.get("ground_truth_sql", "")))
 
-    # Token overlap
-    overlaps = [
-        token_overlap(r.get("predicted_sql", ""), r.get("ground_truth_sql", ""))
-        for r in results
+    parallel = bool(workers and workers > 1)
+    chunk_size = max(1, math.ceil(len(results) / (workers * 4))) if parallel else max(1, len(results))
+    tasks = [
+        (db, items[i:i + chunk_size])
+        for db, items in sorted(partitions.items(), key=lambda p: -len(p[1]))
+        for i in range(0, len(items), chunk_size)
     ]
-    avg_overlap = sum(overlaps) / len(overlaps) if overlaps else 0.0
+    options = dict(isolate=isolate, use_gold_cache=use_gold_cache, compare=compare, order_sensitive=order_sensitive)
 
-    # Execution Accuracy (EX)
-    ex_scores = []
-    for r in results:
-        pred = r.get("predicted_sql", "")
-        gold = r.get("ground_truth_sql", "")
-        db = r.get("db_path")
+    outcomes = [None] * len(results)
+    timing = {}
+    gold_cache = get_gold_cache() if use_gold_cache else None
 
-        if not db:
-            raise ValueError("Faltando db_path em um dos resultados para calcular EX.")
+    def collect(part: dict):
+        for index, outcome in part["outcomes"]:
+            outcomes[index] = outcome
+        db_timing = timing.setdefault(part["db_path"], {"examples": 0, "seconds": 0.0})
+        db_timing["examples"] += len(part["outcomes"])
+        db_timing["seconds"] += part["elapsed"]
+        if parallel and gold_cache is not None:
+            # Contadores do cache gold dos workers
+            gold_cache.add_counts(part["gold_hits"], part["gold_misses"])
 
-        ex_scores.append(1 if execution_match(pred, gold, db) else 0)
+    start = time.perf_counter()
+    if parallel:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_evaluate_partition, db, items, options) for db, items in tasks]
+            for future in as_completed(futures):
+                collect(future.result())
+    else:
+        for db, items in tasks:
+            collect(_evaluate_partition(db, items, options))
 
-    ex_accuracy = sum(ex_scores) / len(ex_scores) if ex_scores else 0.0
+    for db_timing in timing.values():
+        db_timing["seconds"] = round(db_timing["seconds"], 4)
+    logger.info(f"EX: {len(results)} exemplos em {len(partitions)} bancos "
+                f"({time.perf_counter() - start:.1f}s, workers={workers or 1})")
+    return outcomes, timing
 
-    return {
-        "exact_set_match_accuracy": exact_set_match_acc,
-        "string_exact_match_accuracy": string_exact_match_acc,
-        "execution_accuracy": ex_accuracy,          # <--- AQUI
-        "average_token_overlap": avg_overlap,
-        "total_examples": len(results)
-    }
+class MetricsAccumulator:
+    """
+    Agregados incrementais de todas as métricas (EM, String Match, Token
+    Overlap e EX), atualizados exemplo a exemplo em memória constante.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.exact_set_matches = 0
+        self.string_matches = 0
+        self.overlap_sum = 0.0
+        self.ex_sum = 0
+        self.outcomes = {
+            "predicted": {status: 0 for status in OUTCOMES},
+            "gold": {status: 0 for status in OUTCOMES},
+        }
+        self.timing = {}
+
+    def add(self, record: dict, outcome: dict):
+        """Soma um resultado (predicted_sql, ground_truth_sql) e seu EX."""
+        pred = analyze_sql(record.get("predicted_sql", ""))
+        gold = analyze_sql(record.get("ground_truth_sql", ""))
+        self.total += 1
+        self.exact_set_matches += components_match(pred, gold)
+        self.string_matches += pred.normalized == gold.normalized
+        if gold.tokens:
+            self.overlap_sum += len(pred.tokens & gold.tokens) / len(gold.tokens)
+        self.ex_sum += outcome["score"]
+        self.outcomes["predicted"][outcome["pred_status"]] += 1
+        self.outcomes["gold"][outcome["gold_status"]] += 1
+
+    def add_timing(self, timing: Dict[str, dict]):
+        for db, db_timing in timing.items():
+            total = self.timing.setdefault(db, {"examples": 0, "seconds": 0.0})
+            total["examples"] += db_timing["examples"]
+            total["seconds"] = round(total["seconds"] + db_timing["seconds"], 4)
+
+    def summary(self, with_timing: bool = False) -> dict:
+        n = self.total
+        metrics = {
+            "exact_set_match_accuracy": self.exact_set_matches / n if n else 0.0,
+            "string_exact_match_accuracy": self.string_matches / n if n else 0.0,
+            "execution_accuracy": self.ex_sum / n if n else 0.0,          # <--- AQUI
+            "execution_outcomes": self.outcomes,
+            "average_token_overlap": self.overlap_sum / n if n else 0.0,
+            "total_examples": n
+        }
+        if with_timing:
+            metrics["execution_timing_by_db"] = self.timing
+        return metrics
+
+def _summarize_results(results: list, execution: List[dict], timing: Optional[Dict[str, dict]] = None) -> dict:
+    accumulator = MetricsAccumulator()
+    for record, outcome in zip(results, execution):
+        accumulator.add(record, outcome)
+    if timing is not None:
+        accumulator.add_timing(timing)
+
+    n = accumulator.total
+    if n:
+        logger.info(f"Exact-Set-Match (EM): {accumulator.exact_set_matches}/{n} = "
+                    f"{accumulator.exact_set_matches / n:.2%}")
+        logger.info(f"String Exact Match: {accumulator.string_matches}/{n} = {accumulator.string_matches / n:.2%}")
+    outcomes = accumulator.outcomes
+    if outcomes["predicted"]["timeout"] or outcomes["gold"]["timeout"]:
+        logger.warning(f"Timeouts na execução: {outcomes['predicted']['timeout']} predições, "
+                       f"{outcomes['gold']['timeout']} gold")
+    return accumulator.summary(with_timing=timing is not None)
 
-def compare_methods(rewriting_results: list, zero_shot_results: list) -> dict:
+def evaluate_results(results: list, isolate: bool = False, use_gold_cache: bool = True,
+                     compare: str = EXACT, order_sensitive: bool = False, workers: Optional[int] = None) -> dict:
+    """
+    Avalia resultados com EM, Exact Match, Token Overlap e Execution Accuracy (EX).
+    
+    Timeouts e limites de linhas/bytes na execução são contados em
+    `execution_outcomes`, separados para predições e gold, e o tempo de EX
+    por banco em `execution_timing_by_db`.
+    
+    Args:
+        results: Lista de resultados (predicted_sql, ground_truth_sql, db_path)
+        isolate: Executa as queries num processo separado que pode ser morto
+        use_gold_cache: Reaproveita resultados gold já executados (entre
+            baselines e entre execuções), executando só as predições
+        compare: "exact" (materializa e ordena) ou "hash" (streaming por
+            impressão digital, com parada antecipada)
+        order_sensitive: Com compare="hash", compara na ordem retornada
+            quando a query gold tem ORDER BY
+        workers: Processos para o EX (agrupado por banco); None ou 1 executa
+            no processo atual
+    """
+    execution, timing = compute_execution_outcomes(
+        results, workers=workers, isolate=isolate, use_gold_cache=use_gold_cache,
+        compare=compare, order_sensitive=order_sensitive,
+    )
+    return _summarize_results(results, execution, timing)
+
+def compare_methods(rewriting_results: list, zero_shot_results: list, isolate: bool = False,
+                    use_gold_cache: bool = True, compare: str = EXACT, order_sensitive: bool = False,
+                    workers: Optional[int] = None) -> dict:
     """
     Compara Baseline 1 (Zero-Shot) vs Baseline 2 (RW-Enhanced).
     
-    Retorna melhoria do RW sobre Zero-Shot.
+    O EX dos dois baselines é calculado numa única passada (mesmos bancos,
+    mesmo pool de processos). Retorna melhoria do RW sobre Zero-Shot.
     """
-    rewriting_metrics = evaluate_results(rewriting_results)
-    zero_shot_metrics = evaluate_results(zero_shot_results)
+    execution, timing = compute_execution_outcomes(
+        rewriting_results + zero_shot_results, workers=workers, isolate=isolate,
+        use_gold_cache=use_gold_cache, compare=compare, order_sensitive=order_sensitive,
+    )
+    split = len(rewriting_results)
+    rewriting_metrics = _summarize_results(rewriting_results, execution[:split])
+    zero_shot_metrics = _summarize_results(zero_shot_results, execution[split:])
     
     return {
         "baseline_1_zero_shot": zero_shot_metrics,
@@ -173,5 +318,6 @@ def compare_methods(rewriting_results: list, zero_shot_results: list) -> dict:
             "string_exact_match": rewriting_metrics["string_exact_match_accuracy"] - zero_shot_metrics["string_exact_match_accuracy"],
             "execution_accuracy": rewriting_metrics["execution_accuracy"] - zero_shot_metrics["execution_accuracy"],   # <--- AQUI
             "token_overlap": rewriting_metrics["average_token_overlap"] - zero_shot_metrics["average_token_overlap"]
-        }
+        },
+        "execution_timing_by_db": timing,
     }
\ No newline at end of file
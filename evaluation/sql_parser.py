@@ -0,0 +1,533 @@
+"""Parser de SQL para o Exact-Set-Match (EM) no estilo da avaliação oficial do Spider
+
+A query é tokenizada e analisada por descida recursiva em uma árvore de
+componentes normalizada (select, from, where, groupBy, having, orderBy,
+limit, intersect, union, except). Valores literais viram "value", aliases
+de tabela são resolvidos para o nome da tabela e cláusulas sem ordem
+(colunas do SELECT, tabelas, condições, GROUP BY) viram conjuntos, de modo
+que duas queries equivalentes nesses aspectos têm árvores iguais.
+
+As análises são memorizadas por string SQL (`analyze_sql`), então cada
+query - em especial as gold, repetidas entre baselines - é processada
+uma única vez.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, NamedTuple, Optional
+
+# Análises mantidas em memória (queries distintas)
+ANALYSIS_CACHE_SIZE = 32_768
+
+AGGREGATES = {"count", "sum", "avg", "min", "max"}
+SET_OPERATIONS = ("union", "intersect", "except")
+COMPARISON_OPS = {"=", "==", "!=", "<>", "<", ">", "<=", ">="}
+ARITHMETIC_OPS = {"+", "-", "*", "/", "%", "||"}
+KEYWORDS = {
+    "select", "from", "where", "group", "by", "having", "order", "asc", "desc", "limit", "offset",
+    "union", "intersect", "except", "all", "join", "inner", "left", "right", "outer", "cross",
+    "natural", "on", "using", "as", "and", "or", "not", "in", "like", "glob", "between", "is",
+    "null", "distinct", "exists", "case", "when", "then", "else", "end", "cast",
+}
+_TOKEN_RE = re.compile(
+    r"""\s*(?:
+        (?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*")
+      | (?P<number>\d+(?:\.\d*)?(?:e[-+]?\d+)?|\.\d+)
+      | (?P<ident>(?:`[^`]*`|\[[^\]]*\]|[A-Za-z_][\w$]*)(?:\.(?:`[^`]*`|\[[^\]]*\]|[A-Za-z_][\w$]*|\*))?)
+      | (?P<op>>=|<=|!=|<>|==|\|\||[-+*/%=<>(),;])
+      | (?P<error>\S)
+    )""",
+    re.VERBOSE | re.IGNORECASE,
+)
+
+
+class SQLParseError(ValueError):
+    """A query usa sintaxe que o parser não reconhece."""
+
+
+class Token(NamedTuple):
+    kind: str  # string, number, ident, keyword, op
+    value: str
+
+
+class SQLComponents(NamedTuple):
+    """Árvore de componentes normalizada de uma query (um SELECT)."""
+    select: tuple
+    from_: frozenset
+    where: tuple
+    group_by: frozenset
+    having: tuple
+    order_by: tuple
+    limit: bool
+    intersect: Optional["SQLComponents"]
+    union: Optional["SQLComponents"]
+    except_: Optional["SQLComponents"]
+
+
+def _unquote_identifier(name: str) -> str:
+    return ".".join(part.strip("`[]") for part in name.split("."))
+
+
+def tokenize(sql: str) -> List[Token]:
+    """Quebra a query em tokens (identificadores e palavras-chave em minúsculas)."""
+    tokens = []
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        if kind is None:
+            break  # Só espaços no fim
+        value = match.group(kind)
+        if kind == "error":
+            raise SQLParseError(f"Caractere inesperado na posição {match.start(kind)}: {value!r}")
+        if kind == "ident":
+            if "`" in value or "[" in value:
+                value = _unquote_identifier(value)
+            value = value.lower()
+            if value in KEYWORDS:
+                kind = "keyword"
+        tokens.append(Token(kind, value))
+    while tokens and tokens[-1].value == ";":
+        tokens.pop()
+    return tokens
+
+
+_VALUE = ("value",)
+
+
+class _Parser:
+    """Descida recursiva sobre os tokens; monta a árvore com colunas ainda não resolvidas."""
+
+    def __init__(self, tokens: List[Token]):
+        self.tokens = tokens
+        self.pos = 0
+        # Alias -> tabela, para a query inteira (como na avaliação do Spider)
+        self.aliases = {}
+        for i in range(1, len(tokens) - 1):
+            before, after = tokens[i - 1], tokens[i + 1]
+            if tokens[i].value == "as" and before.kind == "ident" and after.kind == "ident":
+                self.aliases[after.value] = before.value
+
+    # --- navegação ---
+
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def at(self, *values: str) -> bool:
+        if self.pos >= len(self.tokens):
+            return False
+        token = self.tokens[self.pos]
+        return token.value in values and token.kind in ("keyword", "op")
+
+    def accept(self, *values: str) -> Optional[str]:
+        if self.at(*values):
+            self.pos += 1
+            return self.tokens[self.pos - 1].value
+        return None
+
+    def expect(self, value: str):
+        if not self.accept(value):
+            found = self.peek().value if self.peek() else "fim da query"
+            raise SQLParseError(f"Esperado {value!r}, encontrado {found!r}")
+
+    # --- query ---
+
+    def parse(self) -> dict:
+        query = self.parse_query()
+        if self.peek() is not None:
+            raise SQLParseError(f"Token inesperado: {self.peek().value!r}")
+        return query
+
+    def parse_query(self) -> dict:
+        query = self.parse_select_core()
+        operation = self.accept(*SET_OPERATIONS)
+        if operation:
+            self.accept("all")
+            query[operation] = self.parse_query()
+        return query
+
+    def parse_select_core(self) -> dict:
+        self.expect("select")
+        query = {"distinct": bool(self.accept("distinct")), "select": [], "from": [], "where": None,
+                 "group_by": [], "having": None, "order_by": None, "limit": False}
+        self.accept("all")
+        query["select"] = self._comma_list(self.parse_select_item)
+        if self.accept("from"):
+            query["from"] = self.parse_from()
+        if self.accept("where"):
+            query["where"] = self.parse_condition()
+        if self.accept("group"):
+            self.expect("by")
+            query["group_by"] = self._comma_list(self.parse_expression)
+        if self.accept("having"):
+            query["having"] = self.parse_condition()
+        if self.accept("order"):
+            self.expect("by")
+            items = self._comma_list(self.parse_order_item)
+            directions = {direction for _, direction in items}
+            query["order_by"] = ("desc" if "desc" in directions else "asc", [expr for expr, _ in items])
+        if self.accept("limit"):
+            self.parse_expression()
+            if self.accept("offset") or self.accept(","):
+                self.parse_expression()
+            query["limit"] = True
+        return query
+
+    def _comma_list(self, parse_item) -> list:
+        items = [parse_item()]
+        while self.accept(","):
+            items.append(parse_item())
+        return items
+
+    def _skip_alias(self):
+        if self.accept("as"):
+            self.pos += 1
+        elif self.peek() is not None and self.peek().kind in ("ident", "string") and self.peek().value not in KEYWORDS:
+            self.pos += 1
+
+    def parse_select_item(self):
+        expr = self.parse_expression()
+        self._skip_alias()
+        return expr
+
+    def parse_order_item(self):
+        expr = self.parse_expression()
+        direction = self.accept("asc", "desc") or "asc"
+        return expr, direction
+
+    def parse_from(self) -> list:
+        units = [self.parse_table_unit()]
+        while True:
+            if self.accept(","):
+                units.append(self.parse_table_unit())
+                continue
+            while self.accept("natural", "left", "right", "inner", "outer", "cross"):
+                pass
+            if not self.accept("join"):
+                return units
+            units.append(self.parse_table_unit())
+            if self.accept("on"):
+                self.parse_condition()  # Condições de junção não entram no EM (como no Spider)
+            elif self.accept("using"):
+                self.expect("(")
+                self._comma_list(self.parse_expression)
+                self.expect(")")
+
+    def parse_table_unit(self):
+        if self.accept("("):
+            unit = ("subquery", self.parse_query())
+            self.expect(")")
+            self._skip_alias()
+            return unit
+        token = self.peek()
+        if token is None or token.kind != "ident":
+            raise SQLParseError(f"Tabela esperada, encontrado {token.value if token else 'fim da query'!r}")
+        self.pos += 1
+        if self.accept("as"):
+            self.aliases[self.peek().value] = token.value
+            self.pos += 1
+        elif self.peek() is not None and self.peek().kind == "ident":
+            self.aliases[self.peek().value] = token.value  # Alias implícito: FROM singer t1
+            self.pos += 1
+        return ("table", token.value)
+
+    # --- condições ---
+
+    def parse_condition(self) -> dict:
+        """Retorna {"predicates": [...], "connectives": {"and", "or"}} achatado."""
+        condition = {"predicates": [], "connectives": set()}
+        self._parse_or(condition)
+        return condition
+
+    def _parse_or(self, condition: dict):
+        self._parse_and(condition)
+        while self.accept("or"):
+            condition["connectives"].add("or")
+            self._parse_and(condition)
+
+    def _parse_and(self, condition: dict):
+        self._parse_not(condition)
+        while self.accept("and"):
+            condition["connectives"].add("and")
+            self._parse_not(condition)
+
+    def _parse_not(self, condition: dict):
+        negated = bool(self.accept("not"))
+        if self.accept("exists"):
+            self.expect("(")
+            condition["predicates"].append(("exists", negated, self.parse_query()))
+            self.expect(")")
+            return
+        if self.at("(") and not self._next_is_select():
+            # "(cond)" ou "(expr) op ...": tenta como condição e volta atrás se não for
+            start = self.pos
+            try:
+                self.pos += 1
+                inner = {"predicates": [], "connectives": set()}
+                self._parse_or(inner)
+                self.expect(")")
+                if not self._at_predicate_operator():
+                    condition["predicates"].extend(
+                        (not p[0],) + p[1:] if negated and p[0] in (True, False) else p
+                        for p in inner["predicates"]
+                    )
+                    condition["connectives"] |= inner["connectives"]
+                    return
+            except SQLParseError:
+                pass
+            self.pos = start
+        condition["predicates"].append(self.parse_predicate(negated))
+
+    def _next_is_select(self) -> bool:
+        following = self.peek(1)
+        return following is not None and following.value == "select"
+
+    def _at_predicate_operator(self) -> bool:
+        token = self.peek()
+        if token is None:
+            return False
+        return token.value in COMPARISON_OPS or token.value in ARITHMETIC_OPS or token.value in (
+            "between", "in", "like", "glob", "is", "not")
+
+    def parse_predicate(self, negated: bool):
+        left = self.parse_expression()
+        if self.accept("is"):
+            negated ^= bool(self.accept("not"))
+            self.expect("null")
+            return (negated, "is", left, ("null",))
+        negated ^= bool(self.accept("not"))
+        if self.accept("between"):
+            low = self.parse_expression()
+            self.expect("and")
+            high = self.parse_expression()
+            return (negated, "between", left, (low, high))
+        if self.accept("in"):
+            self.expect("(")
+            if self.at("select"):
+                right = ("subquery", self.parse_query())
+            else:
+                self._comma_list(self.parse_expression)
+                right = _VALUE
+            self.expect(")")
+            return (negated, "in", left, right)
+        operator = self.accept("like", "glob", *COMPARISON_OPS)
+        if operator is None:
+            found = self.peek().value if self.peek() else "fim da query"
+            raise SQLParseError(f"Operador de comparação esperado, encontrado {found!r}")
+        operator = {"==": "=", "<>": "!="}.get(operator, operator)
+        return (negated, operator, left, self.parse_expression())
+
+    # --- expressões ---
+
+    def parse_expression(self):
+        expr = self.parse_term()
+        while self.at(*ARITHMETIC_OPS):
+            operator = self.accept(*ARITHMETIC_OPS)
+            expr = ("arith", operator, expr, self.parse_term())
+        return expr
+
+    def parse_term(self):
+        token = self.peek()
+        if token is None:
+            raise SQLParseError("Expressão esperada, encontrado fim da query")
+
+        if token.kind in ("string", "number"):
+            self.pos += 1
+            return _VALUE
+        if token.value == "null":
+            self.pos += 1
+            return ("null",)
+        if token.value == "-" or token.value == "+":
+            self.pos += 1
+            return self.parse_term()
+        if token.value == "*":
+            self.pos += 1
+            return ("column", "*")
+        if token.value == "(":
+            self.pos += 1
+            expr = ("subquery", self.parse_query()) if self.at("select") else self.parse_expression()
+            self.expect(")")
+            return expr
+        if token.value == "case":
+            return self._parse_case()
+        if token.value == "cast":
+            self.pos += 1
+            self.expect("(")
+            expr = self.parse_expression()
+            self.expect("as")
+            while not self.at(")") and self.peek() is not None:
+                self.pos += 1
+            self.expect(")")
+            return ("cast", expr)
+        if token.value == "distinct":
+            self.pos += 1
+            return ("distinct", self.parse_expression())
+
+        if token.kind == "ident":
+            self.pos += 1
+            if self.accept("("):
+                return self._parse_call(token.value)
+            return ("column", token.value)
+
+        raise SQLParseError(f"Expressão esperada, encontrado {token.value!r}")
+
+    def _parse_call(self, name: str):
+        distinct = bool(self.accept("distinct"))
+        args = [] if self.at(")") else self._comma_list(self.parse_expression)
+        self.expect(")")
+        if name in AGGREGATES:
+            return ("agg", name, distinct, tuple(args))
+        return ("func", name, distinct, tuple(args))
+
+    def _parse_case(self):
+        self.expect("case")
+        depth = 1
+        while depth:
+            token = self.peek()
+            if token is None:
+                raise SQLParseError("CASE sem END")
+            self.pos += 1
+            if token.value == "case":
+                depth += 1
+            elif token.value == "end":
+                depth -= 1
+        return ("case",)
+
+
+def _sorted_tuple(items) -> tuple:
+    return tuple(sorted(items, key=repr))
+
+
+class _Normalizer:
+    """Resolve aliases e converte a árvore bruta em SQLComponents (comparável)."""
+
+    def __init__(self, aliases: dict):
+        self.aliases = aliases
+        self.default_table = None  # Única tabela do FROM da query atual
+
+    def column(self, name: str) -> str:
+        if "." not in name:
+            target = self.aliases.get(name)
+            if target is not None and "." in target:
+                name = target  # Alias de coluna do SELECT: t1.name AS n
+            elif self.default_table is not None:
+                return f"{self.default_table}.{name}"
+            else:
+                return name
+        qualifier, column = name.split(".", 1)
+        return f"{self.aliases.get(qualifier, qualifier)}.{column}"
+
+    def expr(self, node):
+        kind = node[0]
+        if kind == "column":
+            return ("column", self.column(node[1]) if node[1] != "*" else "*")
+        if kind in ("agg", "func"):
+            return (kind, node[1], node[2], tuple(self.expr(arg) for arg in node[3]))
+        if kind == "arith":
+            return ("arith", node[1], self.expr(node[2]), self.expr(node[3]))
+        if kind in ("cast", "distinct"):
+            return (kind, self.expr(node[1]))
+        if kind == "subquery":
+            return ("subquery", self.query(node[1]))
+        return node  # value, null, case
+
+    def predicate(self, predicate):
+        if predicate[0] == "exists":
+            return ("exists", predicate[1], self.query(predicate[2]))
+        negated, operator, left, right = predicate
+        if operator == "between":
+            right = (self.expr(right[0]), self.expr(right[1]))
+        elif right != _VALUE and right[0] != "null":
+            right = self.expr(right)
+        return (negated, operator, self.expr(left), right)
+
+    def condition(self, condition) -> tuple:
+        if condition is None:
+            return ()
+        return (
+            _sorted_tuple(self.predicate(p) for p in condition["predicates"]),
+            tuple(sorted(condition["connectives"])),
+        )
+
+    def table_unit(self, unit):
+        if unit[0] == "subquery":
+            return ("subquery", self.query(unit[1]))
+        return unit
+
+    def query(self, raw: Optional[dict]) -> Optional[SQLComponents]:
+        if raw is None:
+            return None
+        outer_table = self.default_table
+        tables = [unit[1] for unit in raw["from"] if unit[0] == "table"]
+        self.default_table = tables[0] if len(raw["from"]) == 1 and tables else None
+        try:
+            return self._query(raw)
+        finally:
+            self.default_table = outer_table
+
+    def _query(self, raw: dict) -> SQLComponents:
+        order_by = ()
+        if raw["order_by"] is not None:
+            direction, exprs = raw["order_by"]
+            order_by = (direction, tuple(self.expr(e) for e in exprs))
+        return SQLComponents(
+            select=(raw["distinct"], _sorted_tuple(self.expr(e) for e in raw["select"])),
+            from_=frozenset(self.table_unit(u) for u in raw["from"]),
+            where=self.condition(raw["where"]),
+            group_by=frozenset(self.expr(e) for e in raw["group_by"]),
+            having=self.condition(raw["having"]),
+            order_by=order_by,
+            limit=raw["limit"],
+            intersect=self.query(raw.get("intersect")),
+            union=self.query(raw.get("union")),
+            except_=self.query(raw.get("except")),
+        )
+
+
+def parse_sql(sql: str) -> SQLComponents:
+    """
+    Analisa uma query e retorna a árvore de componentes normalizada.
+
+    Raises:
+        SQLParseError: Se a query usar sintaxe não suportada
+    """
+    tokens = tokenize(sql)
+    if not tokens:
+        raise SQLParseError("Query vazia")
+    parser = _Parser(tokens)
+    raw = parser.parse()
+    return _Normalizer(parser.aliases).query(raw)
+
+
+@dataclass(frozen=True)
+class SQLAnalysis:
+    """Tudo o que as métricas precisam de uma query, calculado uma vez."""
+    normalized: str
+    tokens: frozenset
+    components: Optional[SQLComponents]
+    error: Optional[str] = None
+
+
+def normalize_sql(sql: str) -> str:
+    """Normaliza SQL para comparação"""
+    sql = " ".join(sql.split())
+    sql = sql.lower()
+    sql = sql.rstrip(";")
+    return sql.strip()
+
+
+@lru_cache(maxsize=ANALYSIS_CACHE_SIZE)
+def analyze_sql(sql: str) -> SQLAnalysis:
+    """Normalização, tokens e árvore de componentes de uma query (memorizado)."""
+    normalized = normalize_sql(sql)
+    try:
+        components, error = parse_sql(sql), None
+    except (SQLParseError, RecursionError) as e:
+        components, error = None, str(e)
+    return SQLAnalysis(normalized, frozenset(normalized.split()), components, error)
+
+
+def components_match(pred: SQLAnalysis, gold: SQLAnalysis) -> bool:
+    """EM: as árvores de componentes coincidem (predição que não analisa conta como erro)."""
+    if pred.components is None or gold.components is None:
+        return False
+    return pred.components == gold.components
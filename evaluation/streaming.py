@@ -0,0 +1,118 @@
+"""Avaliação em streaming de arquivos de resultados grandes
+
+Consome um iterador (ou um arquivo JSONL, um resultado por linha) e calcula
+todas as métricas numa única passada, com agregados incrementais: apenas uma
+janela de resultados fica em memória por vez. Métricas parciais são emitidas
+periodicamente.
+
+Uso:
+    python -m evaluation.streaming results.jsonl --report-every 10000
+"""
+import argparse
+import json
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional
+
+from loguru import logger
+
+from .execution_accuracy import EXACT
+from .metrics import MetricsAccumulator, compute_execution_outcomes
+
+# Resultados avaliados por vez (o EX de uma janela pode usar o pool de processos)
+DEFAULT_WINDOW = 1_000
+
+
+def iter_jsonl(path: str) -> Iterator[dict]:
+    """Lê um arquivo JSONL linha a linha, ignorando linhas em branco."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def evaluate_stream(
+    results: Iterable[dict],
+    report_every: int = 10_000,
+    on_partial: Optional[Callable[[dict], None]] = None,
+    window: int = DEFAULT_WINDOW,
+    workers: Optional[int] = None,
+    isolate: bool = False,
+    use_gold_cache: bool = True,
+    compare: str = EXACT,
+    order_sensitive: bool = False,
+) -> dict:
+    """
+    Avalia resultados em uma passada, em memória constante.
+
+    Args:
+        results: Iterador de resultados (predicted_sql, ground_truth_sql, db_path)
+        report_every: Emite métricas parciais a cada N resultados (0 desliga)
+        on_partial: Recebe as métricas parciais; padrão é logá-las
+        window: Resultados mantidos em memória por vez
+        workers: Processos para o EX de cada janela (agrupado por banco)
+        isolate, use_gold_cache, compare, order_sensitive: como em evaluate_results
+
+    Returns:
+        As mesmas métricas de evaluate_results
+    """
+    accumulator = MetricsAccumulator()
+    iterator = iter(results)
+    next_report = report_every
+
+    while True:
+        batch = list(islice(iterator, window))
+        if not batch:
+            break
+        execution, timing = compute_execution_outcomes(
+            batch, workers=workers, isolate=isolate, use_gold_cache=use_gold_cache,
+            compare=compare, order_sensitive=order_sensitive,
+        )
+        for record, outcome in zip(batch, execution):
+            accumulator.add(record, outcome)
+        accumulator.add_timing(timing)
+
+        if report_every and accumulator.total >= next_report:
+            partial = accumulator.summary()
+            if on_partial is not None:
+                on_partial(partial)
+            else:
+                _log_partial(partial)
+            next_report = (accumulator.total // report_every + 1) * report_every
+
+    return accumulator.summary(with_timing=True)
+
+
+def _log_partial(metrics: dict):
+    logger.info(
+        f"[{metrics['total_examples']}] EM={metrics['exact_set_match_accuracy']:.2%} "
+        f"EX={metrics['execution_accuracy']:.2%} "
+        f"String={metrics['string_exact_match_accuracy']:.2%} "
+        f"Overlap={metrics['average_token_overlap']:.2%}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Avaliação em streaming de um arquivo JSONL de resultados")
+    parser.add_argument("path", help="Arquivo JSONL (predicted_sql, ground_truth_sql, db_path por linha)")
+    parser.add_argument("--report-every", type=int, default=10_000, help="Métricas parciais a cada N resultados")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="Resultados em memória por vez")
+    parser.add_argument("--workers", type=int, default=None, help="Processos para o EX")
+    parser.add_argument("--ex-compare", choices=["exact", "hash"], default="exact")
+    parser.add_argument("--no-gold-cache", action="store_true")
+    parser.add_argument("--output", default=None, help="Salva as métricas finais em JSON")
+    args = parser.parse_args()
+
+    metrics = evaluate_stream(
+        iter_jsonl(args.path),
+        report_every=args.report_every,
+        window=args.window,
+        workers=args.workers,
+        use_gold_cache=not args.no_gold_cache,
+        compare=args.ex_compare,
+    )
+    _log_partial(metrics)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(metrics, f, indent=2, ensure_ascii=False)
+        logger.info(f"Métricas salvas em: {args.output}")
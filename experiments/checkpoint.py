@@ -0,0 +1,127 @@
+"""Checkpoint incremental (JSONL) das execuções do experimento
+
+Cada registro de resultado é anexado ao arquivo assim que o exemplo termina,
+então uma falha ou Ctrl-C perde no máximo as chamadas em andamento. Ao
+retomar (`--resume`), os pares (baseline, example_id) já concluídos são
+pulados e o JSON final é reconstruído a partir do checkpoint, sem chamar o
+modelo de novo.
+
+Formato (uma linha por evento):
+    {"config": {...}}                                   # primeira linha
+    {"baseline": "zero_shot", "record": {...}}
+    {"baseline": "rw_enhanced", "record": {...}}
+"""
+import glob
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+ZERO_SHOT = "zero_shot"
+RW_ENHANCED = "rw_enhanced"
+CHECKPOINT_SUFFIX = ".checkpoint.jsonl"
+
+# Configurações que mudam os registros: retomar com outro valor misturaria
+# no mesmo arquivo resultados de execuções diferentes
+RESUME_KEYS = ("backend", "model", "dataset", "split", "num_examples", "content_mode", "content_budget",
+               "max_content_chars", "rewrite_mode", "schema_linking_enabled", "schema_linking_min_tables",
+               "schema_linking_top_tables", "schema_linking_max_columns")
+
+
+def checkpoint_path_for(timestamp: str, results_dir: str = "results") -> str:
+    """Caminho do checkpoint de uma execução"""
+    return os.path.join(results_dir, f"experiment_dart_sql_{timestamp}{CHECKPOINT_SUFFIX}")
+
+
+def latest_checkpoint(results_dir: str = "results") -> Optional[str]:
+    """Checkpoint modificado mais recentemente, se houver"""
+    paths = glob.glob(os.path.join(results_dir, f"*{CHECKPOINT_SUFFIX}"))
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+class ExperimentCheckpoint:
+    """
+    Registros de resultado persistidos por exemplo.
+
+    Registros com "error" não contam como concluídos: são refeitos ao
+    retomar, e a linha mais recente de cada par prevalece.
+    """
+
+    def __init__(self, path: str, config: Optional[dict] = None):
+        self.path = path
+        self.config: dict = {}
+        self._records: Dict[Tuple[str, object], dict] = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            self._load()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        if not self.config and config is not None:
+            self.config = dict(config)
+            self._write({"config": self.config})
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Última linha cortada por uma interrupção no meio da escrita
+                    logger.warning(f"Linha {number} inválida em {self.path}; ignorando")
+                    continue
+                if "config" in entry:
+                    self.config = entry["config"]
+                else:
+                    record = entry["record"]
+                    self._records[(entry["baseline"], record["example_id"])] = record
+        logger.info(f"Checkpoint {self.path}: {self.completed_count()} registros concluídos")
+
+    def _write(self, entry: dict):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def mismatches(self, config: dict) -> Dict[str, Tuple[object, object]]:
+        """
+        Configurações da execução atual que divergem das do checkpoint.
+
+        Só compara as chaves de RESUME_KEYS gravadas no checkpoint.
+
+        Returns:
+            {chave: (valor no checkpoint, valor atual)}
+        """
+        return {
+            key: (self.config[key], config.get(key))
+            for key in RESUME_KEYS
+            if key in self.config and self.config[key] != config.get(key)
+        }
+
+    def is_done(self, baseline: str, example_id) -> bool:
+        record = self._records.get((baseline, example_id))
+        return record is not None and "error" not in record
+
+    def completed_count(self) -> int:
+        return sum(1 for record in self._records.values() if "error" not in record)
+
+    def append(self, baseline: str, record: dict):
+        """Persiste um registro (flush + fsync) antes de seguir para o próximo."""
+        with self._lock:
+            self._records[(baseline, record["example_id"])] = record
+            self._write({"baseline": baseline, "record": record})
+
+    def records(self, baseline: str, example_ids: List) -> List[dict]:
+        """Registros de um baseline na ordem dos exemplos (faltantes são omitidos)."""
+        return [
+            self._records[(baseline, example_id)]
+            for example_id in example_ids
+            if (baseline, example_id) in self._records
+        ]
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,138 @@
+"""Execução concorrente de chamadas ao LLM com controle de taxa
+
+Usado pelo `run_experiment` para rodar os baselines em paralelo:
+- Limite de requisições simultâneas (max_in_flight)
+- Orçamento de requisições/tokens por minuto (RPM / TPM)
+- Resultados devolvidos na mesma ordem dos jobs (saída determinística)
+
+Retries (429, 5xx, timeouts) ficam só no gateway do LLM (core.llm_gateway),
+que aplica deadline, backoff e circuit breaker a cada chamada; um job cuja
+chamada falhou mesmo assim é registrado com o erro e refeito no --resume.
+"""
+import asyncio
+import inspect
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, List, Optional
+
+from loguru import logger
+
+# Janela usada para os orçamentos RPM/TPM
+WINDOW_SECONDS = 60.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata de tokens (~4 caracteres por token)."""
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """
+    Orçamento de requisições e tokens numa janela deslizante de 60s.
+
+    Um job cujo custo sozinho excede o orçamento é liberado quando a
+    janela está vazia, para não travar o experimento.
+    """
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._events = deque()  # (timestamp, requests, tokens)
+        self._requests = 0
+        self._tokens = 0
+        self._lock = asyncio.Lock()
+
+    def _purge(self, now: float):
+        while self._events and now - self._events[0][0] >= WINDOW_SECONDS:
+            _, requests, tokens = self._events.popleft()
+            self._requests -= requests
+            self._tokens -= tokens
+
+    def _fits(self, requests: int, tokens: int) -> bool:
+        if not self._events:
+            return True
+        if self.rpm is not None and self._requests + requests > self.rpm:
+            return False
+        if self.tpm is not None and self._tokens + tokens > self.tpm:
+            return False
+        return True
+
+    async def acquire(self, requests: int = 1, tokens: int = 0):
+        """Espera até haver orçamento e registra o consumo."""
+        if self.rpm is None and self.tpm is None:
+            return
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                self._purge(now)
+                if self._fits(requests, tokens):
+                    self._events.append((now, requests, tokens))
+                    self._requests += requests
+                    self._tokens += tokens
+                    return
+                wait = self._events[0][0] + WINDOW_SECONDS - now
+            await asyncio.sleep(max(wait, 0.05))
+
+
+@dataclass
+class Job:
+    """Unidade de trabalho: uma chamada (ou pipeline) ao LLM."""
+    name: str
+    run: Callable[[], Awaitable[Any]]
+    requests: int = 1  # chamadas ao LLM feitas pelo job
+    tokens: int = 0    # tokens estimados (prompt + max_completion_tokens)
+
+
+async def _run_job(job: Job, semaphore: asyncio.Semaphore, limiter: RateLimiter) -> Any:
+    async with semaphore:
+        await limiter.acquire(job.requests, job.tokens)
+        return await job.run()
+
+
+async def run_jobs(
+    jobs: List[Job],
+    max_in_flight: int = 8,
+    rpm: Optional[int] = None,
+    tpm: Optional[int] = None,
+    on_done: Optional[Callable[[int, Any], Optional[Awaitable]]] = None,
+) -> List[Any]:
+    """
+    Executa os jobs concorrentemente respeitando os limites.
+
+    Args:
+        jobs: Lista de jobs
+        max_in_flight: Máximo de jobs simultâneos
+        rpm: Requisições por minuto (None = sem limite)
+        tpm: Tokens por minuto (None = sem limite)
+        on_done: Chamado com (índice do job, resultado ou exceção) assim que
+            cada job termina, por exemplo para persistir o resultado. Pode ser
+            assíncrono (é aguardado fora do limite de jobs simultâneos); E/S
+            bloqueante deve sair do event loop, senão trava os outros jobs
+
+    Returns:
+        Lista na mesma ordem de `jobs`, com o resultado de cada job ou a
+        exceção que ele levantou.
+    """
+    semaphore = asyncio.Semaphore(max_in_flight)
+    limiter = RateLimiter(rpm=rpm, tpm=tpm)
+    total = len(jobs)
+    done = 0
+
+    async def tracked(index: int, job: Job):
+        nonlocal done
+        try:
+            result = await _run_job(job, semaphore, limiter)
+        except Exception as e:
+            result = e
+        done += 1
+        logger.info(f"  [{done}/{total}] {job.name} concluído")
+        if on_done is not None:
+            pending = on_done(index, result)
+            if inspect.isawaitable(pending):
+                await pending
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return await asyncio.gather(*(tracked(i, job) for i, job in enumerate(jobs)), return_exceptions=True)
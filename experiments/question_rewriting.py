@@ -1,14 +1,20 @@
 """Question Rewriting seguindo metodologia DART-SQL"""
 from loguru import logger
-from openai import OpenAI
 from pathlib import Path
+import asyncio
 import json
+import re
+import time
+import anyio
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from typing import AsyncIterator
 from core.config import settings
-
-client = OpenAI(api_key=settings.PROJETO_TAES_OPENAI_API_KEY)
-
-# Modelo usado no experimento
-MODEL = "gpt-5-nano"
+from core.llm import Completion, acreate_completion, astream_completion, create_completion
+from core.llm_gateway import is_unavailable
+from core.schema_cache import schema_file_cache
+from core.schema_linking import link_schema, schema_coverage
+from core.telemetry import record_gate_decision, record_speculation, stage_timer, timed_stream
 
 def build_rewriting_prompt(question: str, db_content: str) -> str:
     """
@@ -24,13 +30,36 @@ Original question: {question}
 
 Rewritten question (in English, only the question without explanations):"""
 
-def rewrite_question(question: str, db_content: str = "") -> str:
+def _clean_rewritten_question(completion: Completion, question: str) -> str:
+    """Extrai a questão reescrita da resposta do modelo (fallback: original)."""
+    rewritten = completion.content.strip()
+    
+    # Limpar prefixos comuns que o modelo pode adicionar
+    prefixes = ["Pergunta reescrita:", "Reescrita:", "Resposta:"]
+    for prefix in prefixes:
+        if rewritten.startswith(prefix):
+            rewritten = rewritten[len(prefix):].strip()
+    
+    # DEBUG: Log completo da resposta
+    logger.debug(f"Resposta do modelo (completa): '{rewritten}'")
+    logger.debug(f"Tamanho da resposta: {len(rewritten)} caracteres")
+    logger.debug(f"Finish reason: {completion.finish_reason} (cache: {completion.cached})")
+    
+    if not rewritten:
+        logger.warning("⚠️ Modelo retornou string vazia! Usando questão original.")
+        return question
+    
+    logger.info(f"Reescrita: {rewritten}")
+    return rewritten
+
+def rewrite_question(question: str, db_content: str = "", use_cache: bool = True) -> str:
     """
     Reescreve pergunta usando LLM com conteúdo do banco.
     
     Args:
         question: Questão original
         db_content: K=5 registros de cada tabela
+        use_cache: False ignora o cache de respostas (nova amostra)
     
     Returns:
         Questão reescrita
@@ -44,55 +73,58 @@ def rewrite_question(question: str, db_content: str = "") -> str:
     logger.debug(f"📏 Primeiros 2000 chars: {prompt[:2000]}")
     
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            max_completion_tokens=2000  # Aumentado de 500 para 2000
-        )
-        
-        rewritten = response.choices[0].message.content.strip()
-        
-        # Limpar prefixos comuns que o modelo pode adicionar
-        prefixes = ["Pergunta reescrita:", "Reescrita:", "Resposta:"]
-        for prefix in prefixes:
-            if rewritten.startswith(prefix):
-                rewritten = rewritten[len(prefix):].strip()
-        
-        # DEBUG: Log completo da resposta
-        logger.debug(f"Resposta do modelo (completa): '{rewritten}'")
-        logger.debug(f"Tamanho da resposta: {len(rewritten)} caracteres")
-        logger.debug(f"Finish reason: {response.choices[0].finish_reason}")
-        
-        if not rewritten:
-            logger.warning("⚠️ Modelo retornou string vazia! Usando questão original.")
-            return question
-        
-        logger.info(f"Reescrita: {rewritten}")
-        return rewritten
+        with stage_timer("rewrite"):
+            completion = create_completion(
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                max_completion_tokens=2000,  # Aumentado de 500 para 2000
+                use_cache=use_cache,
+                stage="rewrite"
+            )
+        with stage_timer("postprocess"):
+            return _clean_rewritten_question(completion, question)
         
     except Exception as e:
+        if is_unavailable(e):
+            # LLM indisponível (429, 5xx, timeout, circuito aberto, já após os retries
+            # do gateway): a geração falharia igual, então o erro sobe como nela
+            raise
         logger.error(f"Erro ao reescrever: {e}")
         # Fallback: retorna original
         return question
 
-def generate_sql_from_question(question: str, db_schema: str) -> str:
-    """
-    Gera SQL a partir da pergunta (original ou reescrita) + schema.
-    Usa o mesmo prompt zero-shot para ambos os baselines.
-    
-    Args:
-        question: Questão (original ou reescrita)
-        db_schema: Schema do banco (CREATE TABLE statements)
+async def rewrite_question_async(question: str, db_content: str = "", use_cache: bool = True) -> str:
+    """Versão assíncrona de `rewrite_question` (usa `AsyncOpenAI`)."""
+    logger.info(f"Reescrevendo: {question}")
     
-    Returns:
-        Query SQL gerada
-    """
-    logger.info(f"Gerando SQL para: {question}")
+    prompt = build_rewriting_prompt(question, db_content)
+    logger.debug(f"📏 Tamanho do prompt: {len(prompt)} caracteres")
     
-    # Prompt Zero-Shot padrão (similar ao DAIL-SQL sem exemplos)
-    system_prompt = """You are a SQL expert. Generate a SQL query based on the question and database schema provided.
+    try:
+        with stage_timer("rewrite"):
+            completion = await acreate_completion(
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                max_completion_tokens=2000,
+                use_cache=use_cache,
+                stage="rewrite"
+            )
+        with stage_timer("postprocess"):
+            return _clean_rewritten_question(completion, question)
+        
+    except Exception as e:
+        if is_unavailable(e):
+            # LLM indisponível (429, 5xx, timeout, circuito aberto, já após os retries
+            # do gateway): a geração falharia igual, então o erro sobe como nela
+            raise
+        logger.error(f"Erro ao reescrever: {e}")
+        # Fallback: retorna original
+        return question
+
+# Prompt Zero-Shot padrão (similar ao DAIL-SQL sem exemplos)
+SQL_GENERATION_SYSTEM_PROMPT = """You are a SQL expert. Generate a SQL query based on the question and database schema provided.
 
 Rules:
 - Return ONLY the SQL query, no explanations or translations
@@ -101,6 +133,8 @@ Rules:
 - Follow the schema exactly as provided
 - Do NOT translate or explain the question, just generate the SQL"""
 
+def build_sql_generation_messages(question: str, db_schema: str) -> list[dict]:
+    """Monta as mensagens (system + user) do prompt de geração de SQL."""
     user_prompt = f"""### Database Schema:
 {db_schema}
 
@@ -109,58 +143,282 @@ Rules:
 
 ### SQL Query:"""
 
+    return [
+        {"role": "system", "content": SQL_GENERATION_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def _clean_generated_sql(completion: Completion, question: str) -> str:
+    """Extrai o SQL da resposta do modelo removendo blocos markdown."""
+    sql = completion.content.strip()
+    
+    # DEBUG: Log resposta antes de processar
+    logger.debug(f"SQL bruto recebido: '{sql[:200]}'")
+    logger.debug(f"Finish reason: {completion.finish_reason} (cache: {completion.cached})")
+    
+    # Remove markdown se presente
+    if sql.startswith("```"):
+        lines = sql.split("\n")
+        sql = "\n".join(lines[1:-1]) if len(lines) > 2 else sql
+        sql = sql.replace("```sql", "").replace("```", "").strip()
+    
+    if not sql:
+        logger.warning(f"⚠️ SQL vazio após processar! Questão era: {question[:100]}")
+    
+    logger.info(f"SQL gerado: {sql[:100]}...")
+    return sql
+
+def generate_sql_from_question(question: str, db_schema: str, use_cache: bool = True) -> str:
+    """
+    Gera SQL a partir da pergunta (original ou reescrita) + schema.
+    Usa o mesmo prompt zero-shot para ambos os baselines.
+    
+    Args:
+        question: Questão (original ou reescrita)
+        db_schema: Schema do banco (CREATE TABLE statements)
+        use_cache: False ignora o cache de respostas (nova amostra)
+    
+    Returns:
+        Query SQL gerada
+    """
+    logger.info(f"Gerando SQL para: {question}")
+
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_completion_tokens=2000  # Aumentado de 500 para 2000
-        )
-        
-        sql = response.choices[0].message.content.strip()
+        with stage_timer("generation"):
+            completion = create_completion(
+                messages=build_sql_generation_messages(question, db_schema),
+                max_completion_tokens=2000,  # Aumentado de 500 para 2000
+                use_cache=use_cache,
+                stage="generation"
+            )
+        with stage_timer("postprocess"):
+            return _clean_generated_sql(completion, question)
         
-        # DEBUG: Log resposta antes de processar
-        logger.debug(f"SQL bruto recebido: '{sql[:200]}'")
-        logger.debug(f"Finish reason: {response.choices[0].finish_reason}")
-        
-        # Remove markdown se presente
-        if sql.startswith("```"):
-            lines = sql.split("\n")
-            sql = "\n".join(lines[1:-1]) if len(lines) > 2 else sql
-            sql = sql.replace("```sql", "").replace("```", "").strip()
-        
-        if not sql:
-            logger.warning(f"⚠️ SQL vazio após processar! Questão era: {question[:100]}")
+    except Exception as e:
+        logger.error(f"Erro ao gerar SQL: {e}")
+        raise
+
+async def generate_sql_from_question_async(question: str, db_schema: str, use_cache: bool = True) -> str:
+    """Versão assíncrona de `generate_sql_from_question` (usa `AsyncOpenAI`)."""
+    logger.info(f"Gerando SQL para: {question}")
+
+    try:
+        with stage_timer("generation"):
+            completion = await acreate_completion(
+                messages=build_sql_generation_messages(question, db_schema),
+                max_completion_tokens=2000,
+                use_cache=use_cache,
+                stage="generation"
+            )
+        with stage_timer("postprocess"):
+            return _clean_generated_sql(completion, question)
         
-        logger.info(f"SQL gerado: {sql[:100]}...")
-        return sql
+    except Exception as e:
+        logger.error(f"Erro ao gerar SQL: {e}")
+        raise
+
+async def stream_sql_from_question(question: str, db_schema: str, use_cache: bool = True) -> AsyncIterator[tuple[str, str]]:
+    """
+    Versão em streaming de `generate_sql_from_question`.
+    
+    Yields:
+        ("delta", trecho) para cada pedaço recebido do modelo e, no final,
+        ("sql", query) com o SQL já limpo (sem markdown)
+    """
+    logger.info(f"Gerando SQL (stream) para: {question}")
+
+    try:
+        parts = []
+        # Mede só a espera pelo modelo, não o tempo do cliente SSE entre os trechos
+        deltas = astream_completion(
+            messages=build_sql_generation_messages(question, db_schema),
+            max_completion_tokens=2000,
+            use_cache=use_cache,
+            stage="generation"
+        )
+        async for delta in timed_stream("generation", deltas):
+            parts.append(delta)
+            yield "delta", delta
+        with stage_timer("postprocess"):
+            sql = _clean_generated_sql(Completion(content="".join(parts)), question)
+        yield "sql", sql
         
     except Exception as e:
         logger.error(f"Erro ao gerar SQL: {e}")
         raise
 
-def generate_sql_with_rewriting(question: str, db_schema: str, db_content: str) -> dict:
+# Modos do pipeline RW-Enhanced:
+# - "always": reescreve e só então gera o SQL (duas chamadas em série)
+# - "speculative": gera o SQL da questão original em paralelo com a reescrita
+#   e o aproveita se a reescrita não mudou a questão
+# - "gate": pula a reescrita quando a questão já usa os termos do schema e
+#   dos valores do banco (cobertura >= REWRITE_GATE_THRESHOLD)
+REWRITE_ALWAYS = "always"
+REWRITE_SPECULATIVE = "speculative"
+REWRITE_GATE = "gate"
+REWRITE_MODES = (REWRITE_ALWAYS, REWRITE_SPECULATIVE, REWRITE_GATE)
+
+
+def _normalize_question(text: str) -> str:
+    """Minúsculas, sem pontuação e com espaços colapsados."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def question_similarity(original: str, rewritten: str) -> float:
+    """Similaridade (0-1) entre as questões normalizadas; 1.0 quando iguais."""
+    a, b = _normalize_question(original), _normalize_question(rewritten)
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a.split(), b.split()).ratio()
+
+
+def _speculation_result(hit: bool, similarity: float) -> dict:
+    record_speculation(hit)
+    logger.info(f"Especulação {'aproveitada' if hit else 'descartada'} (similaridade {similarity:.2f})")
+    return {"hit": hit, "similarity": similarity}
+
+
+def _prepare_pipeline(question: str, db_schema: str, db_content: str, rewrite_mode: str) -> tuple:
+    """
+    Etapas locais (CPU) antes das chamadas ao LLM: poda do schema e, no modo
+    "gate", a decisão de pular a reescrita.
+    
+    Returns:
+        (SchemaLinkingResult, {"coverage", "bypassed"} ou None)
+    """
+    if rewrite_mode not in REWRITE_MODES:
+        raise ValueError(f"rewrite_mode inválido: {rewrite_mode} (esperado um de {REWRITE_MODES})")
+    
+    linking = link_schema(question, db_schema, db_content)
+    gate = None
+    if rewrite_mode == REWRITE_GATE:
+        coverage = schema_coverage(question, db_schema, db_content)
+        bypassed = coverage >= settings.REWRITE_GATE_THRESHOLD
+        record_gate_decision(bypassed)
+        logger.info(f"Gate: cobertura {coverage:.2f} -> {'sem reescrita' if bypassed else 'reescrevendo'}")
+        gate = {"coverage": coverage, "bypassed": bypassed}
+    return linking, gate
+
+
+def generate_sql_with_rewriting(question: str, db_schema: str, db_content: str, use_cache: bool = True,
+                                rewrite_mode: str = REWRITE_ALWAYS) -> dict:
     """
     Pipeline RW-Enhanced Zero-Shot:
+    0. Poda schema e conteúdo para as tabelas relevantes (schemas grandes)
     1. Reescreve a questão usando conteúdo do banco
     2. Gera SQL da questão reescrita + schema
     
+    No modo "speculative", a etapa 2 começa já com a questão original (numa
+    thread) enquanto a etapa 1 roda; se a reescrita sair praticamente igual
+    à original, o SQL especulativo é usado e a segunda chamada não acontece.
+    No modo "gate", a etapa 1 é pulada quando a cobertura da questão pelos
+    termos do schema/valores passa do limiar.
+    
     Returns:
-        Dict com questão original, reescrita e SQL gerado
+        Dict com questão original, reescrita, SQL gerado, estatísticas da poda,
+        latência total (ms) e, conforme o modo, "speculation" ({"hit",
+        "similarity"}) ou "gate" ({"coverage", "bypassed"})
     """
-    # Etapa 1: Question Rewriting
-    rewritten_question = rewrite_question(question, db_content)
+    started = time.perf_counter()
+    
+    # Etapa 0: Schema linking (pela questão original) e gate
+    linking, gate = _prepare_pipeline(question, db_schema, db_content, rewrite_mode)
+    speculation = None
     
-    # Etapa 2: SQL Generation da questão reescrita
-    sql = generate_sql_from_question(rewritten_question, db_schema)
+    if gate is not None and gate["bypassed"]:
+        # Questão já alinhada ao schema: gera direto da original
+        rewritten_question = question
+        sql = generate_sql_from_question(question, linking.schema, use_cache=use_cache)
+    elif rewrite_mode == REWRITE_SPECULATIVE:
+        pool = ThreadPoolExecutor(max_workers=1)
+        try:
+            speculative = pool.submit(generate_sql_from_question, question, linking.schema, use_cache)
+            rewritten_question = rewrite_question(question, linking.content, use_cache=use_cache)
+            similarity = question_similarity(question, rewritten_question)
+            sql = None
+            if similarity >= settings.SPECULATIVE_SIMILARITY_THRESHOLD:
+                try:
+                    sql = speculative.result()
+                except Exception as e:
+                    logger.warning(f"Geração especulativa falhou ({e}); gerando de novo")
+            speculation = _speculation_result(sql is not None, similarity)
+        finally:
+            # Uma chamada já em andamento não pode ser interrompida: sem esperar, o resultado é descartado
+            speculative.cancel()
+            pool.shutdown(wait=False)
+        if sql is None:
+            sql = generate_sql_from_question(rewritten_question, linking.schema, use_cache=use_cache)
+    else:
+        # Etapa 1: Question Rewriting
+        rewritten_question = rewrite_question(question, linking.content, use_cache=use_cache)
+        
+        # Etapa 2: SQL Generation da questão reescrita
+        sql = generate_sql_from_question(rewritten_question, linking.schema, use_cache=use_cache)
     
-    return {
+    result = {
         "original_question": question,
         "rewritten_question": rewritten_question,
-        "generated_sql": sql
+        "generated_sql": sql,
+        "schema_linking": linking.stats(),
+        "latency_ms": (time.perf_counter() - started) * 1000
     }
+    if speculation is not None:
+        result["speculation"] = speculation
+    if gate is not None:
+        result["gate"] = gate
+    return result
+
+async def generate_sql_with_rewriting_async(question: str, db_schema: str, db_content: str, use_cache: bool = True,
+                                            rewrite_mode: str = REWRITE_ALWAYS) -> dict:
+    """Versão assíncrona do pipeline RW-Enhanced Zero-Shot (mesmos modos)."""
+    started = time.perf_counter()
+    
+    # A indexação de um schema novo é CPU: roda numa thread
+    linking, gate = await anyio.to_thread.run_sync(_prepare_pipeline, question, db_schema, db_content, rewrite_mode)
+    speculation = None
+    
+    if gate is not None and gate["bypassed"]:
+        rewritten_question = question
+        sql = await generate_sql_from_question_async(question, linking.schema, use_cache=use_cache)
+    elif rewrite_mode == REWRITE_SPECULATIVE:
+        speculative = asyncio.create_task(
+            generate_sql_from_question_async(question, linking.schema, use_cache=use_cache)
+        )
+        # Uma especulação descartada que falhar não deve gerar aviso de exceção não lida
+        speculative.add_done_callback(lambda task: task.cancelled() or task.exception())
+        try:
+            rewritten_question = await rewrite_question_async(question, linking.content, use_cache=use_cache)
+        except BaseException:
+            speculative.cancel()
+            raise
+        similarity = question_similarity(question, rewritten_question)
+        sql = None
+        if similarity >= settings.SPECULATIVE_SIMILARITY_THRESHOLD:
+            try:
+                sql = await speculative
+            except Exception as e:
+                logger.warning(f"Geração especulativa falhou ({e}); gerando de novo")
+        else:
+            speculative.cancel()
+        speculation = _speculation_result(sql is not None, similarity)
+        if sql is None:
+            sql = await generate_sql_from_question_async(rewritten_question, linking.schema, use_cache=use_cache)
+    else:
+        rewritten_question = await rewrite_question_async(question, linking.content, use_cache=use_cache)
+        sql = await generate_sql_from_question_async(rewritten_question, linking.schema, use_cache=use_cache)
+    
+    result = {
+        "original_question": question,
+        "rewritten_question": rewritten_question,
+        "generated_sql": sql,
+        "schema_linking": linking.stats(),
+        "latency_ms": (time.perf_counter() - started) * 1000
+    }
+    if speculation is not None:
+        result["speculation"] = speculation
+    if gate is not None:
+        result["gate"] = gate
+    return result
 
 
 def load_schema_from_file(file_path: str) -> str:
@@ -190,6 +448,23 @@ def load_schema_from_file(file_path: str) -> str:
         raise
 
 
+# Namespace das entradas deste loader no cache de arquivos de schema
+SCHEMA_AND_CONTENT_CACHE_NAMESPACE = "schema_and_content"
+
+
+def _parse_schema_and_content(data: dict) -> tuple[str, str]:
+    """Extrai (schema, records) do JSON já decodificado."""
+    schema = data.get("schema", "").strip()
+    db_content = data.get("records", "").strip()
+    return schema, db_content
+
+
+def _read_schema_and_content(path: Path) -> tuple[str, str]:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return _parse_schema_and_content(data)
+
+
 def load_schema_and_content_from_file(file_path: str) -> tuple[str, str]:
     """
     Carrega schema E conteúdo do banco de um arquivo JSON.
@@ -211,12 +486,50 @@ def load_schema_and_content_from_file(file_path: str) -> tuple[str, str]:
         if not path.exists():
             raise FileNotFoundError(f"Schema file not found: {file_path}")
         
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # Extrair schema e records do JSON (cache invalidado por mtime/tamanho)
+        with stage_timer("schema_load"):
+            schema, db_content = schema_file_cache.load(
+                path, SCHEMA_AND_CONTENT_CACHE_NAMESPACE, _read_schema_and_content
+            )
         
-        # Extrair schema e records do JSON
-        schema = data.get("schema", "").strip()
-        db_content = data.get("records", "").strip()
+        logger.info(f"Schema e conteúdo carregados de: {file_path}")
+        return schema, db_content
+        
+    except json.JSONDecodeError as e:
+        logger.error(f"Erro ao decodificar JSON: {e}")
+        raise ValueError(f"Invalid JSON format in {file_path}: {e}")
+    except Exception as e:
+        logger.error(f"Erro ao carregar schema e conteúdo: {e}")
+        raise
+
+
+async def load_schema_and_content_from_file_async(file_path: str) -> tuple[str, str]:
+    """
+    Versão assíncrona de `load_schema_and_content_from_file`.
+    
+    A leitura do arquivo usa I/O assíncrono (anyio) e o `json.loads` roda
+    numa thread, já que os arquivos de schema podem ter vários MB. O
+    resultado fica no cache de processo até o arquivo mudar (mtime/tamanho).
+    """
+    try:
+        path = anyio.Path(file_path)
+        
+        if not await path.exists():
+            raise FileNotFoundError(f"Schema file not found: {file_path}")
+        
+        with stage_timer("schema_load"):
+            path = await path.resolve()
+            stat = await path.stat()
+            cached = schema_file_cache.get(Path(path), SCHEMA_AND_CONTENT_CACHE_NAMESPACE, stat)
+            
+            if cached is not None:
+                schema, db_content = cached
+            else:
+                text = await path.read_text(encoding='utf-8')
+                data = await anyio.to_thread.run_sync(json.loads, text)
+                
+                schema, db_content = _parse_schema_and_content(data)
+                schema_file_cache.put(Path(path), SCHEMA_AND_CONTENT_CACHE_NAMESPACE, stat, (schema, db_content))
         
         logger.info(f"Schema e conteúdo carregados de: {file_path}")
         return schema, db_content
@@ -226,4 +539,4 @@ def load_schema_and_content_from_file(file_path: str) -> tuple[str, str]:
         raise ValueError(f"Invalid JSON format in {file_path}: {e}")
     except Exception as e:
         logger.error(f"Erro ao carregar schema e conteúdo: {e}")
-        raise
\ No newline at end of file
+        raise
@@ -9,103 +9,351 @@ Métricas:
 - String Exact Match
 - Token Overlap
 """
+import argparse
+import asyncio
 import json
 import os
 from datetime import datetime
+import anyio
 from loguru import logger
 
-from data.spider_loader import load_spider_dataset, prepare_examples
-from experiments.question_rewriting import generate_sql_with_rewriting
-from experiments.zero_shot_baseline import generate_sql_zero_shot
+from data.spider_loader import EXAMPLE_COLUMNS, load_spider_dataset, prepare_examples
+from data.value_index import log_value_index_stats
+from experiments.checkpoint import (
+    RW_ENHANCED,
+    ZERO_SHOT,
+    ExperimentCheckpoint,
+    checkpoint_path_for,
+    latest_checkpoint,
+)
+from experiments.concurrent_runner import Job, estimate_tokens, run_jobs
+from experiments.question_rewriting import (
+    REWRITE_ALWAYS,
+    build_rewriting_prompt,
+    generate_sql_with_rewriting,
+    generate_sql_with_rewriting_async,
+)
+from experiments.zero_shot_baseline import generate_sql_zero_shot, generate_sql_zero_shot_async
+from evaluation.gold_cache import get_gold_cache
 from evaluation.metrics import compare_methods
+from core.config import settings
+from core.llm import get_model
+from core.llm_cache import get_llm_cache
 
-def run_experiment(num_examples=10):
-    """Executa experimento completo conforme metodologia DART-SQL"""
-    
-    logger.info("="*80)
-    logger.info("EXPERIMENTO DART-SQL: Question Rewriting vs Zero-Shot")
-    logger.info("="*80)
-    logger.info(f"Modelo: GPT-5 nano")
-    logger.info(f"Dataset: Spider-Realistic")
-    logger.info(f"Exemplos: {num_examples}")
-    logger.info("="*80)
+def _zero_shot_record(ex, result=None, error=None) -> dict:
+    """Monta o registro de resultado do Baseline 1 para um exemplo."""
+    if error is not None:
+        return {
+            "example_id": ex["id"],
+            "db_id": ex["db_id"],
+            "db_path": ex["db_path"],
+            "original_question": ex["question"],
+            "predicted_sql": "",
+            "ground_truth_sql": ex["query"],
+            "error": str(error)
+        }
+    return {
+        "example_id": ex["id"],
+        "db_id": ex["db_id"],
+        "db_path": ex["db_path"],
+        "original_question": ex["question"],
+        "predicted_sql": result["generated_sql"],
+        "ground_truth_sql": ex["query"]
+    }
+
+def _rewriting_record(ex, result=None, error=None) -> dict:
+    """Monta o registro de resultado do Baseline 2 para um exemplo."""
+    if error is not None:
+        return {
+            "example_id": ex["id"],
+            "db_id": ex["db_id"],
+            "db_path": ex["db_path"],
+            "original_question": ex["question"],
+            "rewritten_question": "",
+            "predicted_sql": "",
+            "ground_truth_sql": ex["query"],
+            "error": str(error)
+        }
+    return {
+        "example_id": ex["id"],
+        "db_id": ex["db_id"],
+        "db_path": ex["db_path"],
+        "original_question": ex["question"],
+        "rewritten_question": result["rewritten_question"],
+        "predicted_sql": result["generated_sql"],
+        "ground_truth_sql": ex["query"],
+        "latency_ms": result.get("latency_ms"),
+        **{key: result[key] for key in ("speculation", "gate") if key in result}
+    }
+
+def _summarize_gate(rewriting_results) -> dict:
+    """
+    Resumo do modo "gate": quantas reescritas foram puladas e a latência
+    média do Baseline 2 com e sem reescrita. O efeito no EX sai da
+    comparação com uma execução em modo "always" sobre os mesmos exemplos.
+    """
+    gated = [r for r in rewriting_results if "gate" in r and r.get("latency_ms") is not None]
+    if not gated:
+        return {}
+    bypassed = [r["latency_ms"] for r in gated if r["gate"]["bypassed"]]
+    rewritten = [r["latency_ms"] for r in gated if not r["gate"]["bypassed"]]
+    mean = lambda values: sum(values) / len(values) if values else None
+    summary = {
+        "total": len(gated),
+        "bypassed": len(bypassed),
+        "bypass_ratio": len(bypassed) / len(gated),
+        "mean_latency_ms_bypassed": mean(bypassed),
+        "mean_latency_ms_rewritten": mean(rewritten),
+    }
+    logger.info(f"Gate: {summary['bypassed']}/{summary['total']} reescritas puladas "
+                f"({summary['bypass_ratio']:.2%}); latência média "
+                f"{summary['mean_latency_ms_bypassed'] or 0:.0f} ms sem reescrita vs "
+                f"{summary['mean_latency_ms_rewritten'] or 0:.0f} ms com reescrita")
+    return summary
+
+def _schema_linking_config() -> dict:
+    """Configurações da poda de schema, que mudam o prompt dos dois baselines"""
+    return {
+        "schema_linking_enabled": settings.SCHEMA_LINKING_ENABLED,
+        "schema_linking_min_tables": settings.SCHEMA_LINKING_MIN_TABLES,
+        "schema_linking_top_tables": settings.SCHEMA_LINKING_TOP_TABLES,
+        "schema_linking_max_columns": settings.SCHEMA_LINKING_MAX_COLUMNS,
+    }
+
+
+def _run_baselines_sequentially(examples, checkpoint, use_cache=True, rewrite_mode=REWRITE_ALWAYS):
+    """
+    Executa Baseline 1 e depois Baseline 2, um exemplo por vez.
     
-    # 1. Carregar dados
-    logger.info("\n[1/4] Carregando dataset Spider-Realistic...")
-    df = load_spider_dataset("dev")
-    examples = prepare_examples(df, limit=num_examples)
-    logger.info(f"Carregados {len(examples)} exemplos com schema e conteúdo")
+    Cada registro vai para o checkpoint assim que fica pronto; exemplos já
+    concluídos no checkpoint são pulados.
+    """
+    num_examples = len(examples)
     
-    # 2. BASELINE 1: Zero-Shot (Questão Original + Schema)
+    # BASELINE 1: Zero-Shot (Questão Original + Schema)
     logger.info(f"\n[2/4] Executando BASELINE 1 - Zero-Shot...")
     logger.info("Estrutura: Questão Original + Schema + Instruções Zero-Shot")
-    zero_shot_results = []
     
     for i, ex in enumerate(examples, 1):
+        if checkpoint.is_done(ZERO_SHOT, ex["id"]):
+            continue
         logger.info(f"\n  [{i}/{num_examples}] {ex['question']}")
         try:
             result = generate_sql_zero_shot(
                 question=ex["question"],
-                db_schema=ex["db_schema"]
+                db_schema=ex["db_schema"],
+                use_cache=use_cache
             )
-            zero_shot_results.append({
-                "example_id": ex["id"],
-                "db_id": ex["db_id"],
-                "db_path": ex["db_path"],
-                "original_question": ex["question"],
-                "predicted_sql": result["generated_sql"],
-                "ground_truth_sql": ex["query"]
-            })
+            checkpoint.append(ZERO_SHOT, _zero_shot_record(ex, result))
         except Exception as e:
             logger.error(f"Erro: {e}")
-            zero_shot_results.append({
-                "example_id": ex["id"],
-                "db_id": ex["db_id"],
-                "db_path": ex["db_path"],
-                "original_question": ex["question"],
-                "predicted_sql": "",
-                "ground_truth_sql": ex["query"],
-                "error": str(e)
-            })
-    
-    # 3. BASELINE 2: RW-Enhanced (Questão Reescrita + Schema)
+            checkpoint.append(ZERO_SHOT, _zero_shot_record(ex, error=e))
+    
+    # BASELINE 2: RW-Enhanced (Questão Reescrita + Schema)
     logger.info(f"\n[3/4] Executando BASELINE 2 - RW-Enhanced Zero-Shot...")
     logger.info("Estrutura: Questão Reescrita + Schema + Instruções Zero-Shot")
-    rewriting_results = []
     
     for i, ex in enumerate(examples, 1):
+        if checkpoint.is_done(RW_ENHANCED, ex["id"]):
+            continue
         logger.info(f"\n  [{i}/{num_examples}] {ex['question']}")
         try:
             result = generate_sql_with_rewriting(
                 question=ex["question"],
                 db_schema=ex["db_schema"],
-                db_content=ex["db_content"]
+                db_content=ex["db_content"],
+                use_cache=use_cache,
+                rewrite_mode=rewrite_mode
             )
-            rewriting_results.append({
-                "example_id": ex["id"],
-                "db_id": ex["db_id"],
-                "db_path": ex["db_path"],
-                "original_question": ex["question"],
-                "rewritten_question": result["rewritten_question"],
-                "predicted_sql": result["generated_sql"],
-                "ground_truth_sql": ex["query"]
-            })
+            checkpoint.append(RW_ENHANCED, _rewriting_record(ex, result))
         except Exception as e:
             logger.error(f"Erro: {e}")
-            rewriting_results.append({
-                "example_id": ex["id"],
-                "db_id": ex["db_id"],
-                "db_path": ex["db_path"],
-                "original_question": ex["question"],
-                "rewritten_question": "",
-                "predicted_sql": "",
-                "ground_truth_sql": ex["query"],
-                "error": str(e)
-            })
+            checkpoint.append(RW_ENHANCED, _rewriting_record(ex, error=e))
+
+async def _run_baselines_concurrently(examples, checkpoint, concurrency, rpm=None, tpm=None, use_cache=True,
+                                      rewrite_mode=REWRITE_ALWAYS):
+    """
+    Executa os dois baselines intercalados no mesmo pool concorrente.
+    
+    Cada registro vai para o checkpoint assim que seu job termina; pares
+    (baseline, exemplo) já concluídos não viram jobs.
+    """
+    logger.info(f"\n[2-3/4] Executando BASELINES 1 e 2 concorrentemente "
+                f"(max_in_flight={concurrency}, rpm={rpm}, tpm={tpm})...")
+    jobs = []
+    # Para cada job: (baseline, exemplo, função que monta o registro)
+    targets = []
+    for ex in examples:
+        if not checkpoint.is_done(ZERO_SHOT, ex["id"]):
+            # Custo estimado: prompt + max_completion_tokens de cada chamada
+            zero_shot_tokens = estimate_tokens(ex["question"] + ex["db_schema"]) + 500
+            jobs.append(Job(
+                name=f"zero_shot/{ex['id']}",
+                run=lambda ex=ex: generate_sql_zero_shot_async(
+                    question=ex["question"],
+                    db_schema=ex["db_schema"],
+                    use_cache=use_cache
+                ),
+                requests=1,
+                tokens=zero_shot_tokens,
+            ))
+            targets.append((ZERO_SHOT, ex, _zero_shot_record))
+        if not checkpoint.is_done(RW_ENHANCED, ex["id"]):
+            rewriting_tokens = (
+                estimate_tokens(build_rewriting_prompt(ex["question"], ex["db_content"])) + 2000
+                + estimate_tokens(ex["question"] + ex["db_schema"]) + 2000
+            )
+            jobs.append(Job(
+                name=f"rw_enhanced/{ex['id']}",
+                run=lambda ex=ex: generate_sql_with_rewriting_async(
+                    question=ex["question"],
+                    db_schema=ex["db_schema"],
+                    db_content=ex["db_content"],
+                    use_cache=use_cache,
+                    rewrite_mode=rewrite_mode
+                ),
+                requests=2,
+                tokens=rewriting_tokens,
+            ))
+            targets.append((RW_ENHANCED, ex, _rewriting_record))
+    
+    async def on_done(index, outcome):
+        baseline, ex, make_record = targets[index]
+        if isinstance(outcome, BaseException):
+            logger.error(f"Erro: {outcome}")
+            record = make_record(ex, error=outcome)
+        else:
+            record = make_record(ex, outcome)
+        # O append faz fsync: numa thread, para não parar os outros jobs no event loop
+        await anyio.to_thread.run_sync(checkpoint.append, baseline, record)
+    
+    await run_jobs(jobs, max_in_flight=concurrency, rpm=rpm, tpm=tpm, on_done=on_done)
+
+def run_experiment(num_examples=10, concurrency=None, rpm=None, tpm=None, use_cache=True, prep_workers=None,
+                   isolate_eval=False, use_gold_cache=True, ex_compare="exact", ex_ordered=False,
+                   eval_workers=None, content_mode="rows", content_budget=None, checkpoint_path=None,
+                   resume=False, rewrite_mode=REWRITE_ALWAYS, max_content_chars=None):
+    """
+    Executa experimento completo conforme metodologia DART-SQL
+    
+    Args:
+        num_examples: Número de exemplos do split dev
+        concurrency: Máximo de chamadas simultâneas ao LLM; None executa
+            sequencialmente (um exemplo por vez)
+        rpm: Orçamento de requisições por minuto (modo concorrente)
+        tpm: Orçamento de tokens por minuto (modo concorrente)
+        use_cache: True reaproveita respostas do cache do LLM (replay);
+            False força novas amostras
+        prep_workers: Processos usados para preparar as databases dos exemplos
+        isolate_eval: Executa as queries da avaliação (EX) num processo que
+            pode ser morto se travar
+        use_gold_cache: Reaproveita os resultados das queries gold de
+            execuções anteriores (só as predições são executadas)
+        ex_compare: Modo de comparação do EX ("exact" ou "hash")
+        ex_ordered: Com "hash", compara na ordem quando o gold tem ORDER BY
+        eval_workers: Processos para calcular o EX (agrupado por banco)
+        content_mode: Conteúdo do banco no prompt de rewriting: "rows" (K=5
+            registros por tabela) ou "values" (índice de valores por questão)
+        content_budget: Bytes do conteúdo por questão no modo "values"
+        checkpoint_path: Checkpoint JSONL onde cada resultado é anexado
+            (padrão: results/experiment_dart_sql_<timestamp>.checkpoint.jsonl)
+        resume: Retoma `checkpoint_path` (ou o checkpoint mais recente),
+            pulando os exemplos já concluídos
+        rewrite_mode: Modo do Baseline 2 ("always", "speculative" ou "gate",
+            ver `generate_sql_with_rewriting`)
+        max_content_chars: Limite de caracteres do conteúdo ("rows") de cada
+            database mantido em memória; o texto é cortado, então também muda
+            o prompt de rewriting
+    """
+    
+    logger.info("="*80)
+    logger.info("EXPERIMENTO DART-SQL: Question Rewriting vs Zero-Shot")
+    logger.info("="*80)
+    logger.info(f"Modelo: {get_model()}")
+    logger.info(f"Dataset: Spider-Realistic")
+    logger.info(f"Exemplos: {num_examples}")
+    logger.info("="*80)
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if resume:
+        checkpoint_path = checkpoint_path or latest_checkpoint()
+        if checkpoint_path is None or not os.path.exists(checkpoint_path):
+            raise FileNotFoundError(f"Checkpoint para retomar não encontrado: {checkpoint_path}")
+    config = {
+        "timestamp": timestamp,
+        "backend": settings.LLM_BACKEND,
+        "model": get_model(),
+        "dataset": "spider-realistic",
+        "split": "dev",
+        "num_examples": num_examples,
+        "methodology": "DART-SQL Question Rewriting",
+        "content_mode": content_mode,
+        "content_budget": content_budget,
+        "max_content_chars": max_content_chars,
+        "rewrite_mode": rewrite_mode,
+        **_schema_linking_config(),
+    }
+    checkpoint = ExperimentCheckpoint(checkpoint_path or checkpoint_path_for(timestamp), config=config)
+    mismatches = checkpoint.mismatches(config)
+    if mismatches:
+        checkpoint.close()
+        details = ", ".join(f"{key}={saved!r} (atual: {current!r})" for key, (saved, current) in mismatches.items())
+        raise ValueError(f"Checkpoint {checkpoint.path} foi gerado com outra configuração: {details}. "
+                         f"Rode com as mesmas opções ou use um novo --checkpoint")
+    # Ao retomar, o JSON final mantém o timestamp da execução original
+    timestamp = checkpoint.config.get("timestamp", timestamp)
+    logger.info(f"Checkpoint: {checkpoint.path}")
+    
+    # 1. Carregar dados
+    logger.info("\n[1/4] Carregando dataset Spider-Realistic...")
+    df = load_spider_dataset("dev", columns=EXAMPLE_COLUMNS)
+    examples = prepare_examples(df, limit=num_examples, workers=prep_workers,
+                                content_mode=content_mode, content_budget=content_budget,
+                                max_content_chars=max_content_chars)
+    logger.info(f"Carregados {len(examples)} exemplos com schema e conteúdo")
+    if content_mode == "values":
+        log_value_index_stats()
+    
+    # 2-3. Baselines (só os pares ainda não concluídos no checkpoint)
+    try:
+        if concurrency:
+            asyncio.run(
+                _run_baselines_concurrently(examples, checkpoint, concurrency, rpm=rpm, tpm=tpm,
+                                            use_cache=use_cache, rewrite_mode=rewrite_mode)
+            )
+        else:
+            _run_baselines_sequentially(examples, checkpoint, use_cache=use_cache, rewrite_mode=rewrite_mode)
+    except KeyboardInterrupt:
+        logger.warning(f"Interrompido; {checkpoint.completed_count()} resultados salvos. "
+                       f"Retome com --resume {checkpoint.path}")
+        raise
+    finally:
+        checkpoint.close()
+    
+    example_ids = [ex["id"] for ex in examples]
+    zero_shot_results = checkpoint.records(ZERO_SHOT, example_ids)
+    rewriting_results = checkpoint.records(RW_ENHANCED, example_ids)
+    speculated = [r["speculation"] for r in rewriting_results if "speculation" in r]
+    if speculated:
+        hits = sum(1 for spec in speculated if spec["hit"])
+        logger.info(f"Especulação: {hits}/{len(speculated)} reescritas dispensaram a segunda chamada "
+                    f"({hits / len(speculated):.2%})")
+    gate_summary = _summarize_gate(rewriting_results)
+    
+    cache = get_llm_cache()
+    if cache is not None:
+        stats = cache.stats()
+        logger.info(f"Cache do LLM: {stats['hits']} hits / {stats['misses']} misses "
+                    f"({stats['hit_ratio']:.2%}), {stats['entries']} entradas")
     
     # 4. Comparar resultados
     logger.info("\n[4/4] Comparando resultados...")
-    comparison = compare_methods(rewriting_results, zero_shot_results)
+    comparison = compare_methods(rewriting_results, zero_shot_results, isolate=isolate_eval,
+                                 use_gold_cache=use_gold_cache, compare=ex_compare,
+                                 order_sensitive=ex_ordered, workers=eval_workers)
+    if use_gold_cache:
+        gold_cache = get_gold_cache()
+        logger.info(f"Cache gold: {gold_cache.hits} hits / {gold_cache.misses} misses")
     
     # 5. Exibir resumo
     logger.info("\n" + "="*80)
@@ -133,18 +381,24 @@ def run_experiment(num_examples=10):
     
     # 6. Salvar resultados
     os.makedirs("results", exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filepath = f"results/experiment_dart_sql_{timestamp}.json"
     
     with open(filepath, "w", encoding="utf-8") as f:
         json.dump({
             "experiment_config": {
                 "timestamp": timestamp,
-                "model": "gpt-5-nano",
+                "model": get_model(),
                 "dataset": "spider-realistic",
                 "num_examples": num_examples,
-                "methodology": "DART-SQL Question Rewriting"
+                "content_mode": content_mode,
+                "content_budget": content_budget,
+                "max_content_chars": max_content_chars,
+                "rewrite_mode": rewrite_mode,
+                **_schema_linking_config(),
+                "methodology": "DART-SQL Question Rewriting",
+                "checkpoint": checkpoint.path
             },
+            **({"rewrite_gate": gate_summary} if gate_summary else {}),
             "baseline_1_zero_shot_results": zero_shot_results,
             "baseline_2_rw_enhanced_results": rewriting_results,
             "comparison": comparison
@@ -154,11 +408,63 @@ def run_experiment(num_examples=10):
     return comparison
 
 if __name__ == "__main__":
-    # Configurar número de exemplos para teste
-    NUM_EXAMPLES = 10  # Comece com 10 para validar, depois aumente para 50-100
+    parser = argparse.ArgumentParser(description="Experimento DART-SQL")
+    # Comece com 10 para validar, depois aumente para 50-100
+    parser.add_argument("--num-examples", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Máximo de chamadas simultâneas (padrão: sequencial)")
+    parser.add_argument("--rpm", type=int, default=None, help="Requisições por minuto")
+    parser.add_argument("--tpm", type=int, default=None, help="Tokens por minuto")
+    parser.add_argument("--prep-workers", type=int, default=None,
+                        help="Processos para preparar schema/conteúdo das databases")
+    parser.add_argument("--isolate-eval", action="store_true",
+                        help="Executa as queries da avaliação EX num processo isolado")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignora o cache de respostas do LLM (novas amostras)")
+    parser.add_argument("--no-gold-cache", action="store_true",
+                        help="Reexecuta as queries gold em vez de usar o cache de resultados")
+    parser.add_argument("--ex-compare", choices=["exact", "hash"], default="exact",
+                        help="Comparação do EX: listas ordenadas ou impressão digital em streaming")
+    parser.add_argument("--ex-ordered", action="store_true",
+                        help="Com --ex-compare hash, respeita a ordem quando o gold tem ORDER BY")
+    parser.add_argument("--eval-workers", type=int, default=None,
+                        help="Processos para calcular o EX em paralelo (agrupado por banco)")
+    parser.add_argument("--content", choices=["rows", "values"], default="rows",
+                        help="Conteúdo do banco: K=5 registros por tabela ou valores relevantes à questão")
+    parser.add_argument("--content-budget", type=int, default=None,
+                        help="Bytes do conteúdo por questão com --content values")
+    parser.add_argument("--max-content-chars", type=int, default=None,
+                        help="Limita o conteúdo (K=5 registros) mantido por database; "
+                             "corta o texto, então muda o prompt de rewriting")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Checkpoint JSONL dos resultados (padrão: results/<experimento>.checkpoint.jsonl)")
+    parser.add_argument("--resume", nargs="?", const="", default=None, metavar="CHECKPOINT",
+                        help="Retoma um checkpoint (padrão: o mais recente), pulando exemplos concluídos")
+    parser.add_argument("--rewrite-mode", choices=["always", "speculative", "gate"], default="always",
+                        help="Baseline 2: sempre reescrever, gerar da original em paralelo com a "
+                             "reescrita, ou pular a reescrita quando a questão já cobre o schema")
+    args = parser.parse_args()
     
     try:
-        results = run_experiment(num_examples=NUM_EXAMPLES)
+        results = run_experiment(
+            num_examples=args.num_examples,
+            concurrency=args.concurrency,
+            rpm=args.rpm,
+            tpm=args.tpm,
+            use_cache=not args.no_cache,
+            prep_workers=args.prep_workers,
+            isolate_eval=args.isolate_eval,
+            use_gold_cache=not args.no_gold_cache,
+            ex_compare=args.ex_compare,
+            ex_ordered=args.ex_ordered,
+            eval_workers=args.eval_workers,
+            content_mode=args.content,
+            content_budget=args.content_budget,
+            checkpoint_path=args.resume or args.checkpoint,
+            resume=args.resume is not None,
+            rewrite_mode=args.rewrite_mode,
+            max_content_chars=args.max_content_chars
+        )
         logger.info("\n✓ Experimento concluído com sucesso!")
     except Exception as e:
         logger.error(f"\n✗ Erro ao executar experimento: {e}")
@@ -1,18 +1,56 @@
 """Zero-Shot Baseline (Linha de Base 1)
 
 Gera SQL diretamente da questão original + schema, sem rewriting.
-Usa GPT-5 nano.
+Usa o modelo configurado em Settings.LLM_MODEL.
 """
 from loguru import logger
-from openai import OpenAI
-from core.config import settings
+import anyio
+from core.llm import Completion, acreate_completion, create_completion
+from core.schema_linking import SchemaLinkingResult, link_schema
+from core.telemetry import stage_timer
 
-client = OpenAI(api_key=settings.PROJETO_TAES_OPENAI_API_KEY)
+# Prompt Zero-Shot padrão (similar ao usado em DART-SQL)
+ZERO_SHOT_SYSTEM_PROMPT = """You are a SQL expert. Generate a SQL query based on the question and database schema provided.
 
-# Modelo usado no experimento
-MODEL = "gpt-5-nano"
+Rules:
+- Return ONLY the SQL query, no explanations
+- Use proper SQL syntax
+- Follow the schema exactly as provided"""
+
+def build_zero_shot_messages(question: str, db_schema: str) -> list[dict]:
+    """Monta as mensagens (system + user) do prompt zero-shot."""
+    user_prompt = f"""### Database Schema:
+{db_schema}
+
+### Question:
+{question}
 
-def generate_sql_zero_shot(question: str, db_schema: str) -> dict:
+### SQL Query:"""
+
+    return [
+        {"role": "system", "content": ZERO_SHOT_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def _build_zero_shot_result(completion: Completion, question: str, linking: SchemaLinkingResult) -> dict:
+    """Extrai o SQL da resposta (removendo markdown) e monta o resultado."""
+    sql = completion.content.strip()
+    
+    # Remove markdown se presente
+    if sql.startswith("```"):
+        lines = sql.split("\n")
+        sql = "\n".join(lines[1:-1]) if len(lines) > 2 else sql
+        sql = sql.replace("```sql", "").replace("```", "").strip()
+    
+    logger.info(f"SQL gerado: {sql[:100]}...")
+    
+    return {
+        "original_question": question,
+        "generated_sql": sql,
+        "schema_linking": linking.stats()
+    }
+
+def generate_sql_zero_shot(question: str, db_schema: str, use_cache: bool = True) -> dict:
     """
     Baseline Zero-Shot: Gera SQL da questão original + schema.
     
@@ -24,53 +62,47 @@ def generate_sql_zero_shot(question: str, db_schema: str) -> dict:
     Args:
         question: Questão original do usuário
         db_schema: Schema do banco (CREATE TABLE statements)
+        use_cache: False ignora o cache de respostas (nova amostra)
     
     Returns:
         Dict com questão original e SQL gerado
     """
     logger.info(f"Zero-Shot para: {question}")
     
-    # Prompt Zero-Shot padrão (similar ao usado em DART-SQL)
-    system_prompt = """You are a SQL expert. Generate a SQL query based on the question and database schema provided.
+    # Mesma poda de schema do RW-Enhanced, para a comparação ser justa
+    linking = link_schema(question, db_schema)
 
-Rules:
-- Return ONLY the SQL query, no explanations
-- Use proper SQL syntax
-- Follow the schema exactly as provided"""
-
-    user_prompt = f"""### Database Schema:
-{db_schema}
-
-### Question:
-{question}
+    try:
+        with stage_timer("generation"):
+            completion = create_completion(
+                messages=build_zero_shot_messages(question, linking.schema),
+                max_completion_tokens=500,
+                use_cache=use_cache,
+                stage="generation"
+            )
+        with stage_timer("postprocess"):
+            return _build_zero_shot_result(completion, question, linking)
+        
+    except Exception as e:
+        logger.error(f"Erro ao gerar SQL zero-shot: {e}")
+        raise
 
-### SQL Query:"""
+async def generate_sql_zero_shot_async(question: str, db_schema: str, use_cache: bool = True) -> dict:
+    """Versão assíncrona de `generate_sql_zero_shot` (usa `AsyncOpenAI`)."""
+    logger.info(f"Zero-Shot para: {question}")
+    linking = await anyio.to_thread.run_sync(link_schema, question, db_schema)
 
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_completion_tokens=500
-        )
-        
-        sql = response.choices[0].message.content.strip()
-        
-        # Remove markdown se presente
-        if sql.startswith("```"):
-            lines = sql.split("\n")
-            sql = "\n".join(lines[1:-1]) if len(lines) > 2 else sql
-            sql = sql.replace("```sql", "").replace("```", "").strip()
-        
-        logger.info(f"SQL gerado: {sql[:100]}...")
-        
-        return {
-            "original_question": question,
-            "generated_sql": sql
-        }
+        with stage_timer("generation"):
+            completion = await acreate_completion(
+                messages=build_zero_shot_messages(question, linking.schema),
+                max_completion_tokens=500,
+                use_cache=use_cache,
+                stage="generation"
+            )
+        with stage_timer("postprocess"):
+            return _build_zero_shot_result(completion, question, linking)
         
     except Exception as e:
         logger.error(f"Erro ao gerar SQL zero-shot: {e}")
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,59 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+from data import spider_loader
+
+
+def _write_db(path: str, names):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE singer (name TEXT)")
+    conn.executemany("INSERT INTO singer VALUES (?)", [(name,) for name in names])
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def spider_dir(tmp_path, monkeypatch):
+    tables_json = tmp_path / "tables.json"
+    tables_json.write_text(json.dumps([{
+        "db_id": "concert",
+        "table_names_original": ["singer"],
+        "column_names_original": [[-1, "*"], [0, "name"]],
+        "column_types": ["text", "text"],
+        "primary_keys": [],
+        "foreign_keys": [],
+    }]))
+    database_dir = tmp_path / "database"
+    (database_dir / "concert").mkdir(parents=True)
+    _write_db(str(database_dir / "concert" / "concert.sqlite"), ["Joe"])
+
+    monkeypatch.setattr(spider_loader, "TABLES_JSON", str(tables_json))
+    monkeypatch.setattr(spider_loader, "DATABASE_DIR", str(database_dir))
+    monkeypatch.setattr(spider_loader, "_TABLES_CACHE", None)
+    monkeypatch.setattr(spider_loader, "_TABLES_INDEX", None)
+    monkeypatch.setattr(spider_loader, "_ARTIFACTS_CACHE", {})
+    return tmp_path
+
+
+def test_changed_database_file_is_extracted_again(spider_dir):
+    path = str(spider_dir / "artifacts.json")
+    spider_loader.build_artifact_store(k=5, output_path=path)
+    assert "Joe" in spider_loader.load_artifact_store(k=5, path=path)["concert"]["content"]
+
+    db_path = str(spider_dir / "database" / "concert" / "concert.sqlite")
+    _write_db(db_path, ["Ann", "Bob"])
+    os.utime(db_path, ns=(0, 1_000_000_000))
+
+    content = spider_loader.load_artifact_store(k=5, path=path)["concert"]["content"]
+    assert "Ann" in content and "Joe" not in content
+
+    # The refreshed entry was written back for the next process
+    spider_loader._ARTIFACTS_CACHE.clear()
+    with open(path, encoding="utf-8") as f:
+        stored = json.load(f)["databases"]["concert"]
+    assert stored["db_file"] == spider_loader._database_file_state("concert")
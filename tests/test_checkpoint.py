@@ -0,0 +1,37 @@
+from experiments.checkpoint import RW_ENHANCED, ExperimentCheckpoint
+
+CONFIG = {"model": "m", "split": "dev", "num_examples": 10, "content_mode": "rows", "rewrite_mode": "always"}
+
+
+def test_resume_with_same_config_keeps_records(tmp_path):
+    path = str(tmp_path / "run.checkpoint.jsonl")
+    checkpoint = ExperimentCheckpoint(path, config=CONFIG)
+    checkpoint.append(RW_ENHANCED, {"example_id": 1, "generated_sql": "SELECT 1"})
+    checkpoint.close()
+
+    resumed = ExperimentCheckpoint(path, config=CONFIG)
+    assert resumed.mismatches(CONFIG) == {}
+    assert resumed.is_done(RW_ENHANCED, 1)
+    resumed.close()
+
+
+def test_resume_with_other_settings_reports_mismatches(tmp_path):
+    path = str(tmp_path / "run.checkpoint.jsonl")
+    ExperimentCheckpoint(path, config=CONFIG).close()
+
+    current = dict(CONFIG, rewrite_mode="gate", num_examples=20, timestamp="later")
+    resumed = ExperimentCheckpoint(path, config=current)
+    # The checkpoint keeps its original config line; the timestamp is not a setting
+    assert resumed.mismatches(current) == {"rewrite_mode": ("always", "gate"), "num_examples": (10, 20)}
+    resumed.close()
+
+
+def test_schema_linking_settings_are_resume_keys(tmp_path):
+    path = str(tmp_path / "run.checkpoint.jsonl")
+    saved = dict(CONFIG, schema_linking_enabled=True, schema_linking_min_tables=20)
+    ExperimentCheckpoint(path, config=saved).close()
+
+    current = dict(saved, schema_linking_enabled=False)
+    resumed = ExperimentCheckpoint(path, config=current)
+    assert resumed.mismatches(current) == {"schema_linking_enabled": (True, False)}
+    resumed.close()
@@ -0,0 +1,53 @@
+import json
+import os
+
+import pytest
+
+from data import dataset_cache
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    source = tmp_path / "dev.json"
+    source.write_text(json.dumps([
+        {"question": "How many singers?", "query": "SELECT count(*) FROM singer", "db_id": "concert_singer"},
+        {"question": "List the stadiums", "query": "SELECT name FROM stadium", "db_id": "concert_singer"},
+    ]))
+    directory = str(tmp_path / "cache")
+    dataset_cache.materialize_split("dev", source=str(source), cache_dir=directory)
+    dataset_cache._VERIFIED.clear()
+    return directory
+
+
+def _count_hashes(monkeypatch) -> list:
+    calls = []
+    original = dataset_cache._sha256
+
+    def counting(path):
+        calls.append(path)
+        return original(path)
+
+    monkeypatch.setattr(dataset_cache, "_sha256", counting)
+    return calls
+
+
+def test_load_does_not_hash_an_unchanged_file(cache_dir, monkeypatch):
+    hashes = _count_hashes(monkeypatch)
+    df = dataset_cache.load_split("dev", columns=["question", "db_id"], cache_dir=cache_dir)
+    assert df["db_id"].tolist() == ["concert_singer", "concert_singer"]
+    assert hashes == []
+
+    dataset_cache.load_split("dev", cache_dir=cache_dir, verify=True)
+    assert len(hashes) == 1
+
+
+def test_touched_file_is_hashed_once_and_recorded(cache_dir, monkeypatch):
+    hashes = _count_hashes(monkeypatch)
+    path = os.path.join(cache_dir, "spider-realistic-dev.arrow")
+    os.utime(path, ns=(0, 1_000_000_000))
+
+    dataset_cache.load_split("dev", cache_dir=cache_dir)
+    assert len(hashes) == 1
+    dataset_cache._VERIFIED.clear()  # a new process
+    dataset_cache.load_split("dev", cache_dir=cache_dir)
+    assert len(hashes) == 1
@@ -0,0 +1,42 @@
+import sqlite3
+
+import pytest
+
+from evaluation import execution_accuracy as ea
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "concert.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE singer (id INTEGER, age INTEGER)")
+    conn.executemany("INSERT INTO singer VALUES (?, ?)", [(i, 20 + i % 30) for i in range(3000)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def no_rerun(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("the queries were executed again")
+    monkeypatch.setattr(ea, "run_query", fail)
+
+
+def test_match_is_verified_without_running_the_queries_again(db_path, no_rerun):
+    outcome = ea.compare_queries_streaming(db_path, "SELECT id, age FROM singer",
+                                           "SELECT id, age FROM singer ORDER BY age DESC")
+    assert outcome == {"score": 1, "pred_status": ea.OK, "gold_status": ea.OK}
+
+
+def test_buffered_rows_catch_a_fingerprint_collision(db_path, no_rerun):
+    # hash(-1) == hash(-2) in CPython: the in-process fingerprints collide
+    assert ea.compare_queries_streaming(db_path, "SELECT -1", "SELECT -2")["score"] == 0
+    assert ea.compare_queries_streaming(db_path, "SELECT -1", "SELECT -2", verify=False)["score"] == 1
+
+
+def test_results_above_the_buffer_cap_rely_on_the_fingerprint(db_path, no_rerun, monkeypatch):
+    monkeypatch.setattr(ea, "VERIFY_MAX_ROWS", 100)
+    outcome = ea.compare_queries_streaming(db_path, "SELECT age FROM singer", "SELECT age FROM singer ORDER BY id DESC")
+    assert outcome["score"] == 1
+    assert ea.compare_queries_streaming(db_path, "SELECT age FROM singer", "SELECT age + 1 FROM singer")["score"] == 0
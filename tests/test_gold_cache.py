@@ -0,0 +1,41 @@
+import threading
+
+from evaluation.execution_accuracy import ERROR, OK, TIMEOUT, ExecutionResult
+from evaluation.gold_cache import GoldResultCache
+
+
+def test_only_ok_results_are_cached(tmp_path):
+    cache = GoldResultCache(str(tmp_path / "gold.sqlite"))
+    cache.set("ok", ExecutionResult(OK, rows=[(1,)]))
+    cache.set("locked", ExecutionResult(ERROR, error="database is locked"))
+    cache.set("slow", ExecutionResult(TIMEOUT, error="exceeded 30s"))
+
+    assert cache.get("ok")[0] == OK
+    assert cache.get("locked") is None
+    assert cache.get("slow") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_errors_stored_by_older_versions_are_ignored(tmp_path):
+    cache = GoldResultCache(str(tmp_path / "gold.sqlite"))
+    conn = cache._connection()
+    conn.execute("INSERT INTO gold_results (key, status, fingerprint) VALUES ('old', ?, NULL)", (ERROR,))
+    conn.commit()
+    assert cache.get("old") is None
+
+
+def test_counters_are_exact_under_concurrent_lookups(tmp_path):
+    cache = GoldResultCache(str(tmp_path / "gold.sqlite"))
+    cache.set("ok", ExecutionResult(OK, rows=[(1,)]))
+
+    def lookups():
+        for _ in range(200):
+            cache.get("ok")
+            cache.get("missing")
+
+    threads = [threading.Thread(target=lookups) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (cache.hits, cache.misses) == (1600, 1600)
@@ -0,0 +1,55 @@
+from core.llm_cache import LLMCache
+
+
+def _cache(tmp_path, **kwargs) -> LLMCache:
+    return LLMCache(str(tmp_path / "llm.sqlite"), **kwargs)
+
+
+def _last_access(cache: LLMCache, key: str) -> float:
+    return cache._connection().execute("SELECT last_access FROM completions WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_recent_hits_do_not_write(tmp_path):
+    cache = _cache(tmp_path, touch_interval_seconds=60)
+    cache.set("k", {"content": "SELECT 1"})
+    written = _last_access(cache, "k")
+    conn = cache._connection()
+    changes = conn.total_changes
+
+    assert cache.get("k") == {"content": "SELECT 1"}
+    assert conn.total_changes == changes
+    assert _last_access(cache, "k") == written
+
+
+def test_stale_hits_refresh_last_access(tmp_path):
+    cache = _cache(tmp_path, touch_interval_seconds=0)
+    cache.set("k", {"content": "SELECT 1"})
+    written = _last_access(cache, "k")
+    cache.get("k")
+    assert _last_access(cache, "k") > written
+
+
+def test_eviction_keeps_the_bound_and_the_recent_entries(tmp_path):
+    cache = _cache(tmp_path, max_entries=10, touch_interval_seconds=0)
+    for i in range(25):
+        cache.set(f"k{i}", {"content": str(i)})
+        cache.set(f"k{i}", {"content": str(i)})  # replacing does not grow the count
+    assert cache.stats()["entries"] <= 10
+    assert cache.get("k24") == {"content": "24"}
+    assert cache.get("k0") is None
+
+
+def test_running_count_resyncs_with_other_writers(tmp_path):
+    first = _cache(tmp_path, max_entries=10)
+    second = _cache(tmp_path, max_entries=10)
+    for i in range(8):
+        first.set(f"first{i}", {"content": str(i)})
+    for i in range(5):
+        second.set(f"second{i}", {"content": str(i)})
+    # second only counts its own inserts: the shared table briefly exceeds the bound
+    assert second.stats()["entries"] == 13
+
+    for i in range(5, 11):
+        second.set(f"second{i}", {"content": str(i)})
+    # Its count crossed the bound, so it re-counted the table and evicted
+    assert second.stats()["entries"] <= 10
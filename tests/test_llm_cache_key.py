@@ -0,0 +1,17 @@
+from core import llm
+from core.config import settings
+
+MESSAGES = [{"role": "user", "content": "How many singers are there?"}]
+
+
+def test_cache_key_depends_on_backend_endpoint(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BACKEND", "openai")
+    monkeypatch.setattr(settings, "LLM_BASE_URL", None)
+    openai_key = llm._cache_key("gpt-5-nano", MESSAGES, 2000)
+
+    monkeypatch.setattr(settings, "LLM_BASE_URL", llm.LOCAL_BACKEND_URL)
+    assert llm._cache_key("gpt-5-nano", MESSAGES, 2000) != openai_key
+
+    monkeypatch.setattr(settings, "LLM_BACKEND", "local")
+    monkeypatch.setattr(settings, "LLM_BASE_URL", None)
+    assert llm._cache_key("gpt-5-nano", MESSAGES, 2000) != openai_key
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+from openai import APIConnectionError, RateLimitError
+
+from core import telemetry
+from core.llm_gateway import CircuitBreaker, CircuitOpenError, LatencyTracker, LLMDeadlineExceeded, LLMGateway, retry_after
+
+
+def _gateway(breaker: CircuitBreaker, **kwargs) -> LLMGateway:
+    options = dict(
+        deadline_seconds=5, attempt_timeout_seconds=2, max_retries=0, base_delay=0.01, max_delay=0.01,
+        breaker=breaker, tracker=LatencyTracker(10), hedge_enabled=False,
+    )
+    return LLMGateway(**{**options, **kwargs})
+
+
+def _rate_limited(headers: dict) -> RateLimitError:
+    request = httpx.Request("POST", "http://llm.test")
+    return RateLimitError("rate limited", response=httpx.Response(429, headers=headers, request=request), body=None)
+
+
+async def _fail(timeout):
+    raise APIConnectionError(request=httpx.Request("POST", "http://llm.test"))
+
+
+async def _hang(timeout):
+    await asyncio.sleep(10)
+
+
+async def _ok(timeout):
+    return "ok"
+
+
+def test_cancelled_probe_is_released():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    gateway = _gateway(breaker)
+
+    async def scenario():
+        with pytest.raises(APIConnectionError):
+            await gateway.acall(_fail)
+        assert breaker.state == "open"
+        await asyncio.sleep(0.06)
+
+        # The half-open probe is cancelled mid-flight (e.g. a discarded speculation)
+        probe = asyncio.create_task(gateway.acall(_hang))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        # The next call gets the probe instead of failing fast forever
+        assert await gateway.acall(_ok) == "ok"
+        assert breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_open_circuit_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+    gateway = _gateway(breaker)
+
+    async def scenario():
+        with pytest.raises(APIConnectionError):
+            await gateway.acall(_fail)
+        with pytest.raises(CircuitOpenError):
+            await gateway.acall(_ok)
+
+    asyncio.run(scenario())
+
+
+def test_sync_probe_released_on_interrupt():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    gateway = _gateway(breaker)
+
+    def fail(timeout):
+        raise APIConnectionError(request=httpx.Request("POST", "http://llm.test"))
+
+    def interrupted(timeout):
+        raise KeyboardInterrupt
+
+    with pytest.raises(APIConnectionError):
+        gateway.call(fail)
+    time.sleep(0.06)
+    with pytest.raises(KeyboardInterrupt):
+        gateway.call(interrupted)
+    assert gateway.call(lambda timeout: "ok") == "ok"
+    assert breaker.state == "closed"
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after": "2"}, 2.0),
+    ({"retry-after-ms": "250"}, 0.25),
+    ({}, None),
+    ({"retry-after": "soon"}, None),
+])
+def test_retry_after_header(headers, expected):
+    assert retry_after(_rate_limited(headers)) == expected
+
+
+def test_rate_limits_wait_for_retry_after_on_their_own_budget():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+    # No retries for errors, but 429s keep being retried
+    gateway = _gateway(breaker, rate_limit_max_retries=2, rate_limit_max_delay=0.01)
+    calls = []
+
+    def throttled(timeout):
+        calls.append(time.monotonic())
+        if len(calls) < 3:
+            raise _rate_limited({"retry-after": "0.1"})
+        return "ok"
+
+    assert gateway.call(throttled) == "ok"
+    assert calls[1] - calls[0] >= 0.1 and calls[2] - calls[1] >= 0.1
+    assert breaker.state == "closed"
+
+
+def test_retry_after_beyond_the_deadline_fails_fast():
+    gateway = _gateway(CircuitBreaker(failure_threshold=1, reset_seconds=60), rate_limit_max_retries=5)
+
+    def throttled(timeout):
+        raise _rate_limited({"retry-after": "60"})
+
+    started = time.monotonic()
+    with pytest.raises(LLMDeadlineExceeded):
+        gateway.call(throttled)
+    assert time.monotonic() - started < 1
+
+
+def _hedging_gateway(max_threads: int) -> LLMGateway:
+    tracker = LatencyTracker(10)
+    tracker.observe(("hedged", "complete"), unhedged=0.01)
+    return _gateway(CircuitBreaker(failure_threshold=5, reset_seconds=60), tracker=tracker,
+                    hedge_enabled=True, hedge_min_samples=1, hedge_max_threads=max_threads)
+
+
+def test_sync_hedge_uses_the_bounded_pool_and_counts_orphans():
+    gateway = _hedging_gateway(max_threads=2)
+    release = threading.Event()
+    calls = []
+
+    def request(timeout):
+        calls.append(timeout)
+        if len(calls) == 1:
+            release.wait(5)  # the primary hangs
+            return "primary"
+        return "hedge"
+
+    orphans = telemetry.llm_orphaned_requests.value(stage="hedged")
+    assert gateway.call(request, stage="hedged") == "hedge"
+    assert telemetry.llm_orphaned_requests.value(stage="hedged") == orphans + 1
+
+    # The orphaned primary still holds its thread: no room for another hedged pair
+    assert gateway._pool_busy == 1
+    assert not gateway._reserve_threads(2)
+    release.set()
+    deadline = time.monotonic() + 1
+    while gateway._pool_busy and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert gateway._pool_busy == 0
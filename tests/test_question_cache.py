@@ -0,0 +1,89 @@
+import pytest
+
+from core.question_cache import QuestionCache, _shingles, normalize_question
+
+SCOPE = "schema"
+RESULT = {"rewritten_question": "r", "generated_sql": "SELECT 1", "schema_linking": {}}
+
+
+def _cache(question: str) -> QuestionCache:
+    cache = QuestionCache(max_entries=100, threshold=0.9)
+    cache.put(SCOPE, question, RESULT)
+    return cache
+
+
+# Long enough that swapping one word keeps the trigram similarity above the threshold
+TEMPLATE = (
+    "For every airport located in the city of Aberdeen and the surrounding region of Scotland, "
+    "listing airline names and flight numbers, what is the {} number of departing flights?"
+)
+
+
+def _similarity(a: str, b: str) -> float:
+    a, b = _shingles(normalize_question(a)), _shingles(normalize_question(b))
+    return len(a & b) / len(a | b)
+
+
+@pytest.mark.parametrize("cached_word, incoming_word", [
+    ("maximum", "minimum"),
+    ("most", "least"),
+    ("highest", "lowest"),
+    ("before", "after"),
+    ("asc", "desc"),
+    ("increasing", "decreasing"),
+    ("count", "sum"),
+    ("sum", "avg"),
+    ("oldest", "youngest"),
+    ("máximo", "mínimo"),
+])
+def test_near_miss_pairs_are_not_served(cached_word, incoming_word):
+    cached, incoming = TEMPLATE.format(cached_word), TEMPLATE.format(incoming_word)
+    assert _similarity(cached, incoming) >= 0.9
+    assert _cache(cached).lookup(SCOPE, incoming) is None
+
+
+@pytest.mark.parametrize("cached, incoming", [
+    ("How many singers are older than 30?", "How many singers are older than 40?"),
+    ("Which singers did perform in a concert in 2014?", "Which singers didn't perform in a concert in 2014?"),
+])
+def test_literals_and_negations_must_match(cached, incoming):
+    assert _cache(cached).lookup(SCOPE, incoming) is None
+
+
+@pytest.mark.parametrize("incoming", [
+    "what is the maximum number of departing flights",
+    "What is the  maximum number of departing flights ?",
+    "WHAT IS THE MAXIMUM NUMBER OF DEPARTING FLIGHTS??",
+])
+def test_trivial_variations_are_served(incoming):
+    match = _cache("What is the maximum number of departing flights?").lookup(SCOPE, incoming)
+    assert match is not None
+    assert match.result["generated_sql"] == "SELECT 1"
+
+
+@pytest.mark.parametrize("cached, incoming", [
+    ("List the names of students advised by teachers", "List the names of teachers advised by students"),
+    (TEMPLATE.format("flights from Boston to Denver"), TEMPLATE.format("flights from Denver to Boston")),
+    ("Show all flights from Boston to Denver", "Show all flights from Denver to Boston"),
+])
+def test_role_reversals_are_not_served(cached, incoming):
+    assert normalize_question(cached) != normalize_question(incoming)
+    assert _cache(cached).lookup(SCOPE, incoming) is None
+
+
+def test_a_replaced_word_keeps_the_shared_words_in_order():
+    cached, incoming = TEMPLATE.format("daily"), TEMPLATE.format("weekly")
+    assert _similarity(cached, incoming) >= 0.9
+    assert _cache(cached).lookup(SCOPE, incoming) is not None
+
+
+def test_scopes_are_isolated():
+    assert _cache("How many singers are there?").lookup("other schema", "How many singers are there?") is None
+
+
+def test_lru_eviction_bounds_entries():
+    cache = QuestionCache(max_entries=2, threshold=0.9)
+    for i in range(3):
+        cache.put(SCOPE, f"List the singers of concert number {i}", RESULT)
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup(SCOPE, "List the singers of concert number 0") is None
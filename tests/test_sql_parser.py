@@ -0,0 +1,104 @@
+import pytest
+
+from evaluation.metrics import exact_match, exact_set_match
+from evaluation.sql_parser import SQLParseError, analyze_sql, parse_sql
+
+
+@pytest.mark.parametrize("predicted, gold", [
+    ("SELECT name FROM singer ORDER BY age", "SELECT name FROM singer ORDER BY age ASC"),
+    ("select name from singer order by age desc limit 3", "SELECT name FROM singer ORDER BY age DESC LIMIT 1"),
+])
+def test_order_by_same_direction_matches(predicted, gold):
+    assert exact_set_match(predicted, gold)
+
+
+@pytest.mark.parametrize("predicted, gold", [
+    ("SELECT name FROM singer ORDER BY age DESC", "SELECT name FROM singer ORDER BY age"),
+    ("SELECT name FROM singer ORDER BY age", "SELECT name FROM singer ORDER BY name"),
+    ("SELECT name FROM singer ORDER BY age DESC", "SELECT name FROM singer ORDER BY age DESC LIMIT 1"),
+])
+def test_order_by_direction_column_and_limit_matter(predicted, gold):
+    assert not exact_set_match(predicted, gold)
+
+
+@pytest.mark.parametrize("predicted, gold", [
+    ("SELECT name FROM singer WHERE age > 20 AND country = 'France'",
+     "SELECT name FROM singer WHERE country = 'France' AND age > 20"),
+    ("SELECT name FROM singer WHERE (age > 20 AND country = 'France')",
+     "SELECT name FROM singer WHERE age > 20 AND country = 'France'"),
+    ("SELECT name FROM singer WHERE age > 20 OR age < 10", "SELECT name FROM singer WHERE age < 10 OR age > 20"),
+    ("SELECT name FROM singer WHERE NOT (country LIKE '%a%')", "SELECT name FROM singer WHERE country NOT LIKE '%a%'"),
+])
+def test_conditions_are_flattened_and_unordered(predicted, gold):
+    assert exact_set_match(predicted, gold)
+
+
+@pytest.mark.parametrize("predicted, gold", [
+    ("SELECT name FROM singer WHERE age > 20 AND country = 'France'",
+     "SELECT name FROM singer WHERE age > 20 OR country = 'France'"),
+    ("SELECT name FROM singer WHERE age > 20", "SELECT name FROM singer WHERE age < 20"),
+    ("SELECT name FROM singer WHERE age > 20", "SELECT name FROM singer WHERE NOT age > 20"),
+])
+def test_connectives_operators_and_negation_matter(predicted, gold):
+    assert not exact_set_match(predicted, gold)
+
+
+def test_literal_values_and_select_order_are_ignored():
+    assert exact_set_match("SELECT name, age FROM singer WHERE age > 40", "SELECT age, name FROM singer WHERE age > 30")
+
+
+def test_nested_subqueries_are_compared_structurally():
+    gold = "SELECT name FROM singer WHERE age > (SELECT avg(age) FROM singer)"
+    assert exact_set_match("SELECT name FROM singer WHERE age > (SELECT AVG(age) FROM singer)", gold)
+    assert not exact_set_match("SELECT name FROM singer WHERE age > (SELECT max(age) FROM singer)", gold)
+    assert not exact_set_match("SELECT name FROM singer WHERE age > 30", gold)
+
+    in_gold = "SELECT name FROM stadium WHERE id NOT IN (SELECT stadium_id FROM concert WHERE year = 2014)"
+    assert exact_set_match(
+        "SELECT name FROM stadium WHERE id NOT IN (SELECT stadium_id FROM concert WHERE year = 2015)", in_gold)
+    assert not exact_set_match(
+        "SELECT name FROM stadium WHERE id IN (SELECT stadium_id FROM concert WHERE year = 2014)", in_gold)
+
+
+@pytest.mark.parametrize("predicted", [
+    "SELECT T1.name FROM singer AS T1 WHERE T1.age > 20",
+    "SELECT s.name FROM singer s WHERE s.age > 20",
+    "SELECT singer.name FROM singer WHERE singer.age > 20",
+])
+def test_table_aliases_are_resolved(predicted):
+    assert exact_set_match(predicted, "SELECT name FROM singer WHERE age > 20")
+
+
+def test_join_aliases_resolve_to_tables():
+    gold = ("SELECT T2.name, count(*) FROM concert AS T1 JOIN stadium AS T2 ON T1.stadium_id = T2.stadium_id "
+            "GROUP BY T1.stadium_id")
+    swapped = ("SELECT a.name, count(*) FROM stadium AS a JOIN concert AS b ON a.stadium_id = b.stadium_id "
+               "GROUP BY b.stadium_id")
+    assert exact_set_match(swapped, gold)
+    wrong_table = ("SELECT T1.name, count(*) FROM concert AS T1 JOIN stadium AS T2 ON T1.stadium_id = T2.stadium_id "
+                   "GROUP BY T1.stadium_id")
+    assert not exact_set_match(wrong_table, gold)
+
+
+def test_set_operations():
+    gold = "SELECT name FROM singer WHERE age > 20 UNION SELECT name FROM singer WHERE country = 'France'"
+    assert exact_set_match(
+        "SELECT name FROM singer WHERE age > 30 UNION SELECT name FROM singer WHERE country = 'Spain'", gold)
+    assert not exact_set_match(
+        "SELECT name FROM singer WHERE age > 20 INTERSECT SELECT name FROM singer WHERE country = 'France'", gold)
+    assert not exact_set_match(
+        "SELECT name FROM singer WHERE age > 20 EXCEPT SELECT name FROM singer WHERE country = 'France'", gold)
+    assert not exact_set_match("SELECT name FROM singer WHERE age > 20", gold)
+
+
+@pytest.mark.parametrize("sql", ["SELECT name FROM", "SELECT name FROM singer WHERE age >", "", "DROP TABLE singer"])
+def test_unparseable_queries_fall_back_to_no_match(sql):
+    analysis = analyze_sql(sql)
+    assert analysis.components is None
+    assert analysis.error
+    with pytest.raises(SQLParseError):
+        parse_sql(sql)
+    # An unparseable prediction never scores EM, even against itself; the string metric still works
+    assert not exact_set_match(sql, sql)
+    assert not exact_set_match(sql, "SELECT name FROM singer")
+    assert exact_match(sql, sql)
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from core import telemetry
+
+
+async def _producer(delay: float, n: int):
+    for i in range(n):
+        await asyncio.sleep(delay)
+        yield i
+
+
+def _observed(histogram, stage: str):
+    _, total, count = histogram._values[(stage,)]
+    return total, count
+
+
+def test_timed_stream_excludes_consumer_time():
+    async def scenario():
+        async for _ in telemetry.timed_stream("test_slow_consumer", _producer(0.01, 3)):
+            await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+    total, count = _observed(telemetry.stage_duration, "test_slow_consumer")
+    assert count == 1
+    assert 0.03 <= total < 0.2
+    first, _ = _observed(telemetry.stage_first_chunk, "test_slow_consumer")
+    assert 0.01 <= first < 0.05
+
+
+def test_timed_stream_counts_errors_and_early_close():
+    async def failing():
+        yield 1
+        raise RuntimeError("stream broke")
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            async for _ in telemetry.timed_stream("test_failing", failing()):
+                pass
+        stream = telemetry.timed_stream("test_closed", _producer(0, 5))
+        await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(scenario())
+    assert telemetry.stage_errors.value(stage="test_failing") == 1
+    assert _observed(telemetry.stage_duration, "test_failing")[1] == 1
+    assert _observed(telemetry.stage_duration, "test_closed")[1] == 1
+    assert telemetry.stage_errors.value(stage="test_closed") == 0